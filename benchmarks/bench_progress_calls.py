@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Micro-benchmark del volumen de llamadas al actor de estado por el progreso de ffmpeg.
+
+Simula K codificaciones concurrentes que emiten bloques de `-progress` a un
+ritmo dado y compara:
+ - antes: una llamada síncrona al actor por cada resumen nuevo (con una
+   latencia simulada por llamada, como `ray.get(actor.set_log_line.remote())`);
+ - después: un `ProgressParser` por codificación y `ProgressReporter`
+   agrupando y enviando sin esperar respuesta.
+
+Informa de las llamadas totales, llamadas por segundo y el retraso que acumula
+el lector respecto al ritmo de ffmpeg (back-pressure sobre stderr).
+
+Uso: python benchmarks/bench_progress_calls.py [--encodes 8] [--rate 10] [--seconds 5] [--latency-ms 2]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimize_video.progress import ProgressParser, ProgressReporter  # noqa: E402
+
+
+def progress_block(n: int) -> List[str]:
+    return [
+        f"frame={n * 15}", f"fps={118 + n % 5}.00", "stream_0_0_q=27.0",
+        f"bitrate={790 + n % 20}.1kbits/s", f"total_size={n * 50000}",
+        f"out_time_us={n * 500000}", f"out_time_ms={n * 500000}",
+        f"out_time=00:00:{(n // 2) % 60:02d}.500000", "dup_frames=0", "drop_frames=0",
+        f"speed={3.9 + (n % 3) / 10:.2f}x", "progress=continue",
+    ]
+
+
+def legacy_summary(state: Dict[str, str], last: List[Optional[str]], line: str) -> Optional[str]:
+    """Lógica previa de `parse_ffmpeg_progress`: un resumen nuevo por cada línea que cambia algo."""
+    if "=" in line:
+        key, value = line.split("=", 1)
+        state[key.strip()] = value.strip()
+    if all(k in state for k in ("frame", "fps", "out_time", "bitrate", "speed")):
+        resumen = " | ".join(f"{k}= {state[k]}" for k in ("frame", "fps", "out_time", "bitrate", "speed"))
+        if resumen != last[0]:
+            last[0] = resumen
+            return resumen
+    return None
+
+
+def run(mode: str, encodes: int, rate: float, seconds: float, latency: float, interval: float) -> dict:
+    calls = [0]
+    lock = threading.Lock()
+    actor = threading.Lock()  # el actor atiende las llamadas de una en una
+    lags: List[float] = []
+
+    def sync_call(_payload: object) -> None:
+        with actor:
+            time.sleep(latency)
+        with lock:
+            calls[0] += 1
+
+    def async_call(_payload: object) -> None:
+        with lock:
+            calls[0] += 1
+
+    def encode() -> None:
+        state: Dict[str, str] = {}
+        last: List[Optional[str]] = [None]
+        reporter = ProgressReporter(async_call, interval=interval) if mode == "after" else None
+        parser = ProgressParser(duration=rate * seconds / 2)  # out_time avanza 0.5 s por bloque
+        start = time.monotonic()
+        blocks = int(rate * seconds)
+        for n in range(1, blocks + 1):
+            # ffmpeg emite el bloque n en start + n/rate; si el lector va tarde, no espera
+            delay = start + n / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            for line in progress_block(n):
+                if reporter is None:
+                    resumen = legacy_summary(state, last, line)
+                    if resumen:
+                        sync_call(resumen)
+                else:
+                    record = parser.feed(line)
+                    if record is not None:
+                        reporter.update(**record.to_updates())
+        if reporter is not None:
+            reporter.close()
+        with lock:
+            lags.append(max(0.0, time.monotonic() - start - seconds))
+
+    threads = [threading.Thread(target=encode) for _ in range(encodes)]
+    began = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - began
+    return {
+        "mode": mode,
+        "calls": calls[0],
+        "calls_per_s": round(calls[0] / elapsed, 1),
+        "max_reader_lag_s": round(max(lags), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Llamadas al actor por progreso: antes vs después")
+    parser.add_argument("--encodes", type=int, default=8, help="Codificaciones concurrentes")
+    parser.add_argument("--rate", type=float, default=10, help="Bloques de -progress por segundo y codificación")
+    parser.add_argument("--seconds", type=float, default=5, help="Duración simulada")
+    parser.add_argument("--latency-ms", type=float, default=2, help="Latencia simulada de una llamada síncrona al actor")
+    parser.add_argument("--interval-ms", type=float, default=500, help="Intervalo de agrupado del reporter")
+    args = parser.parse_args()
+
+    for mode in ("before", "after"):
+        print(json.dumps(run(mode, args.encodes, args.rate, args.seconds, args.latency_ms / 1000, args.interval_ms / 1000)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Speedup de la codificación por segmentos frente al número de segmentos.
+
+Genera un vídeo sintético con GOP fijo y lo codifica con `encode_chunked`
+(por defecto con libx264 en CPU; `--encoder` elige otro del registro) para cada
+número de segmentos indicado. Informa del
+tiempo de pared, el speedup respecto a 1 segmento y la diferencia de duración
+(que debe quedar dentro de los ±2 s de la validación del pipeline).
+
+Uso: python benchmarks/bench_segments.py [--duration 120] [--segments 1 2 4 8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimize_video.__main__ import get_video_duration  # noqa: E402
+from optimize_video.encoders import BY_NAME  # noqa: E402
+from optimize_video.segments import encode_chunked  # noqa: E402
+
+
+def make_source(path: str, duration: int, size: str, rate: int, gop: int) -> None:
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-g", str(gop),
+            "-c:a", "aac", "-ac", "2",
+            path,
+        ],
+        check=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de codificación por segmentos")
+    parser.add_argument("--duration", type=int, default=120, help="Duración del vídeo sintético en segundos")
+    parser.add_argument("--size", default="1920x1080", help="Resolución del vídeo sintético")
+    parser.add_argument("--rate", type=int, default=30, help="FPS del vídeo sintético")
+    parser.add_argument("--segments", type=int, nargs="+", default=[1, 2, 4, 8], help="Números de segmentos a medir")
+    parser.add_argument("--encoder", choices=sorted(BY_NAME), default="libx264", help="Codificador de ffmpeg (por defecto: libx264)")
+    parser.add_argument("--preset", default="medium", help="Preset del codificador")
+    parser.add_argument("--threads", default="1", help="Hilos por proceso libx264 ('0' = automático); con 1 se mide el paralelismo entre segmentos")
+    args = parser.parse_args()
+
+    video_args = [*BY_NAME[args.encoder].args(quality=23, vf="scale=1280:720,fps=30", preset=args.preset), "-threads", args.threads]
+
+    with tempfile.TemporaryDirectory(prefix="bench-segments-") as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        make_source(source, args.duration, args.size, args.rate, gop=2 * args.rate)
+        src_duration = get_video_duration(source)
+
+        baseline = None
+        for count in args.segments:
+            output = os.path.join(tmp, f"out-{count}.mkv")
+            start = time.perf_counter()
+            used = encode_chunked(source, output, duration=src_duration, segments=count, video_args=video_args)
+            wall = time.perf_counter() - start
+            baseline = baseline or wall
+            print(json.dumps({
+                "segments": count,
+                "used": used,
+                "wall_s": round(wall, 3),
+                "speedup": round(baseline / wall, 2),
+                "duration_delta_s": round(abs(src_duration - get_video_duration(output)), 3),
+                "output_bytes": os.path.getsize(output),
+            }))
+            os.remove(output)
+
+
+if __name__ == "__main__":
+    main()
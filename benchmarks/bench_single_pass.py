@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Compara `--pipeline three-pass` contra `--pipeline single-pass`.
+
+Genera un vídeo sintético con `testsrc2`/`sine`, lo procesa con cada pipeline
+(sobre una copia, porque `process_video` borra el original) y mide:
+ - tiempo de pared y CPU de los procesos hijos (ffmpeg/gst-launch)
+ - bytes escritos por los hijos (`/proc/self/io`, acumula los hijos recogidos)
+ - tamaño del resultado y diferencia de duración frente al original
+
+Uso: python benchmarks/bench_single_pass.py [--duration 60] [--size 1920x1080] [--runs 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimize_video.__main__ import get_video_duration, pipelines, process_video  # noqa: E402
+
+
+def make_source(path: str, duration: int, size: str, rate: int) -> None:
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
+            "-c:a", "aac", "-ac", "2",
+            path,
+        ],
+        check=True,
+    )
+
+
+def proc_io() -> Dict[str, int]:
+    """Contadores de E/S del proceso (incluye hijos ya recogidos); vacío fuera de Linux."""
+    counters: Dict[str, int] = {}
+    try:
+        with open("/proc/self/io") as fh:
+            for line in fh:
+                key, value = line.split(":", 1)
+                counters[key.strip()] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def run_once(source: str, workdir: str, pipeline: str, backend: str) -> dict:
+    src = os.path.join(workdir, os.path.basename(source))
+    shutil.copyfile(source, src)
+    out_dir = os.path.join(workdir, "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    io_before = proc_io()
+    ru_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    process_video(src, out_dir, pipeline=pipeline, backend=backend)
+    wall = time.perf_counter() - start
+    ru_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io_after = proc_io()
+
+    optimized = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + "-optimized.mkv")
+    result = {
+        "pipeline": pipeline,
+        "wall_s": round(wall, 3),
+        "cpu_s": round((ru_after.ru_utime - ru_before.ru_utime) + (ru_after.ru_stime - ru_before.ru_stime), 3),
+        "write_bytes": io_after.get("write_bytes", 0) - io_before.get("write_bytes", 0),
+        "wchar": io_after.get("wchar", 0) - io_before.get("wchar", 0),
+        "output_bytes": os.path.getsize(optimized),
+        "duration_delta_s": round(abs(get_video_duration(source) - get_video_duration(optimized)), 3),
+    }
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark three-pass vs single-pass")
+    parser.add_argument("--duration", type=int, default=60, help="Duración del vídeo sintético en segundos")
+    parser.add_argument("--size", default="1920x1080", help="Resolución del vídeo sintético")
+    parser.add_argument("--rate", type=int, default=30, help="FPS del vídeo sintético")
+    parser.add_argument("--runs", type=int, default=3, help="Repeticiones por pipeline")
+    parser.add_argument("--backend", choices=["auto", "ffmpeg", "gstreamer"], default="auto")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-single-pass-") as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        make_source(source, args.duration, args.size, args.rate)
+
+        results = []
+        for pipeline in pipelines:
+            for _ in range(args.runs):
+                workdir = tempfile.mkdtemp(dir=tmp)
+                results.append(run_once(source, workdir, pipeline, args.backend))
+                print(json.dumps(results[-1]))
+
+    print("\nResumen (media por pipeline):")
+    for pipeline in pipelines:
+        rows = [r for r in results if r["pipeline"] == pipeline]
+        mean = lambda key: sum(r[key] for r in rows) / len(rows)  # noqa: E731
+        print(
+            f"  {pipeline:12s} wall={mean('wall_s'):8.2f}s cpu={mean('cpu_s'):8.2f}s "
+            f"escrito={mean('write_bytes') / 1024**2:9.1f} MB salida={mean('output_bytes') / 1024**2:7.1f} MB "
+            f"Δdur={mean('duration_delta_s'):.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Prueba de carga de `GET /status` con decenas de clientes concurrentes.
+
+Cada cliente mantiene una conexión keep-alive y repite la petición con el
+último ETag recibido (`If-None-Match`), como hace el navegador. Al final se
+imprimen las latencias p50/p95/p99/máx y el reparto de respuestas 200/304.
+
+Uso: python benchmarks/load_status.py [--url http://localhost:5000/status] [--clients 50] [--seconds 30]
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from typing import Dict, List
+from urllib.parse import urlparse
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def client(url: str, deadline: float, interval: float, latencies: List[float], codes: Dict[int, int], lock: threading.Lock) -> None:
+    parsed = urlparse(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10)
+    etag = None
+    local: List[float] = []
+    local_codes: Dict[int, int] = {}
+    while time.monotonic() < deadline:
+        headers = {"If-None-Match": etag} if etag else {}
+        start = time.perf_counter()
+        try:
+            conn.request("GET", parsed.path or "/status", headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10)
+            local_codes[0] = local_codes.get(0, 0) + 1
+            continue
+        local.append((time.perf_counter() - start) * 1000)
+        local_codes[response.status] = local_codes.get(response.status, 0) + 1
+        etag = response.getheader("ETag") or etag
+        if interval:
+            time.sleep(interval)
+    conn.close()
+    with lock:
+        latencies.extend(local)
+        for code, count in local_codes.items():
+            codes[code] = codes.get(code, 0) + count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Carga concurrente sobre /status")
+    parser.add_argument("--url", default="http://localhost:5000/status")
+    parser.add_argument("--clients", type=int, default=50, help="Clientes concurrentes")
+    parser.add_argument("--seconds", type=float, default=30, help="Duración de la prueba")
+    parser.add_argument("--interval", type=float, default=0.0, help="Pausa entre peticiones de un cliente (la UI usa 2 s)")
+    args = parser.parse_args()
+
+    latencies: List[float] = []
+    codes: Dict[int, int] = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    threads = [
+        threading.Thread(target=client, args=(args.url, deadline, args.interval, latencies, codes, lock))
+        for _ in range(args.clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(json.dumps({
+        "clients": args.clients,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / args.seconds, 1),
+        "codes": codes,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies, default=0.0), 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
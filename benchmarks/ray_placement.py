@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Prueba de las políticas de colocación en un cluster Ray local con recursos ficticios.
+
+Arranca varios nodos Ray en esta máquina (`ray.cluster_utils.Cluster`), cada
+uno con recursos `enc_<familia>`/`scratch_gb` inventados que imitan un PC con
+NVIDIA, una Jetson y un nodo solo-CPU, y lanza N trabajos simulados (un
+`sleep` cuya duración depende de la velocidad de la familia asignada) con cada
+política. Informa del tiempo total y de cuántos trabajos fueron a cada nodo y
+familia; `ray-default` lanza los trabajos sin recursos, como antes.
+
+Uso: python benchmarks/ray_placement.py [--jobs 20] [--seconds 1.0]
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ray  # noqa: E402
+from ray.cluster_utils import Cluster  # noqa: E402
+
+from optimize_video.placement import POLICIES, JobRequest, Placer  # noqa: E402
+
+# Nodos simulados: (nombre, CPUs, recursos)
+NODES = [
+    ("pc", 8, {"enc_nvenc": 3, "enc_software": 2, "scratch_gb": 200}),
+    ("jetson", 4, {"enc_nvmpi": 1, "enc_software": 1, "scratch_gb": 50}),
+    ("cpu", 8, {"enc_software": 2, "scratch_gb": 100}),
+]
+# Tiempo relativo de un encode por familia (nvenc = 1)
+SLOWDOWN = {"nvenc": 1.0, "nvmpi": 2.0, "software": 4.0, None: 2.0}
+
+
+@ray.remote
+def fake_encode(seconds, family=None):
+    time.sleep(seconds * SLOWDOWN.get(family, 2.0))
+    return ray.get_runtime_context().get_node_id(), family
+
+
+def run(policy: str, jobs: int, seconds: float, names: dict) -> dict:
+    start = time.perf_counter()
+    if policy == "ray-default":
+        refs = [fake_encode.options(num_cpus=1).remote(seconds) for _ in range(jobs)]
+    else:
+        placer = Placer(POLICIES[policy]())
+        refs = [placer.submit(fake_encode, JobRequest(scratch_gb=10), seconds) for _ in range(jobs)]
+    results = ray.get(refs)
+    wall = time.perf_counter() - start
+    placed = collections.Counter(f"{names.get(node, node[:8])}/{family or '-'}" for node, family in results)
+    return {"policy": policy, "jobs": jobs, "wall_s": round(wall, 2), "placed": dict(sorted(placed.items()))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Políticas de colocación en un cluster Ray local simulado")
+    parser.add_argument("--jobs", type=int, default=20, help="Trabajos simulados por política")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Duración de un encode en NVENC")
+    parser.add_argument("--policies", nargs="+", default=["ray-default", *POLICIES], help="Políticas a medir")
+    args = parser.parse_args()
+
+    cluster = Cluster(initialize_head=True, head_node_args={"num_cpus": 0})
+    for name, cpus, resources in NODES:
+        cluster.add_node(num_cpus=cpus, resources={**resources, f"sim_{name}": 1})
+    ray.init(address=cluster.address)
+    cluster.wait_for_nodes()
+    try:
+        names = {}
+        for info in ray.nodes():
+            for name, _, _ in NODES:
+                if f"sim_{name}" in info.get("Resources", {}):
+                    names[info["NodeID"]] = name
+        for policy in args.policies:
+            print(json.dumps(run(policy, args.jobs, args.seconds, names)))
+    finally:
+        ray.shutdown()
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
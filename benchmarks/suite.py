@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Banco de pruebas del pipeline de transcodificación con entradas sintéticas.
+
+1. Genera entradas reproducibles con `testsrc2`/`sine` (varias resoluciones,
+   duraciones, contenedores y códecs; `--inputs-dir` las reutiliza entre
+   ejecuciones).
+2. Ejecuta cada caso en un proceso hijo, con libx264 forzado
+   (`VIDEO_ENCODER`) para que los números no dependan de la GPU:
+   - `cli:<pipeline>`: `process_video` de `optimize_video` con cada modo
+     (recodificación forzada) y `cli:auto` (con la copia directa de entradas
+     conformes);
+   - `server:server.py` / `server:server-gpu.py`: el `process_video` de cada
+     servidor Flask, sin levantar el servidor (registro y caché en memoria).
+     `server-gpu-ray.py` necesita un cluster Ray y queda fuera.
+3. Mide por caso el tiempo de pared, el tiempo de CPU y el pico de RSS (del
+   hijo y sus ffmpeg, vía `os.wait4`), los bytes leídos y escritos
+   (`/proc/self/io` del hijo, que acumula los ffmpeg recogidos), el tamaño de
+   la salida y su SSIM frente a la entrada.
+4. Emite JSON; con `--baseline` compara contra una ejecución guardada y sale
+   con código 1 si algún caso empeora más de `--tolerance`.
+
+Uso:
+  python benchmarks/suite.py --output results.json
+  python benchmarks/suite.py --baseline results.json --tolerance 0.1
+  python benchmarks/suite.py --matrix full --cases cli:single-pass server:server.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from optimize_video.__main__ import pipelines  # noqa: E402
+
+# Entradas sintéticas: nombre -> parámetros de generación
+MATRICES: Dict[str, List[dict]] = {
+    "quick": [
+        {"name": "sd-10s-mp4", "size": "854x480", "duration": 10, "container": "mp4"},
+        # Ya conforme con el perfil de salida: ejercita la copia directa en cli:auto y servidores
+        {"name": "hd-10s-conforme-mp4", "size": "1280x720", "duration": 10, "container": "mp4", "bitrate": "500k"},
+        {"name": "fhd-20s-mkv", "size": "1920x1080", "duration": 20, "container": "mkv"},
+        {"name": "sd-10s-mpeg4-avi", "size": "640x360", "duration": 10, "container": "avi", "vcodec": "mpeg4", "acodec": "ac3"},
+    ],
+}
+MATRICES["full"] = MATRICES["quick"] + [
+    {"name": "fhd-120s-mp4", "size": "1920x1080", "duration": 120, "container": "mp4"},
+    {"name": "hd60-60s-mov", "size": "1280x720", "duration": 60, "container": "mov", "rate": 60},
+    {"name": "uhd-30s-mkv", "size": "3840x2160", "duration": 30, "container": "mkv"},
+]
+
+CASES = [f"cli:{p}" for p in pipelines] + ["cli:auto", "server:server.py", "server:server-gpu.py"]
+
+# Métricas comparadas con la línea base: (clave, sentido) con +1 = más es peor
+COMPARED = (("wall_s", 1), ("cpu_s", 1), ("max_rss_kb", 1), ("write_bytes", 1), ("output_bytes", 1), ("ssim", -1))
+
+
+# -- entradas ----------------------------------------------------------------
+
+def make_input(spec: dict, directory: str) -> str:
+    """Genera (o reutiliza) la entrada; bit-exacta para que sea igual entre ejecuciones."""
+    path = os.path.join(directory, f"{spec['name']}.{spec['container']}")
+    if os.path.exists(path):
+        return path
+    rate = spec.get("rate", 30)
+    duration = spec["duration"]
+    vcodec = spec.get("vcodec", "libx264")
+    video = ["-c:v", vcodec, "-pix_fmt", "yuv420p"]
+    if vcodec == "libx264":
+        video += ["-preset", "veryfast", "-threads", "4"]
+        video += ["-b:v", spec["bitrate"]] if "bitrate" in spec else ["-crf", "18"]
+    else:
+        video += ["-q:v", "4"]
+    tmp = path + ".part"
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={spec['size']}:rate={rate}:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            *video, "-c:a", spec.get("acodec", "aac"), "-ac", "2",
+            "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact", "-map_metadata", "-1",
+            "-f", {"mkv": "matroska"}.get(spec["container"], spec["container"]), tmp,
+        ],
+        check=True,
+    )
+    os.replace(tmp, path)
+    return path
+
+
+def ssim(output: str, source: str) -> Optional[float]:
+    """SSIM de la salida frente a la entrada escalada a su resolución y ritmo."""
+    try:
+        dims = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height,r_frame_rate",
+             "-of", "csv=p=0", output],
+            stdout=subprocess.PIPE, text=True, check=True,
+        ).stdout.strip().split(",")
+        width, height, rate = dims[0], dims[1], dims[2]
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-nostats", "-i", output, "-i", source, "-lavfi",
+             f"[1:v]scale={width}:{height},fps={rate}[ref];[0:v][ref]ssim", "-f", "null", "-"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+        )
+    except (subprocess.CalledProcessError, IndexError, OSError):
+        return None
+    for line in reversed(result.stderr.splitlines()):
+        if "All:" in line:
+            return round(float(line.split("All:")[1].split()[0]), 5)
+    return None
+
+
+# -- worker (proceso hijo, un caso) -------------------------------------------
+
+def proc_io() -> Dict[str, int]:
+    counters: Dict[str, int] = {}
+    try:
+        with open("/proc/self/io") as fh:
+            for line in fh:
+                key, value = line.split(":", 1)
+                counters[key.strip()] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def load_server(script: str):
+    """Importa un servidor Flask como módulo (sin arrancarlo)."""
+    spec = importlib.util.spec_from_file_location(script.replace("-", "_").rsplit(".", 1)[0], os.path.join(ROOT, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def worker(case: str, source: str, workdir: str, result_path: str) -> None:
+    # Copia de la entrada: los pipelines borran el original al terminar
+    src = os.path.join(workdir, os.path.basename(source))
+    shutil.copyfile(source, src)
+    stem = os.path.splitext(os.path.basename(src))[0]
+    kind, name = case.split(":", 1)
+
+    if kind == "server":
+        module = load_server(name)  # la importación (sondeo de codificadores, Flask) no se mide
+        from optimize_video.scheduler import Job
+
+        before = proc_io()
+        job_id, _ = module.store.enqueue(src)
+        module.process_video(src, Job(src), job_id)
+        after = proc_io()
+        output = os.path.join(workdir, stem + "-optimized.mkv")
+        status = module.store.get(job_id)["message"]
+    else:
+        from optimize_video import __main__ as cli
+
+        out_dir = os.path.join(workdir, "out")
+        os.makedirs(out_dir, exist_ok=True)
+        before = proc_io()
+        result = cli.process_video(
+            src, out_dir, backend="ffmpeg", encoder="libx264",
+            pipeline="three-pass" if name == "auto" else name,
+            always_encode=name != "auto",
+        )
+        after = proc_io()
+        output = os.path.join(out_dir, stem + "-optimized.mkv")
+        status = result["status"]
+
+    with open(result_path, "w") as fh:
+        json.dump({
+            "output": output,
+            "status": status,
+            **{k: after.get(k, 0) - before.get(k, 0) for k in ("read_bytes", "write_bytes", "rchar", "wchar")},
+        }, fh)
+
+
+# -- orquestación --------------------------------------------------------------
+
+def run_case(case: str, spec: dict, source: str, tmp: str, quality: bool) -> dict:
+    workdir = tempfile.mkdtemp(dir=tmp)
+    result_path = os.path.join(workdir, "result.json")
+    env = {
+        **os.environ,
+        "VIDEO_ENCODER": "libx264",   # mismo codificador en todos los hosts
+        "JOB_DB": "",                 # registro de trabajos en memoria
+        "RESULT_CACHE_DIR": "",       # sin caché de resultados
+        "WORKERS": "1",
+    }
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--worker", case, source, workdir, result_path],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    stderr = proc.stderr.read()
+    # wait4: CPU y pico de RSS del hijo y de los ffmpeg que recogió
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+
+    row = {"case": case, "input": spec["name"], "key": f"{spec['name']}/{case}"}
+    if proc.returncode != 0 or not os.path.exists(result_path):
+        row["error"] = stderr.decode(errors="replace").strip().splitlines()[-1:] or [f"exit {proc.returncode}"]
+        shutil.rmtree(workdir, ignore_errors=True)
+        return row
+    with open(result_path) as fh:
+        data = json.load(fh)
+
+    row.update({
+        "status": data["status"],
+        "wall_s": round(wall, 3),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        "max_rss_kb": usage.ru_maxrss,
+        "read_bytes": data["read_bytes"],
+        "write_bytes": data["write_bytes"],
+        "rchar": data["rchar"],
+        "wchar": data["wchar"],
+        "output_bytes": os.path.getsize(data["output"]) if os.path.exists(data["output"]) else 0,
+    })
+    if quality and row["output_bytes"]:
+        row["ssim"] = ssim(data["output"], source)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return row
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    """Regresiones frente a la línea base (mismo caso y entrada)."""
+    base = {r["key"]: r for r in baseline.get("results", [])}
+    problems = []
+    for row in results:
+        ref = base.get(row["key"])
+        if ref is None:
+            continue
+        if "error" in row and "error" not in ref:
+            problems.append(f"{row['key']}: falla ({row['error']})")
+            continue
+        for key, direction in COMPARED:
+            new, old = row.get(key), ref.get(key)
+            if new is None or old is None:
+                continue
+            if key == "ssim":
+                # SSIM: tolerancia absoluta pequeña (0.005 por cada 10 % de tolerancia)
+                worse = old - new > tolerance / 20
+            else:
+                worse = old > 0 and direction * (new - old) / old > tolerance
+            if worse:
+                problems.append(f"{row['key']}: {key} {old} -> {new}")
+    return problems
+
+
+def ffmpeg_version() -> str:
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "?"
+    return out.splitlines()[0] if out else "?"
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        worker(*sys.argv[2:6])
+        return
+
+    parser = argparse.ArgumentParser(description="Banco de pruebas del pipeline con entradas sintéticas")
+    parser.add_argument("--matrix", choices=sorted(MATRICES), default="quick", help="Conjunto de entradas (por defecto: quick)")
+    parser.add_argument("--inputs", nargs="+", help="Solo estas entradas (por nombre)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES, help="Casos a ejecutar (por defecto: todos)")
+    parser.add_argument("--inputs-dir", help="Carpeta donde generar/reutilizar las entradas (por defecto: temporal)")
+    parser.add_argument("--runs", type=int, default=1, help="Repeticiones por caso (se guarda la mediana de tiempo)")
+    parser.add_argument("--no-quality", action="store_true", help="No calcular el SSIM de las salidas")
+    parser.add_argument("--output", help="Fichero JSON de resultados (por defecto: stdout)")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior con la que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento relativo admitido (por defecto: 0.10)")
+    args = parser.parse_args()
+
+    specs = [s for s in MATRICES[args.matrix] if not args.inputs or s["name"] in args.inputs]
+    results: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="bench-suite-") as tmp:
+        inputs_dir = args.inputs_dir or os.path.join(tmp, "inputs")
+        os.makedirs(inputs_dir, exist_ok=True)
+        for spec in specs:
+            source = make_input(spec, inputs_dir)
+            for case in args.cases:
+                runs = [run_case(case, spec, source, tmp, not args.no_quality) for _ in range(max(1, args.runs))]
+                ok = sorted((r for r in runs if "error" not in r), key=lambda r: r["wall_s"])
+                row = ok[len(ok) // 2] if ok else runs[0]
+                results.append(row)
+                print(json.dumps(row), file=sys.stderr)
+
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "ffmpeg": ffmpeg_version(),
+            "matrix": args.matrix,
+            "runs": args.runs,
+        },
+        "results": results,
+    }
+
+    problems: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as fh:
+            problems = compare(results, json.load(fh), args.tolerance)
+        report["regressions"] = problems
+
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    for problem in problems:
+        print("REGRESIÓN:", problem, file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
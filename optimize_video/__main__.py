@@ -4,54 +4,90 @@
 Realiza los pasos:
  1) Ignora ficheros con "-optimized" en el nombre.
  2) Reparar: copia streams con `-c copy` -> `_repaired.mkv`.
- 3) Reducir: recodifica con `h264_nvenc`, `-b:v 2M`, escala 1280x720 -> `_reduced.mkv`.
+ 3) Reducir: recodifica con el codificador más rápido del host (NVENC, nvmpi,
+    VAAPI, QSV o libx264, ver `encoders.py`), `-b:v 2M`, escala 1280x720 -> `_reduced.mkv`.
  4) Optimizar para streaming: `-cq 27 -b:v 800k -r 30 -movflags faststart` -> `-optimized.mkv`.
  5) Validar duración con `ffprobe` (<= 2s de diferencia).
  6) Elimina original e intermedios si todo correcto.
 
-Uso: python -m optimize_video -i input_video -o /ruta/salida
+Con `--pipeline single-pass` los pasos 2-4 se funden en una única invocación
+de ffmpeg (demux tolerante a errores -> scale 1280:720 -> fps 30 -> codificación
+final con faststart), sin escribir `_repaired`/`_reduced` en disco. Con
+`--pipeline streamed` se mantienen las tres pasadas pero los intermedios viajan
+por tuberías (Matroska/NUT) y las etapas se ejecutan solapadas. Con
+`--pipeline chunked` el vídeo se parte por keyframes en `--segments` trozos que
+se codifican en paralelo y se vuelven a unir con el demuxer concat.
+
+Con `--target-quality` (o `--metric`) el CQ/CRF de la optimización no es fijo:
+se busca por título sobre unos clips de muestra el valor de menor bitrate que
+alcanza la puntuación objetivo (SSIM, PSNR o VMAF; ver `quality.py`).
+
+Si la entrada ya cumple el perfil de salida (H.264 ≤1280x720 ≤30 fps por
+debajo de `--opt-bitrate`, AAC estéreo) no se recodifica: se remuxa con
+`-c copy -movflags faststart`, recodificando solo el audio si es lo único que
+no cumple (ver `compliance.py`; `--always-encode` lo desactiva).
+
+Con `--abr` la salida no es un único 1280x720 sino una escalera de calidades
+(`--ladder`, p. ej. 1080/720/480/360 con su bitrate) empaquetada en HLS y/o
+DASH (`--abr-formats`) con lista maestra: la fuente se decodifica una sola vez
+y un grafo `split` alimenta a todos los peldaños, que se codifican en paralelo
+en el mismo ffmpeg (ver `abr.py`). Salida en `<salida>/<nombre>-abr/`.
+
+Cada etapa (sondeo, reparar, reducir, optimizar, validar, limpieza) se mide:
+tiempo de pared, CPU de los ffmpeg, bytes de entrada/salida y fps de
+codificación; `--metrics-json` escribe el resumen (ver `metrics.py`).
+
+Con varias entradas (`-i` con carpetas, globs o varios ficheros, o
+`--input-list`) se procesan por lotes en un pool de `--jobs` procesos, con
+`--max-encoder-sessions` sesiones de codificador como mucho entre todos; cada
+resultado se añade a un resumen JSON Lines (ver `batch.py`).
+
+Cada vídeo reserva antes el disco que va a escribir (estimado por bitrate y
+duración) y espera mientras no quepa; un fallo por disco lleno sale con el
+código 75 y en lotes se reintenta (ver `diskbudget.py`).
+
+Uso: python -m optimize_video -i input_video -o /ruta/salida [--pipeline single-pass|streamed|chunked] [--abr]
+     python -m optimize_video -i /carpeta "otra/*.mkv" -o /ruta/salida --jobs 4 --max-encoder-sessions 3
 """
 
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import subprocess
 import sys
-from typing import List
+import time
+from typing import Dict, List, Optional, Sequence
 import platform
 
+from . import abr
+from .batch import encoder_sessions, expand_inputs, read_list, run_batch
+from .cache import DEFAULT_DIR as DEFAULT_CACHE_DIR, ResultCache, cache_key
+from .compliance import OutputProfile, copy_plan
+from .diskbudget import DiskBudget, DiskFullError, estimate_bytes, is_disk_full
+from .encoders import BY_NAME, Encoder, best_encoder, gst_has
+from .metrics import StageMetrics, run_child
+from .probe import MediaInfo, probe, probe_duration
+from .scratch import SCRATCH_DIRNAME, JobScratch, job_key, publish, remove_if_empty, sweep
+from .quality import DEFAULT_CANDIDATES, DEFAULT_TARGETS, METRICS, search_quality
+from .segments import encode_chunked
+from .streaming import pipe_formats, pipe_input, pipe_output, run_stages
+
+# Código de salida de un fallo reintentable (disco lleno): EX_TEMPFAIL de sysexits.h
+EXIT_RETRY = 75
 
 valid_extensions = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
-history: List[dict] = []
+pipelines = ("three-pass", "single-pass", "streamed", "chunked")
 
 
 def run(cmd: List[str]) -> None:
     print("Ejecutando:", " ".join(cmd))
-    subprocess.run(cmd, check=True)
+    run_child(cmd)  # la CPU del proceso cuenta para la etapa abierta
 
 
 def get_video_duration(video_path: str) -> float:
-    try:
-        result = subprocess.run(
-            [
-                "ffprobe",
-                "-v",
-                "error",
-                "-show_entries",
-                "format=duration",
-                "-of",
-                "default=noprint_wrappers=1:nokey=1",
-                video_path,
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True,
-        )
-        return float(result.stdout.strip())
-    except Exception:
-        return 0.0
+    return probe_duration(video_path)
 
 
 def is_jetson() -> bool:
@@ -65,14 +101,6 @@ def is_jetson() -> bool:
     return False
 
 
-def gst_has(plugin: str) -> bool:
-    try:
-        subprocess.run(["gst-inspect-1.0", plugin], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-        return True
-    except Exception:
-        return False
-
-
 def choose_gst_video_encoder() -> str:
     # Prefer hardware-accelerated encoders commonly available on Jetson
     for p in ("omxh264enc", "nvh264enc", "avenc_h264_omx"):
@@ -88,33 +116,116 @@ def choose_gst_audio_encoder() -> str:
     return "avenc_aac"
 
 
-def process_video(video_path: str, output_dir: str, *, cq: int = 27, crf: int = 23, reduce_bitrate: str = "2M", opt_bitrate: str = "800k", gpu: str = "0", backend: str = "auto") -> None:
-    global history
+def gst_bitrates(reduce_bitrate: str, opt_bitrate: str) -> tuple[int, int]:
+    """Convierte los bitrates de ffmpeg (`2M`, `800k`) a kbit/s para los plugins."""
+    try:
+        reduce_k = int(float(reduce_bitrate.rstrip('M')) * 1000)
+    except Exception:
+        reduce_k = 2000
+    try:
+        opt_k = int(float(opt_bitrate.rstrip('k')))
+    except Exception:
+        opt_k = 800
+    return reduce_k, opt_k
+
+
+def single_pass_ffmpeg_cmd(video_path: str, optimized: str, *, encoder: Encoder, quality: int, opt_bitrate: str, gpu: str) -> List[str]:
+    """Un único grafo: demux tolerante -> scale -> fps -> codificación final."""
+    return [
+        "ffmpeg",
+        "-err_detect",
+        "ignore_err",
+        "-fflags",
+        "+genpts+discardcorrupt",
+        "-i",
+        video_path,
+        *encoder.args(quality=quality, bitrate=opt_bitrate, vf="scale=1280:720,fps=30", gpu=gpu),
+        "-c:a",
+        "aac",
+        "-ac",
+        "2",
+        "-movflags",
+        "faststart",
+        optimized,
+    ]
+
+
+def single_pass_gst_cmd(video_path: str, optimized: str, *, video_enc: str, audio_enc: str, opt_k: int) -> List[str]:
+    """Equivalente GStreamer de `single_pass_ffmpeg_cmd` (decodebin acepta cualquier contenedor)."""
+    return [
+        "gst-launch-1.0",
+        "filesrc", f"location={video_path}",
+        "!", "decodebin", "name=dec",
+        "dec.", "!", "queue", "!", "videorate", "!", "video/x-raw,framerate=30/1", "!", "nvvidconv", "!",
+        "video/x-raw(memory:NVMM),width=1280,height=720,format=I420", "!", video_enc, f"bitrate={opt_k}", "!",
+        "h264parse", "!", "video/x-h264,profile=baseline", "!", "mp4mux", "name=mux", "faststart=true", "!", f"filesink location={optimized}",
+        "dec.", "!", "queue", "!", "audioconvert", "!", "audio/x-raw,channels=2", "!", audio_enc, "!", "aacparse", "!", "mux.",
+    ]
+
+
+def encode_abr(video_path: str, dest: str, info: Optional[MediaInfo], *, encoder: Encoder, ladder: str, formats: Sequence[str], segment_seconds: float, gpu: str, stages: StageMetrics) -> Dict[str, str]:
+    """Escalera ABR en `dest`: una codificación (un solo decode) y un empaquetado por formato.
+
+    Devuelve {formato: manifiesto}; los MP4 intermedios de cada peldaño se borran al terminar.
+    """
+    rungs = abr.fit_ladder(abr.parse_ladder(ladder), info.video.height if info and info.video else 0)
+    files = abr.rung_files(dest, rungs, has_audio=info is None or info.audio is not None)
+    frames = info.duration * 30 * len(rungs) if info is not None else 0.0
+    os.makedirs(dest, exist_ok=True)
+    print("Escalera ABR:", ", ".join(f"{r.name} {r.bitrate}" for r in rungs))
+    try:
+        # Un peldaño = una sesión de codificador
+        with encoder_sessions(len(rungs)), stages.stage("encode", inputs=[video_path], outputs=files.paths, frames=frames):
+            run(abr.encode_command(
+                video_path, files, rungs, encoder,
+                segment_seconds=segment_seconds,
+                source_fps=info.video.fps if info and info.video else 0.0,
+                gpu=gpu,
+            ))
+        # El peldaño superior representa a todos: salen del mismo decode
+        with stages.stage("validate", inputs=[files.videos[0]]):
+            if abs(get_video_duration(video_path) - get_video_duration(files.videos[0])) > 2:
+                raise ValueError("La duración de la escalera ABR no coincide con el original")
+        with stages.stage("package", inputs=files.paths):
+            return abr.package(files, rungs, dest, formats, segment_seconds=segment_seconds, run=run)
+    finally:
+        for path in files.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def process_video(video_path: str, output_dir: str, *, cq: int = 27, crf: int = 23, reduce_bitrate: str = "2M", opt_bitrate: str = "800k", gpu: str = "0", backend: str = "auto", pipeline: str = "three-pass", pipe_format: str = "matroska", segments: int = 4, cache: Optional[ResultCache] = None, encoder: Optional[str] = None, target_quality: Optional[float] = None, metric: Optional[str] = None, sample_clips: int = 3, sample_seconds: float = 4.0, search_jobs: int = 4, always_encode: bool = False, metrics: Optional[StageMetrics] = None, abr_ladder: Optional[str] = None, abr_formats: Sequence[str] = ("hls",), segment_seconds: float = 4.0, scratch_dir: Optional[str] = None, min_free_gb: float = 1.0) -> dict:
+    """Procesa un vídeo; devuelve su resultado (`name`, `status`, `outputs`) o lanza la excepción.
+
+    Todo se escribe en un directorio de trabajo propio (`scratch_dir`, por
+    defecto `<salida>/.video-optimizer-tmp`) y la salida solo se publica en
+    `output_dir`, con un rename atómico, tras validarla. Antes de escribir se
+    reserva el disco que ocupará (ver `diskbudget.py`); un fallo por disco
+    lleno se relanza como DiskFullError.
+    """
+    if pipeline not in pipelines:
+        raise ValueError(f"Pipeline desconocido: {pipeline}")
 
+    name = os.path.basename(video_path)
     if "-optimized" in video_path:
         print("Ignorado (ya optimizado):", video_path)
-        return
+        return {"name": name, "status": "Ignorado (ya optimizado)", "outputs": []}
 
     if not os.path.isfile(video_path):
         raise FileNotFoundError(video_path)
 
     base_root = os.path.splitext(os.path.basename(video_path))[0]
-    repaired = os.path.join(output_dir, base_root + "_repaired.mkv")
-    reduced = os.path.join(output_dir, base_root + "_reduced.mkv")
-    optimized = os.path.join(output_dir, base_root + "-optimized.mkv")
+    final = os.path.join(output_dir, base_root + "-optimized.mkv")
+    scratch = JobScratch(scratch_dir or os.path.join(output_dir, SCRATCH_DIRNAME), job_key(video_path)).open()
+    repaired = scratch.path(base_root + "_repaired.mkv")
+    reduced = scratch.path(base_root + "_reduced.mkv")
+    optimized = scratch.path(base_root + "-optimized.mkv")
+    budget = DiskBudget(scratch.root, int(min_free_gb * 1024**3))
+    stages = metrics if metrics is not None else StageMetrics()
 
     try:
-        # Paso 1: Reparar (copiar streams)
-        run([
-            "ffmpeg",
-            "-err_detect",
-            "ignore_err",
-            "-i",
-            video_path,
-            "-c",
-            "copy",
-            repaired,
-        ])
         # Si se selecciona backend GStreamer (o auto detectado Jetson), usar gst-launch-1.0
         use_gst = False
         if backend == "gstreamer":
@@ -122,147 +233,411 @@ def process_video(video_path: str, output_dir: str, *, cq: int = 27, crf: int =
         elif backend == "auto" and is_jetson():
             use_gst = True
 
+        if use_gst and abr_ladder:
+            raise ValueError("El modo ABR necesita ffmpeg (backend gstreamer no soportado)")
+
         if use_gst:
             # Elige encoders disponibles en el sistema
             video_enc = choose_gst_video_encoder()
             audio_enc = choose_gst_audio_encoder()
             print(f"Usando GStreamer video encoder: {video_enc}, audio encoder: {audio_enc}")
-
-            # Convertir bitrates a valores apropiados para los plugins
-            try:
-                reduce_k = int(float(reduce_bitrate.rstrip('M')) * 1000)
-            except Exception:
-                reduce_k = 2000
+            reduce_k, opt_k = gst_bitrates(reduce_bitrate, opt_bitrate)
+            stages.labels["encoder"] = video_enc
+        else:
+            # El codificador más rápido que funciona en este host (o el indicado)
+            enc = BY_NAME[encoder] if encoder else best_encoder()
+            # CQ para codificadores hardware, CRF para los de CPU
+            quality = cq if enc.hardware else crf
+            print(f"Usando codificador ffmpeg: {enc.name}")
+            stages.labels["encoder"] = enc.name
+
+        # Búsqueda por título: solo con ffmpeg y codificadores con control por calidad (nvmpi no lo tiene)
+        # (la escalera ABR usa el bitrate de cada peldaño: sin búsqueda)
+        search = (target_quality is not None or metric is not None) and not use_gst and not abr_ladder
+        if search and enc.family == "nvmpi":
+            print(f"{enc.name} solo admite control por bitrate: se usa la calidad fija")
+            search = False
+        if search:
+            metric = metric or "ssim"
+            target_quality = target_quality if target_quality is not None else DEFAULT_TARGETS[metric]
+
+        if pipeline in ("streamed", "chunked") and use_gst:
+            # gst-launch ya encadena todo en un proceso: equivale a single-pass
+            print(f"GStreamer: el modo {pipeline} se ejecuta como single-pass")
+            pipeline = "single-pass"
+
+        # Caché de resultados: misma entrada y mismos parámetros -> mismo resultado
+        if cache is not None and not abr_ladder:
+            key = cache_key(video_path, {
+                "cq": cq, "crf": crf, "reduce_bitrate": reduce_bitrate, "opt_bitrate": opt_bitrate,
+                "backend": "gstreamer" if use_gst else "ffmpeg",
+                "encoder": video_enc if use_gst else enc.name,
+                "pipeline": pipeline,
+                "target": [metric, target_quality, sample_clips, sample_seconds] if search else None,
+            })
+            if cache.get(key, optimized):
+                publish(optimized, final)
+                try:
+                    os.remove(video_path)
+                except Exception:
+                    pass
+                print("Recuperado de caché:", final)
+                return {"name": name, "status": "Procesado correctamente (caché)", "outputs": [final]}
+
+        # Un único sondeo: decide si basta con copiar los streams y da los frames para las métricas
+        with stages.stage("probe", inputs=[video_path]):
             try:
-                opt_k = int(float(opt_bitrate.rstrip('k')))
-            except Exception:
-                opt_k = 800
-
-            # Paso 2 (reduce) con GStreamer: demux -> decode -> nvvidconv -> encoder -> mp4mux
-            gst_reduce = [
-                "gst-launch-1.0",
-                "filesrc", f"location={repaired}",
-                "!", "qtdemux", "name=demux",
-                "demux.video_0", "!", "queue", "!", "decodebin", "!", "nvvidconv", "!",
-                "video/x-raw(memory:NVMM),format=I420", "!", video_enc, f"bitrate={reduce_k}", "!",
-                "h264parse", "!", "mp4mux", "name=mux", "!", f"filesink location={reduced}",
-                "demux.audio_0", "!", "queue", "!", "decodebin", "!", "audioconvert", "!", audio_enc, "!", "aacparse", "!", "mux.",
-            ]
-            run(gst_reduce)
-
-            # Paso 3 (optimizar) con GStreamer: menor bitrate y target 30fps
-            gst_opt = [
-                "gst-launch-1.0",
-                "filesrc", f"location={reduced}",
-                "!", "qtdemux", "name=demux",
-                "demux.video_0", "!", "queue", "!", "decodebin", "!", "nvvidconv", "!",
-                "video/x-raw(memory:NVMM),format=I420", "!", video_enc, f"bitrate={opt_k}", "!",
-                "h264parse", "!", "video/x-h264,profile=baseline", "!", "mp4mux", "name=mux", "!", f"filesink location={optimized}",
-                "demux.audio_0", "!", "queue", "!", "decodebin", "!", "audioconvert", "!", audio_enc, "!", "aacparse", "!", "mux.",
-            ]
-            run(gst_opt)
+                info = probe(video_path)
+            except (OSError, subprocess.CalledProcessError, ValueError):
+                info = None  # sin sondeo, el pipeline normal dará el error si lo hay
+        src_frames = info.total_frames if info is not None else 0
+        out_frames = info.duration * 30 if info is not None else 0.0  # la salida va a 30 fps
+
+        plan = None
+        if not always_encode and info is not None and not abr_ladder:
+            plan = copy_plan(info, OutputProfile.for_bitrate(opt_bitrate))
+            if not plan.copy_video:
+                print("Recodificación necesaria:", ", ".join(plan.reasons))
+        fast = plan is not None and plan.copy_video
+
+        # Disco: con otros trabajos escribiendo en el mismo volumen (--jobs, otras CLI) se espera a que quepa
+        footprint = estimate_bytes(
+            info, "abr" if abr_ladder else "remux" if fast else pipeline, size=os.path.getsize(video_path),
+            reduce_bitrate=reduce_bitrate, opt_bitrate=opt_bitrate,
+            ladder=[r.bitrate for r in abr.parse_ladder(abr_ladder)] if abr_ladder else (),
+        )
+        budget.acquire(scratch.key, footprint, on_wait=lambda free: print(
+            f"Esperando espacio en disco ({footprint / 1024**3:.1f} GB, libres {max(0, free) / 1024**3:.1f} GB)..."
+        ))
+
+        if abr_ladder:
+            dest = os.path.join(output_dir, base_root + "-abr")
+            encode_abr(
+                video_path, scratch.path("abr"), info, encoder=enc, ladder=abr_ladder, formats=abr_formats,
+                segment_seconds=segment_seconds, gpu=gpu, stages=stages,
+            )
+            # La carpeta HLS/DASH completa aparece de una vez
+            publish(scratch.path("abr"), dest)
+            playlists = abr.manifests(dest, abr_formats)
+            with stages.stage("cleanup"):
+                try:
+                    os.remove(video_path)
+                except Exception:
+                    pass
+            status = f"Procesado correctamente (ABR {', '.join(playlists)})"
+            for path in playlists.values():
+                print(f"{status}:", path)
+            return {"name": name, "status": status, "outputs": list(playlists.values())}
+
+        if search and not fast:
+            with encoder_sessions(search_jobs):
+                choice = search_quality(
+                    video_path, enc,
+                    duration=get_video_duration(video_path),
+                    target=target_quality, metric=metric,
+                    clips=sample_clips, clip_seconds=sample_seconds,
+                    bitrate=opt_bitrate, gpu=gpu, jobs=search_jobs, workdir=scratch.dir,
+                )
+            for trial in choice.trials:
+                print(f"  calidad {trial.quality}: {choice.metric} {trial.score:.4f}, {trial.kbps:.0f} kb/s")
+            if not choice.met:
+                print(f"Ningún candidato alcanza {choice.metric} {choice.target}: se usa el de mejor puntuación")
+            quality = choice.quality
+            print(f"Calidad elegida por título: {quality} ({choice.metric} objetivo {choice.target})")
+
+        status = "Procesado correctamente"
+        if fast:
+            # La entrada ya cumple el perfil: remux (y audio recodificado si hace falta)
+            print("Entrada conforme:", "copia de streams" if plan.copy_audio else "copia de vídeo, " + ", ".join(plan.reasons))
+            with stages.stage("remux", inputs=[video_path], outputs=[optimized]):
+                run(["ffmpeg", "-err_detect", "ignore_err", "-i", video_path, *plan.args(), optimized])
+            status = plan.outcome
+
+        elif pipeline == "single-pass":
+            # Pasos 1-3 en una sola pasada: sin intermedios en disco
+            with encoder_sessions(), stages.stage("encode", inputs=[video_path], outputs=[optimized], frames=out_frames):
+                if use_gst:
+                    run(single_pass_gst_cmd(video_path, optimized, video_enc=video_enc, audio_enc=audio_enc, opt_k=opt_k))
+                else:
+                    run(single_pass_ffmpeg_cmd(video_path, optimized, encoder=enc, quality=quality, opt_bitrate=opt_bitrate, gpu=gpu))
+
+        elif pipeline == "chunked":
+            # Segmentos alineados a GOP codificados en paralelo; audio aparte y concat final
+            with encoder_sessions(segments), stages.stage("encode", inputs=[video_path], outputs=[optimized], frames=out_frames):
+                used = encode_chunked(
+                    video_path,
+                    optimized,
+                    duration=get_video_duration(video_path),
+                    segments=segments,
+                    video_args=enc.args(quality=quality, bitrate=opt_bitrate, vf="scale=1280:720,fps=30", gpu=gpu),
+                )
+            print(f"Codificado en {used} segmentos")
+
+        elif pipeline == "streamed":
+            # Pasos 1-3 solapados: los intermedios van por tuberías, no a disco (reducir y optimizar a la vez)
+            with encoder_sessions(2), stages.stage("encode", inputs=[video_path], outputs=[optimized], frames=out_frames):
+                run_stages([
+                    ["ffmpeg", "-err_detect", "ignore_err", "-i", video_path, "-c", "copy", *pipe_output(pipe_format)],
+                    ["ffmpeg", *pipe_input(pipe_format), *enc.args(bitrate=reduce_bitrate, vf="scale=1280:720", gpu=gpu),
+                     "-c:a", "aac", "-ac", "2", *pipe_output(pipe_format)],
+                    ["ffmpeg", *pipe_input(pipe_format), *enc.args(quality=quality, bitrate=opt_bitrate, vf="scale=1280:720", gpu=gpu),
+                     "-r", "30", "-c:a", "aac", "-ac", "2", "-movflags", "faststart", optimized],
+                ])
 
         else:
-            # Usar ffmpeg NVENC (normalmente en máquinas x86_64 con NVIDIA)
-            # Paso 2: Reducir tamaño
-            run([
-                "ffmpeg",
-                "-i",
-                repaired,
-                "-c:v",
-                "h264_nvenc",
-                "-preset",
-                "fast",
-                "-b:v",
-                reduce_bitrate,
-                "-vf",
-                "scale=1280:720",
-                "-c:a",
-                "aac",
-                "-ac",
-                "2",
-                reduced,
-            ])
-
-            # Paso 3: Optimizar para streaming
-            run([
-                "ffmpeg",
-                "-i",
-                reduced,
-                "-c:v",
-                "h264_nvenc",
-                "-preset",
-                "fast",
-                "-cq",
-                str(cq),
-                "-b:v",
-                opt_bitrate,
-                "-r",
-                "30",
-                "-vf",
-                "scale=1280:720",
-                "-c:a",
-                "aac",
-                "-ac",
-                "2",
-                "-movflags",
-                "faststart",
-                "-gpu",
-                str(gpu),
-                optimized,
-            ])
+            # Paso 1: Reparar (copiar streams)
+            with stages.stage("repair", inputs=[video_path], outputs=[repaired]):
+                run([
+                    "ffmpeg",
+                    "-err_detect",
+                    "ignore_err",
+                    "-i",
+                    video_path,
+                    "-c",
+                    "copy",
+                    repaired,
+                ])
+
+            if use_gst:
+                # Paso 2 (reduce) con GStreamer: demux -> decode -> nvvidconv -> encoder -> mp4mux
+                gst_reduce = [
+                    "gst-launch-1.0",
+                    "filesrc", f"location={repaired}",
+                    "!", "qtdemux", "name=demux",
+                    "demux.video_0", "!", "queue", "!", "decodebin", "!", "nvvidconv", "!",
+                    "video/x-raw(memory:NVMM),format=I420", "!", video_enc, f"bitrate={reduce_k}", "!",
+                    "h264parse", "!", "mp4mux", "name=mux", "!", f"filesink location={reduced}",
+                    "demux.audio_0", "!", "queue", "!", "decodebin", "!", "audioconvert", "!", audio_enc, "!", "aacparse", "!", "mux.",
+                ]
+                with encoder_sessions(), stages.stage("reduce", inputs=[repaired], outputs=[reduced], frames=src_frames):
+                    run(gst_reduce)
+
+                # Paso 3 (optimizar) con GStreamer: menor bitrate y target 30fps
+                gst_opt = [
+                    "gst-launch-1.0",
+                    "filesrc", f"location={reduced}",
+                    "!", "qtdemux", "name=demux",
+                    "demux.video_0", "!", "queue", "!", "decodebin", "!", "nvvidconv", "!",
+                    "video/x-raw(memory:NVMM),format=I420", "!", video_enc, f"bitrate={opt_k}", "!",
+                    "h264parse", "!", "video/x-h264,profile=baseline", "!", "mp4mux", "name=mux", "!", f"filesink location={optimized}",
+                    "demux.audio_0", "!", "queue", "!", "decodebin", "!", "audioconvert", "!", audio_enc, "!", "aacparse", "!", "mux.",
+                ]
+                with encoder_sessions(), stages.stage("optimize", inputs=[reduced], outputs=[optimized], frames=out_frames):
+                    run(gst_opt)
+
+            else:
+                # Usar ffmpeg con el codificador elegido (NVENC en máquinas x86_64 con NVIDIA)
+                # Paso 2: Reducir tamaño
+                with encoder_sessions(), stages.stage("reduce", inputs=[repaired], outputs=[reduced], frames=src_frames):
+                    run([
+                        "ffmpeg",
+                        "-i",
+                        repaired,
+                        *enc.args(bitrate=reduce_bitrate, vf="scale=1280:720", gpu=gpu),
+                        "-c:a",
+                        "aac",
+                        "-ac",
+                        "2",
+                        reduced,
+                    ])
+
+                # Paso 3: Optimizar para streaming
+                with encoder_sessions(), stages.stage("optimize", inputs=[reduced], outputs=[optimized], frames=out_frames):
+                    run([
+                        "ffmpeg",
+                        "-i",
+                        reduced,
+                        *enc.args(quality=quality, bitrate=opt_bitrate, vf="scale=1280:720", gpu=gpu),
+                        "-r",
+                        "30",
+                        "-c:a",
+                        "aac",
+                        "-ac",
+                        "2",
+                        "-movflags",
+                        "faststart",
+                        optimized,
+                    ])
 
         # Paso 4: Validar duración
-        orig_dur = get_video_duration(video_path)
-        opt_dur = get_video_duration(optimized)
-        if abs(orig_dur - opt_dur) > 2:
-            raise ValueError("La duración del archivo optimizado no coincide con el original")
-
-        # Eliminar ficheros originales e intermedios
-        try:
-            os.remove(video_path)
-        except Exception:
-            pass
-        for f in (repaired, reduced):
+        with stages.stage("validate", inputs=[optimized]):
+            orig_dur = get_video_duration(video_path)
+            opt_dur = get_video_duration(optimized)
+            if abs(orig_dur - opt_dur) > 2:
+                raise ValueError("La duración del archivo optimizado no coincide con el original")
+
+            if cache is not None:
+                cache.put(key, optimized)
+            # Validada: se publica de una vez (nunca queda un -optimized.mkv a medias en la salida)
+            publish(optimized, final)
+
+        # Eliminar el original; los intermedios se van con el directorio de trabajo
+        with stages.stage("cleanup"):
             try:
-                os.remove(f)
+                os.remove(video_path)
             except Exception:
                 pass
 
-        history.append({"name": os.path.basename(video_path), "status": "Procesado correctamente"})
-        print("Procesado correctamente:", optimized)
+        print(f"{status}:", final)
+        return {"name": name, "status": status, "outputs": [final]}
 
     except Exception as e:
-        history.append({"name": os.path.basename(video_path), "status": f"Error: {e}"})
         print("Error procesando:", e, file=sys.stderr)
+        # Antes de borrar el directorio de trabajo: con él aún se ve el disco lleno
+        if is_disk_full(e, scratch.root) and not isinstance(e, DiskFullError):
+            raise DiskFullError(f"Sin espacio en disco: {e}") from e
         raise
+    finally:
+        budget.release(scratch.key)
+        scratch.remove()
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Procesa un video replicando server-gpu.py")
-    parser.add_argument("-i", "--input", required=True, help="Fichero de entrada (mp4/mkv/avi/...) ")
+    parser.add_argument("-i", "--input", nargs="+", action="extend", metavar="ENTRADA", help="Ficheros (mp4/mkv/avi/...), carpetas (recursivas) o globs; con más de uno se activa el modo por lotes")
+    parser.add_argument("--input-list", metavar="FICHERO", help="Fichero con una entrada por línea ('-' = stdin); activa el modo por lotes")
     parser.add_argument("-o", "--output", required=True, help="Carpeta de salida (se crean los intermedios ahí)")
-    parser.add_argument("--cq", type=int, default=27, help="Valor CQ para NVENC en paso de optimización (por defecto: 27)")
-    parser.add_argument("--crf", type=int, default=23, help="Valor CRF para libx264 si se utiliza (por defecto: 23)")
+    parser.add_argument("--cq", type=int, default=27, help="Calidad (CQ/QP) para codificadores hardware en el paso de optimización (por defecto: 27)")
+    parser.add_argument("--crf", type=int, default=23, help="Valor CRF para codificadores de CPU (libx264/libx265/libsvtav1) (por defecto: 23)")
+    parser.add_argument("--encoder", choices=sorted(BY_NAME), help="Fuerza un codificador de ffmpeg (por defecto: el más rápido que funcione en el host)")
     parser.add_argument("--reduce-bitrate", default="2M", help="Bitrate para el paso de reducción (por defecto: 2M)")
     parser.add_argument("--opt-bitrate", default="800k", help="Bitrate para el paso de optimización (por defecto: 800k)")
     parser.add_argument("--gpu", default="0", help="ID de GPU para pasar a ffmpeg (por defecto: 0)")
-    parser.add_argument("--backend", choices=["auto", "ffmpeg", "gstreamer"], default="auto", help="Backend a usar: 'auto' detecta Jetson, 'gstreamer' fuerza gst-launch-1.0, 'ffmpeg' fuerza ffmpeg/NVENC")
+    parser.add_argument("--backend", choices=["auto", "ffmpeg", "gstreamer"], default="auto", help="Backend a usar: 'auto' detecta Jetson, 'gstreamer' fuerza gst-launch-1.0, 'ffmpeg' fuerza ffmpeg con el codificador elegido por --encoder")
+    parser.add_argument("--pipeline", choices=pipelines, default="three-pass", help="'three-pass' reproduce reparar/reducir/optimizar; 'single-pass' lo hace en una sola invocación sin intermedios; 'streamed' encadena las tres pasadas por tuberías (por defecto: three-pass)")
+    parser.add_argument("--segments", type=int, default=4, help="Número de segmentos paralelos en modo chunked (por defecto: 4)")
+    parser.add_argument("--cache-dir", nargs="?", const=DEFAULT_CACHE_DIR, help=f"Activa la caché de resultados por contenido (por defecto en {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-max-gb", type=float, default=50, help="Tamaño máximo de la caché antes de expulsar entradas LRU (por defecto: 50)")
+    parser.add_argument("--pipe-format", choices=pipe_formats, default="matroska", help="Contenedor de los intermedios en modo streamed (por defecto: matroska)")
+    parser.add_argument("--target-quality", type=float, help="Busca por título el CQ/CRF de menor bitrate que alcanza esta puntuación (p. ej. 0.97 SSIM, 40 PSNR, 93 VMAF); sustituye a --cq/--crf")
+    parser.add_argument("--metric", choices=METRICS, help=f"Métrica de la búsqueda por título (por defecto: ssim; objetivos por defecto {DEFAULT_TARGETS})")
+    parser.add_argument("--sample-clips", type=int, default=3, help="Clips de muestra para la búsqueda por título (por defecto: 3)")
+    parser.add_argument("--sample-seconds", type=float, default=4.0, help="Duración de cada clip de muestra en segundos (por defecto: 4)")
+    parser.add_argument("--search-jobs", type=int, default=4, help=f"Codificaciones de muestra en paralelo (candidatos: {', '.join(map(str, DEFAULT_CANDIDATES))}; por defecto: 4)")
+    parser.add_argument("--metrics-json", nargs="?", const="-", metavar="FICHERO", help="Escribe el resumen de métricas por etapa en JSON (sin fichero: en stdout)")
+    parser.add_argument("--always-encode", action="store_true", help="Recodifica siempre, aunque la entrada ya cumpla el perfil de salida (por defecto se remuxa con -c copy)")
+    parser.add_argument("--abr", action="store_true", help="Genera una escalera de calidades en HLS/DASH (un solo decode) en lugar del 1280x720 único")
+    parser.add_argument("--ladder", default=abr.DEFAULT_LADDER, help=f"Peldaños ABR altura:bitrate separados por comas (por defecto: {abr.DEFAULT_LADDER}); se omiten los que superan la fuente")
+    parser.add_argument("--abr-formats", default="hls", help=f"Formatos ABR separados por comas: {', '.join(abr.ABR_FORMATS)} (por defecto: hls)")
+    parser.add_argument("--segment-seconds", type=float, default=4.0, help="Duración de los segmentos HLS/DASH; los keyframes se alinean a ella (por defecto: 4)")
+    parser.add_argument("--jobs", type=int, default=1, help="Lotes: vídeos procesados a la vez, cada uno en su proceso (por defecto: 1)")
+    parser.add_argument("--max-encoder-sessions", type=int, help="Lotes: sesiones de codificador simultáneas entre todos los procesos (p. ej. 3 con NVENC de consumo; por defecto sin límite)")
+    parser.add_argument("--summary", metavar="FICHERO", help="Lotes: resumen JSON Lines con un resultado por vídeo (por defecto: <salida>/batch-<fecha>.jsonl)")
+    parser.add_argument("--min-free-gb", type=float, default=1.0, help="Espacio que los trabajos dejan siempre libre en el volumen de trabajo; un vídeo solo empieza si lo que va a escribir cabe (por defecto: 1)")
+    parser.add_argument("--disk-retries", type=int, default=1, help="Lotes: veces que se reintenta un vídeo que falló por disco lleno (por defecto: 1)")
+    parser.add_argument("--scratch-dir", metavar="CARPETA", help=f"Directorio de trabajo de los intermedios; mejor en el mismo disco que la salida para publicar con un rename (por defecto: <salida>/{SCRATCH_DIRNAME})")
     args = parser.parse_args()
 
-    if os.path.splitext(args.input)[1].lower() not in valid_extensions:
+    if not args.input and not args.input_list:
+        parser.error("se necesita -i/--input o --input-list")
+    if args.jobs < 1 or (args.max_encoder_sessions is not None and args.max_encoder_sessions < 1):
+        parser.error("--jobs y --max-encoder-sessions deben ser >= 1")
+    single = not args.input_list and len(args.input) == 1 and not os.path.isdir(args.input[0]) and not any(c in args.input[0] for c in "*?[")
+
+    if single and os.path.splitext(args.input[0])[1].lower() not in valid_extensions:
         print("Extensión no válida.", file=sys.stderr)
         sys.exit(2)
 
+    abr_formats: Sequence[str] = ()
+    if args.abr:
+        try:
+            abr.parse_ladder(args.ladder)
+            abr_formats = abr.parse_formats(args.abr_formats)
+        except ValueError as e:
+            parser.error(str(e))
+
     os.makedirs(args.output, exist_ok=True)
+    options = dict(cq=args.cq, crf=args.crf, reduce_bitrate=args.reduce_bitrate, opt_bitrate=args.opt_bitrate, gpu=args.gpu, backend=args.backend, pipeline=args.pipeline, pipe_format=args.pipe_format, segments=args.segments, encoder=args.encoder, target_quality=args.target_quality, metric=args.metric, sample_clips=args.sample_clips, sample_seconds=args.sample_seconds, search_jobs=args.search_jobs, always_encode=args.always_encode, abr_ladder=args.ladder if args.abr else None, abr_formats=abr_formats, segment_seconds=args.segment_seconds, scratch_dir=args.scratch_dir, min_free_gb=args.min_free_gb)
+
+    # Restos de ejecuciones interrumpidas (los directorios en uso están bloqueados y se respetan)
+    scratch_root = args.scratch_dir or os.path.join(args.output, SCRATCH_DIRNAME)
+    sweep_scratch(scratch_root)
 
+    if not single:
+        sys.exit(main_batch(args, options))
+
+    cache = ResultCache(args.cache_dir, int(args.cache_max_gb * 1024**3)) if args.cache_dir else None
+    stages = StageMetrics()
     try:
-        process_video(args.input, args.output, cq=args.cq, crf=args.crf, reduce_bitrate=args.reduce_bitrate, opt_bitrate=args.opt_bitrate, gpu=args.gpu, backend=args.backend)
+        process_video(args.input[0], args.output, cache=cache, metrics=stages, **options)
     except FileNotFoundError:
-        print(f"Fichero no encontrado: {args.input}", file=sys.stderr)
+        print(f"Fichero no encontrado: {args.input[0]}", file=sys.stderr)
         sys.exit(2)
+    except DiskFullError:
+        sys.exit(EXIT_RETRY)
     except Exception:
         sys.exit(1)
+    finally:
+        # También si falla: la última etapa del resumen es la que falló (ok: false)
+        if args.metrics_json:
+            write_metrics(stages.summary(), args.metrics_json)
+        remove_if_empty(scratch_root)
+
+
+def main_batch(args: argparse.Namespace, options: dict) -> int:
+    """Modo por lotes (ver `batch.py`); devuelve el código de salida."""
+    inputs = list(args.input or [])
+    if args.input_list:
+        inputs += read_list(args.input_list)
+    try:
+        items, invalid = expand_inputs(inputs, args.output)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    for entry in invalid:
+        print("Ignorado:", entry, file=sys.stderr)
+    if not items:
+        print("No hay vídeos que procesar.", file=sys.stderr)
+        return 2
+
+    # Una sola raíz de trabajo para todo el lote, aunque las salidas vayan a subcarpetas
+    options["scratch_dir"] = options["scratch_dir"] or os.path.join(args.output, SCRATCH_DIRNAME)
+
+    # El codificador se elige (y se prueba) una vez aquí, no en cada proceso del pool
+    if options["backend"] == "ffmpeg" or (options["backend"] == "auto" and not is_jetson()):
+        options["encoder"] = options["encoder"] or best_encoder().name
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    summary_path = args.summary or os.path.join(args.output, f"batch-{stamp}.jsonl")
+    log_dir = os.path.splitext(summary_path)[0] + "-logs"
+    print(f"{len(items)} vídeos, {args.jobs} a la vez; resumen en {summary_path}, logs en {log_dir}", file=sys.stderr)
+    try:
+        records = run_batch(
+            items, process_video,
+            options=options,
+            summary_path=summary_path,
+            log_dir=log_dir,
+            jobs=args.jobs,
+            max_encoder_sessions=args.max_encoder_sessions,
+            cache_conf=(args.cache_dir, int(args.cache_max_gb * 1024**3)) if args.cache_dir else None,
+            disk_retries=args.disk_retries,
+        )
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        remove_if_empty(options["scratch_dir"])
+    if args.metrics_json:
+        write_metrics([{k: r.get(k) for k in ("input", "encoder", "wall_s", "cpu_s", "stages")} for r in records], args.metrics_json)
+    failed = [r for r in records if not r["ok"]]
+    if failed and all(r.get("retryable") for r in failed):
+        return EXIT_RETRY  # solo fallos por disco lleno: se puede relanzar tal cual
+    return 1 if failed else 0
+
+
+def sweep_scratch(root: str) -> None:
+    removed = sweep(root)
+    if removed:
+        print(f"Eliminados {removed} directorios de trabajo huérfanos en {root}", file=sys.stderr)
+    remove_if_empty(root)
+
+
+def write_metrics(summary: object, path: str) -> None:
+    text = json.dumps(summary, indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w") as fh:
+            fh.write(text + "\n")
 
 
 if __name__ == "__main__":
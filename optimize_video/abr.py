@@ -0,0 +1,228 @@
+"""Escalera ABR (varias resoluciones/bitrates) empaquetada en HLS y/o DASH.
+
+En lugar de ejecutar el pipeline una vez por calidad (un decode completo
+cada vez), se decodifica la fuente una sola vez y un grafo `split` reparte
+los frames entre los peldaños; cada peldaño se escala y se codifica como una
+salida más del mismo ffmpeg (los codificadores trabajan en paralelo) y el
+audio se codifica una única vez:
+
+    [0:v] split=N -> scale=-2:1080 -> enc 5000k -> .1080p.mp4
+                  -> scale=-2:720  -> enc 2800k -> .720p.mp4
+                  ...
+    [0:a] aac -> .audio.mp4
+
+Los keyframes se fuerzan cada `segment_seconds` en todos los peldaños, así
+los segmentos quedan alineados y el reproductor puede cambiar de calidad en
+cualquier corte. Después, HLS (`master.m3u8` + una lista por peldaño) y DASH
+(`manifest.mpd`) se generan con copia de streams, sin volver a codificar.
+
+Salida: `<destino>/hls/master.m3u8` y `<destino>/dash/manifest.mpd`.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .encoders import Encoder
+
+ABR_FORMATS = ("hls", "dash")
+
+# altura:bitrate de vídeo por peldaño, de mayor a menor
+DEFAULT_LADDER = "1080:5000k,720:2800k,480:1400k,360:800k"
+
+_RUNG = re.compile(r"^(\d+)p?:(\d+(?:\.\d+)?[kKmM]?)$")
+
+
+@dataclass(frozen=True)
+class Rung:
+    height: int
+    bitrate: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.height}p"
+
+
+def parse_ladder(value: str) -> Tuple[Rung, ...]:
+    """`"1080:5000k,720:2800k"` -> peldaños ordenados de mayor a menor altura."""
+    rungs: Dict[int, Rung] = {}
+    for item in (i.strip() for i in value.split(",")):
+        if not item:
+            continue
+        match = _RUNG.match(item)
+        if not match:
+            raise ValueError(f"Peldaño no válido: {item!r} (formato altura:bitrate, p. ej. 720:2800k)")
+        height = int(match.group(1))
+        if height < 2 or height % 2:
+            raise ValueError(f"La altura debe ser par: {item!r}")
+        # Sufijos como los entiende ffmpeg: 'k' kilo, 'M' mega ('m' sería mili)
+        rungs[height] = Rung(height, match.group(2).replace("K", "k").replace("m", "M"))
+    if not rungs:
+        raise ValueError("La escalera ABR está vacía")
+    return tuple(sorted(rungs.values(), key=lambda r: -r.height))
+
+
+def format_ladder(rungs: Sequence[Rung]) -> str:
+    """Inverso de `parse_ladder` (forma normalizada, p. ej. para guardarla con el trabajo)."""
+    return ",".join(f"{r.height}:{r.bitrate}" for r in rungs)
+
+
+def parse_formats(value: str) -> Tuple[str, ...]:
+    """`"hls,dash"` -> `("hls", "dash")`; lanza ValueError con formatos desconocidos."""
+    formats = []
+    for fmt in (f.strip().lower() for f in value.split(",")):
+        if not fmt:
+            continue
+        if fmt not in ABR_FORMATS:
+            raise ValueError(f"Formato ABR desconocido: {fmt} (válidos: {', '.join(ABR_FORMATS)})")
+        if fmt not in formats:
+            formats.append(fmt)
+    if not formats:
+        raise ValueError("Se necesita al menos un formato ABR")
+    return tuple(formats)
+
+
+def fit_ladder(rungs: Sequence[Rung], source_height: int) -> Tuple[Rung, ...]:
+    """Quita los peldaños por encima de la fuente (no se reescala hacia arriba); deja al menos uno."""
+    fitted = tuple(r for r in rungs if not source_height or r.height <= source_height)
+    return fitted or (min(rungs, key=lambda r: r.height),)
+
+
+@dataclass(frozen=True)
+class RungFiles:
+    """Salidas intermedias de la codificación: un MP4 por peldaño y el audio."""
+
+    videos: Tuple[str, ...]
+    audio: Optional[str]
+
+    @property
+    def paths(self) -> List[str]:
+        return [*self.videos, *([self.audio] if self.audio else [])]
+
+
+def rung_files(workdir: str, rungs: Sequence[Rung], has_audio: bool) -> RungFiles:
+    # Ocultos: los escáneres de carpetas no los toman por vídeos de entrada
+    return RungFiles(
+        tuple(os.path.join(workdir, f".{r.name}.mp4") for r in rungs),
+        os.path.join(workdir, ".audio.mp4") if has_audio else None,
+    )
+
+
+def encode_command(
+    video_path: str,
+    files: RungFiles,
+    rungs: Sequence[Rung],
+    encoder: Encoder,
+    *,
+    segment_seconds: float = 4.0,
+    source_fps: float = 0.0,
+    max_fps: float = 30.0,
+    audio_bitrate: str = "128k",
+    gpu: Optional[str] = None,
+) -> List[str]:
+    """Un único ffmpeg: decode -> split -> scale + codificación por peldaño, y el audio una vez.
+
+    Las fuentes por encima de `max_fps` (o de fps desconocidos) se bajan a `max_fps`.
+    """
+    n = len(rungs)
+    capped = not source_fps or source_fps > max_fps + 0.01
+    rate = max_fps if capped else source_fps
+    pre = f"fps={max_fps:g}," if capped else ""
+    graph = [f"[0:v]{pre}split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    for i, rung in enumerate(rungs):
+        chain = encoder.filters(f"scale=-2:{rung.height},format=yuv420p")
+        graph.append(f"[s{i}]{chain}[v{i}]")
+
+    gop = max(1, round(segment_seconds * rate))
+    cmd = ["ffmpeg", "-y", "-err_detect", "ignore_err", "-i", video_path, "-filter_complex", ";".join(graph)]
+    for i, (rung, path) in enumerate(zip(rungs, files.videos)):
+        cmd += [
+            "-map", f"[v{i}]", "-an",
+            *encoder.args(bitrate=rung.bitrate, gpu=gpu, with_filters=False),
+            # Keyframes en los mismos instantes en todos los peldaños: segmentos alineados
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds:g})",
+            "-g", str(gop), "-keyint_min", str(gop),
+            path,
+        ]
+    if files.audio:
+        cmd += ["-map", "0:a:0", "-vn", "-c:a", "aac", "-b:a", audio_bitrate, "-ac", "2", files.audio]
+    return cmd
+
+
+def hls_command(files: RungFiles, rungs: Sequence[Rung], out_dir: str, *, segment_seconds: float = 4.0) -> List[str]:
+    """HLS por copia: una lista por peldaño, el audio como grupo aparte y `master.m3u8`."""
+    cmd = ["ffmpeg", "-y"]
+    for path in files.paths:
+        cmd += ["-i", path]
+    for i in range(len(files.videos)):
+        cmd += ["-map", f"{i}:v:0"]
+    group = ""
+    if files.audio:
+        cmd += ["-map", f"{len(files.videos)}:a:0"]
+        group = ",agroup:audio"
+    streams = [f"v:{i}{group},name:{rung.name}" for i, rung in enumerate(rungs)]
+    if files.audio:
+        streams.append(f"a:0{group},name:audio")
+    for name in [r.name for r in rungs] + (["audio"] if files.audio else []):
+        os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+    return [
+        *cmd, "-c", "copy",
+        "-f", "hls",
+        "-hls_time", f"{segment_seconds:g}",
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(streams),
+        "-hls_segment_filename", os.path.join(out_dir, "%v", "seg_%05d.ts"),
+        os.path.join(out_dir, "%v", "index.m3u8"),
+    ]
+
+
+def dash_command(files: RungFiles, out_dir: str, *, segment_seconds: float = 4.0) -> List[str]:
+    """DASH por copia: un adaptation set de vídeo con todos los peldaños y otro de audio."""
+    cmd = ["ffmpeg", "-y"]
+    for path in files.paths:
+        cmd += ["-i", path]
+    for i in range(len(files.videos)):
+        cmd += ["-map", f"{i}:v:0"]
+    sets = "id=0,streams=v"
+    if files.audio:
+        cmd += ["-map", f"{len(files.videos)}:a:0"]
+        sets += " id=1,streams=a"
+    os.makedirs(out_dir, exist_ok=True)
+    return [
+        *cmd, "-c", "copy",
+        "-f", "dash",
+        "-seg_duration", f"{segment_seconds:g}",
+        "-use_template", "1",
+        "-use_timeline", "1",
+        "-adaptation_sets", sets,
+        os.path.join(out_dir, "manifest.mpd"),
+    ]
+
+
+def manifests(dest: str, formats: Sequence[str]) -> Dict[str, str]:
+    """Ruta del manifiesto de cada formato bajo `dest`."""
+    names = {"hls": os.path.join("hls", "master.m3u8"), "dash": os.path.join("dash", "manifest.mpd")}
+    return {fmt: os.path.join(dest, names[fmt]) for fmt in formats}
+
+
+def package(
+    files: RungFiles,
+    rungs: Sequence[Rung],
+    dest: str,
+    formats: Sequence[str],
+    *,
+    segment_seconds: float = 4.0,
+    run: Callable[[List[str]], object],
+) -> Dict[str, str]:
+    """Genera cada formato con copia de streams; devuelve {formato: manifiesto}."""
+    for fmt in formats:
+        if fmt == "hls":
+            run(hls_command(files, rungs, os.path.join(dest, "hls"), segment_seconds=segment_seconds))
+        else:
+            run(dash_command(files, os.path.join(dest, "dash"), segment_seconds=segment_seconds))
+    return manifests(dest, formats)
@@ -0,0 +1,300 @@
+"""Modo por lotes de la CLI: muchas entradas en un solo proceso.
+
+En lugar de un `docker run` (y un sondeo de codificadores) por vídeo, la CLI
+acepta carpetas, globs y listas de ficheros (`expand_inputs`) y los procesa
+con un pool de procesos (`run_batch`, `--jobs`):
+
+ - las sesiones de codificador simultáneas se limitan entre todos los
+   procesos del pool con un semáforo compartido (`encoder_sessions`,
+   `--max-encoder-sessions`); los pasos sin codificador (remux, validar,
+   limpiar) no lo ocupan;
+ - la salida de cada vídeo (ffmpeg incluido) va a su propio log y la
+   consola muestra un progreso consolidado;
+ - cada resultado se añade, al terminar, a un resumen JSON Lines (estado,
+   salidas, tiempos y métricas por etapa), que es el historial de la
+   ejecución;
+ - un vídeo que falla por disco lleno (`retryable`) se vuelve a lanzar
+   (`disk_retries`); para entonces la reserva de disco (`diskbudget.py`)
+   le hace esperar a que los demás liberen sitio.
+"""
+
+from __future__ import annotations
+
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from .cache import ResultCache
+from .diskbudget import is_disk_full
+from .metrics import StageMetrics
+from .watcher import VIDEO_EXTENSIONS, is_candidate, scan_videos
+
+# (semáforo, cerrojo, máximo) de sesiones de codificador en los workers del pool
+_sessions: Optional[tuple] = None
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    path: str
+    output_dir: str
+
+
+def _expand(arg: str, output_dir: str, missing: List[str]) -> Iterator[BatchItem]:
+    if os.path.isdir(arg):
+        # Se conserva la estructura de subcarpetas: dos `ep01.mkv` de temporadas distintas no chocan
+        for path in sorted(scan_videos(arg)):
+            rel = os.path.relpath(os.path.dirname(path), arg)
+            yield BatchItem(path, os.path.normpath(os.path.join(output_dir, rel)))
+    elif os.path.isfile(arg):
+        if os.path.splitext(arg)[1].lower() in VIDEO_EXTENSIONS:
+            yield BatchItem(arg, output_dir)
+        else:
+            missing.append(f"{arg} (extensión no válida)")
+    elif any(c in arg for c in "*?["):
+        # Globs entre comillas (o desde Windows, donde la shell no los expande)
+        matches = sorted(glob.glob(arg, recursive=True))
+        for match in matches:
+            if os.path.isdir(match):
+                yield from _expand(match, output_dir, missing)
+            elif is_candidate(match):
+                yield BatchItem(match, output_dir)
+        if not matches:
+            missing.append(f"{arg} (ninguna coincidencia)")
+    else:
+        missing.append(f"{arg} (no existe)")
+
+
+def read_list(path: str) -> List[str]:
+    """Entradas de un fichero de lista (una por línea; `#` comenta; `-` = stdin)."""
+    fh = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        lines = [line.strip() for line in fh]
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def expand_inputs(args: Iterable[str], output_dir: str) -> Tuple[List[BatchItem], List[str]]:
+    """Ficheros, carpetas (recursivas) y globs -> (vídeos a procesar, entradas no válidas).
+
+    Lanza ValueError si dos entradas escribirían la misma salida.
+    """
+    items: List[BatchItem] = []
+    missing: List[str] = []
+    seen = set()
+    outputs: Dict[Tuple[str, str], str] = {}
+    for arg in args:
+        for item in _expand(arg, output_dir, missing):
+            path = os.path.abspath(item.path)
+            if path in seen:
+                continue
+            seen.add(path)
+            target = (os.path.abspath(item.output_dir), os.path.splitext(os.path.basename(path))[0])
+            if target in outputs:
+                raise ValueError(f"{path} y {outputs[target]} tendrían la misma salida en {item.output_dir}")
+            outputs[target] = path
+            items.append(BatchItem(path, item.output_dir))
+    return items, missing
+
+
+@contextmanager
+def encoder_sessions(count: int = 1) -> Iterator[None]:
+    """Reserva `count` sesiones de codificador (como mucho el máximo) mientras dura el bloque.
+
+    Fuera del modo por lotes (o sin `--max-encoder-sessions`) no hace nada.
+    """
+    if _sessions is None:
+        yield
+        return
+    sem, lock, limit = _sessions
+    count = max(1, min(count, limit))
+    # Todas de una vez: dos trabajos con reservas a medias no se bloquean entre sí
+    with lock:
+        for _ in range(count):
+            sem.acquire()
+    try:
+        yield
+    finally:
+        for _ in range(count):
+            sem.release()
+
+
+def _init_worker(sessions: Optional[tuple]) -> None:
+    global _sessions
+    _sessions = sessions
+
+
+@contextmanager
+def _redirect(log_path: str) -> Iterator[None]:
+    """Envía stdout/stderr del proceso (y de sus ffmpeg) a `log_path`."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(log_path, "ab") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+
+def _run_item(process: Callable[..., dict], item: BatchItem, options: dict, cache_conf: Optional[Tuple[str, int]], log_path: str) -> dict:
+    """Worker: procesa un vídeo y devuelve su registro para el resumen."""
+    stages = StageMetrics()
+    record = {"input": item.path, "name": os.path.basename(item.path), "output_dir": item.output_dir, "log": log_path}
+    start = time.time()
+    with _redirect(log_path):
+        try:
+            os.makedirs(item.output_dir, exist_ok=True)
+            cache = ResultCache(*cache_conf) if cache_conf else None
+            record.update(process(item.path, item.output_dir, cache=cache, metrics=stages, **options))
+            record["ok"] = True
+        except Exception as e:
+            record.update(ok=False, status=f"Error: {e}", retryable=is_disk_full(e))
+    summary = stages.summary()
+    record.update(
+        started=round(start, 3),
+        wall_s=round(time.time() - start, 3),
+        cpu_s=summary["cpu_s"],
+        encoder=summary["encoder"],
+        stages=summary["stages"],
+    )
+    return record
+
+
+def _log_name(item: BatchItem, used: set) -> str:
+    stem = os.path.splitext(os.path.basename(item.path))[0]
+    name, n = stem, 1
+    while name in used:
+        n += 1
+        name = f"{stem}-{n}"
+    used.add(name)
+    return name + ".log"
+
+
+class Progress:
+    """Progreso consolidado: una línea por vídeo terminado y, en un terminal, una línea de estado."""
+
+    def __init__(self, total: int, stream: TextIO = sys.stderr) -> None:
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.start = time.time()
+        self.stream = stream
+        self.live = stream.isatty()
+
+    def _clear(self) -> None:
+        if self.live:
+            self.stream.write("\r\033[K")
+
+    def finished(self, record: dict) -> None:
+        self.done += 1
+        self.failed += not record["ok"]
+        self._clear()
+        mark = "OK " if record["ok"] else "ERR"
+        self.stream.write(f"[{self.done}/{self.total}] {mark} {record['name']} ({record['wall_s']:.1f} s): {record['status']}\n")
+        self.stream.flush()
+
+    def retrying(self, record: dict) -> None:
+        self._clear()
+        self.stream.write(f"[{self.done}/{self.total}] ... {record['name']}: {record['status']} (se reintenta)\n")
+        self.stream.flush()
+
+    def update(self, running: Sequence[str]) -> None:
+        if not self.live:
+            return
+        elapsed = int(time.time() - self.start)
+        names = ", ".join(running[:3]) + (f" (+{len(running) - 3})" if len(running) > 3 else "")
+        line = f"[{self.done}/{self.total}] {elapsed // 60:02d}:{elapsed % 60:02d} errores: {self.failed} | en curso: {names or '-'}"
+        self._clear()
+        self.stream.write(line[:200])
+        self.stream.flush()
+
+    def close(self) -> None:
+        self._clear()
+        elapsed = time.time() - self.start
+        self.stream.write(f"{self.done - self.failed} correctos, {self.failed} con error, {self.total - self.done} sin procesar en {elapsed:.1f} s\n")
+        self.stream.flush()
+
+
+def run_batch(
+    items: Sequence[BatchItem],
+    process: Callable[..., dict],
+    *,
+    options: dict,
+    summary_path: str,
+    log_dir: str,
+    jobs: int = 1,
+    max_encoder_sessions: Optional[int] = None,
+    cache_conf: Optional[Tuple[str, int]] = None,
+    disk_retries: int = 1,
+) -> List[dict]:
+    """Procesa `items` con `jobs` procesos; cada resultado se añade a `summary_path` (JSON Lines).
+
+    `process(path, output_dir, cache=..., metrics=..., **options)` debe devolver
+    un dict con al menos `status` y lanzar una excepción si falla. Los fallos
+    por disco lleno se relanzan hasta `disk_retries` veces.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    ctx = multiprocessing.get_context()
+    sessions = None
+    if max_encoder_sessions:
+        sessions = (ctx.BoundedSemaphore(max_encoder_sessions), ctx.Lock(), max_encoder_sessions)
+
+    records: List[dict] = []
+    progress = Progress(len(items))
+    used: set = set()
+    logs = {item: os.path.join(log_dir, _log_name(item, used)) for item in items}
+    retries: Dict[BatchItem, int] = {}
+    with open(summary_path, "a", encoding="utf-8") as summary, ProcessPoolExecutor(
+        max_workers=max(1, jobs), mp_context=ctx, initializer=_init_worker, initargs=(sessions,)
+    ) as pool:
+        pending: Dict[Future, BatchItem] = {
+            pool.submit(_run_item, process, item, options, cache_conf, logs[item]): item
+            for item in items
+        }
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:  # el worker murió (p. ej. sin memoria)
+                        record = {"input": item.path, "name": os.path.basename(item.path), "output_dir": item.output_dir,
+                                  "ok": False, "status": f"Error: {e}", "wall_s": 0.0, "retryable": is_disk_full(e)}
+                    if record.get("retryable") and retries.get(item, 0) < disk_retries:
+                        # Al final de la cola: la reserva de disco le hará esperar a que haya sitio
+                        retries[item] = retries.get(item, 0) + 1
+                        progress.retrying(record)
+                        pending[pool.submit(_run_item, process, item, options, cache_conf, logs[item])] = item
+                        continue
+                    record["attempts"] = retries.get(item, 0) + 1
+                    records.append(record)
+                    summary.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    summary.flush()
+                    progress.finished(record)
+                progress.update([os.path.basename(item.path) for f, item in pending.items() if f.running()])
+        except KeyboardInterrupt:
+            # Lo que no ha empezado no se lanza; lo que está en curso recibe también el Ctrl+C
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            progress.close()
+    return records
@@ -0,0 +1,216 @@
+"""Caché persistente de resultados indexada por contenido.
+
+La clave combina una huella rápida del fichero de entrada (tamaño + hash de la
+cabecera, la cola y varios trozos intermedios, sin leer el vídeo completo) con
+los parámetros de codificación. Así se detectan copias renombradas, re-subidas
+por `/process-file` o ficheros que vuelven a caer en la carpeta vigilada.
+
+Cada entrada es un fichero `<clave><ext>` dentro del directorio de la caché. La
+marca LRU es el mtime de un fichero vacío `.lru-<clave><ext>` a su lado y no el
+de la entrada: esta comparte inodo (hardlink) con las salidas publicadas, y
+tocarla cambiaría también la fecha de los ficheros del usuario. La expulsión
+borra los menos usados hasta quedar por debajo de `max_bytes`. Las
+publicaciones son atómicas (`os.replace`), por lo que varios procesos pueden
+compartir el mismo directorio (y expulsar entradas mientras otro las recorre).
+
+`stats()` no recorre el directorio: lee contadores que `put` actualiza y que
+cada expulsión (que ya lo recorre) vuelve a sincronizar con lo que hay en disco,
+incluido lo que hayan publicado o borrado otros procesos.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+HEAD_BYTES = 1024 * 1024
+SAMPLE_BYTES = 256 * 1024
+SAMPLES = 8
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "video-optimizer", "results")
+DEFAULT_MAX_BYTES = 50 * 1024**3
+
+LRU_PREFIX = ".lru-"
+
+
+def fingerprint(path: str) -> str:
+    """Huella de `path`: tamaño + cabecera + cola + `SAMPLES` trozos repartidos."""
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str(size).encode())
+    with open(path, "rb") as fh:
+        if size <= 2 * HEAD_BYTES + SAMPLES * SAMPLE_BYTES:
+            # Fichero pequeño: se hashea entero
+            for chunk in iter(lambda: fh.read(HEAD_BYTES), b""):
+                h.update(chunk)
+            return h.hexdigest()
+        h.update(fh.read(HEAD_BYTES))
+        span = size - 2 * HEAD_BYTES - SAMPLE_BYTES
+        for i in range(SAMPLES):
+            fh.seek(HEAD_BYTES + span * (i + 1) // (SAMPLES + 1))
+            h.update(fh.read(SAMPLE_BYTES))
+        fh.seek(size - HEAD_BYTES)
+        h.update(fh.read(HEAD_BYTES))
+    return h.hexdigest()
+
+
+def cache_key(path: str, params: Dict[str, object]) -> str:
+    """Clave de caché: huella del contenido + parámetros de codificación."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(fingerprint(path).encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ResultCache:
+    """Directorio de resultados con expulsión LRU por bytes totales y contadores de aciertos."""
+
+    def __init__(self, root: str = DEFAULT_DIR, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._count: Optional[int] = None  # entradas y bytes; None hasta el primer recorrido
+        self._bytes = 0
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultCache"]:
+        """RESULT_CACHE_DIR (vacío desactiva la caché) y RESULT_CACHE_MAX_GB."""
+        root = os.environ.get("RESULT_CACHE_DIR", DEFAULT_DIR)
+        if not root:
+            return None
+        max_gb = float(os.environ.get("RESULT_CACHE_MAX_GB", DEFAULT_MAX_BYTES / 1024**3))
+        return cls(root, int(max_gb * 1024**3))
+
+    def _entry(self, key: str, dest: str) -> str:
+        return os.path.join(self.root, key + os.path.splitext(dest)[1])
+
+    def _marker(self, entry: str) -> str:
+        return os.path.join(self.root, LRU_PREFIX + os.path.basename(entry))
+
+    def _touch(self, entry: str) -> None:
+        """Refresca la marca LRU de `entry` sin tocar su inodo (compartido con las salidas)."""
+        marker = self._marker(entry)
+        with open(marker, "a"):
+            pass
+        os.utime(marker)
+
+    def _last_used(self, entry: str, st: os.stat_result) -> float:
+        try:
+            return os.stat(self._marker(entry)).st_mtime
+        except OSError:
+            return st.st_mtime  # entrada sin marca: cuenta su fecha de publicación
+
+    def get(self, key: str, *dests: str) -> bool:
+        """Materializa en `dests` (hardlink o copia) las salidas cacheadas de `key`.
+
+        Solo hay acierto si existen todas; en ese caso se refresca su marca LRU.
+        """
+        entries = [self._entry(key, d) for d in dests]
+        if not all(os.path.exists(e) for e in entries):
+            with self._lock:
+                self.misses += 1
+            return False
+        try:
+            for entry, dest in zip(entries, dests):
+                if os.path.exists(dest):
+                    os.remove(dest)
+                _link_or_copy(entry, dest)
+                self._touch(entry)
+        except OSError:
+            # Expulsada por otro proceso entre la comprobación y el enlace
+            for dest in dests:
+                if os.path.exists(dest):
+                    os.remove(dest)
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key: str, *srcs: str) -> None:
+        """Publica `srcs` bajo `key` y expulsa entradas antiguas si se supera el límite."""
+        for src in srcs:
+            entry = self._entry(key, src)
+            fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+            os.close(fd)
+            os.remove(tmp)
+            _link_or_copy(src, tmp)
+            size = os.path.getsize(tmp)
+            try:
+                replaced: Optional[int] = os.path.getsize(entry)
+            except OSError:
+                replaced = None
+            os.replace(tmp, entry)
+            self._touch(entry)
+            with self._lock:
+                if self._count is not None:
+                    self._count += replaced is None
+                    self._bytes += size - (replaced or 0)
+        self.evict()
+
+    def _entries(self) -> List[Tuple[str, int, float]]:
+        """(ruta, tamaño, último uso) de cada entrada; las que otro proceso expulsa a la vez se saltan."""
+        entries = []
+        with os.scandir(self.root) as it:
+            for e in it:
+                if e.name.startswith("."):  # temporales y marcas LRU
+                    continue
+                try:
+                    if not e.is_file():
+                        continue
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((e.path, st.st_size, self._last_used(e.path, st)))
+        return entries
+
+    def evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _path, size, _used in entries)
+        count = len(entries)
+        for path, size, _used in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # ya la expulsó otro proceso: su espacio también está libre
+            except OSError:
+                continue
+            total -= size
+            count -= 1
+            try:
+                os.remove(self._marker(path))
+            except OSError:
+                pass
+        with self._lock:
+            self._count, self._bytes = count, total
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self._count is None:
+                entries = self._entries()
+                self._count, self._bytes = len(entries), sum(size for _path, size, _used in entries)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": self._count,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
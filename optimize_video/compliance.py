@@ -0,0 +1,93 @@
+"""Decisión copia/recodificación a partir de un único sondeo.
+
+Muchas entradas ya cumplen el perfil de salida (H.264 ≤1280x720 ≤30 fps,
+AAC estéreo, por debajo del bitrate objetivo). Recodificarlas gasta el
+codificador entero para obtener algo igual o peor, así que `copy_plan` mira
+el `MediaInfo` del sondeo y decide stream a stream:
+
+ - vídeo y audio conformes: remux con `-c copy -movflags faststart`;
+ - solo el audio no conforme (p. ej. AC-3 5.1): se copia el vídeo y se
+   recodifica únicamente el audio;
+ - vídeo no conforme: el pipeline completo de siempre.
+
+`CopyPlan.outcome` es el texto que se guarda en el historial, distinto del
+"Procesado correctamente" de una recodificación.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .probe import MediaInfo
+
+OUTCOME_REMUX = "Procesado correctamente (copia de streams)"
+OUTCOME_AUDIO = "Procesado correctamente (copia de vídeo, audio recodificado)"
+
+
+def parse_kbps(bitrate: str) -> float:
+    """`800k` → 800, `2M` → 2000 (kb/s)."""
+    unit = bitrate[-1:].lower()
+    value = float(bitrate[:-1]) if unit in ("k", "m") else float(bitrate) / 1000
+    return value * 1000 if unit == "m" else value
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    """Perfil de salida del pipeline; lo que lo cumple no se recodifica."""
+
+    vcodec: str = "h264"
+    max_width: int = 1280
+    max_height: int = 720
+    max_fps: float = 30.0
+    max_video_kbps: float = 800
+    pix_fmts: Tuple[str, ...] = ("yuv420p", "yuvj420p")
+    acodec: str = "aac"
+    max_channels: int = 2
+
+    @classmethod
+    def for_bitrate(cls, bitrate: str) -> "OutputProfile":
+        return cls(max_video_kbps=parse_kbps(bitrate))
+
+
+@dataclass(frozen=True)
+class CopyPlan:
+    copy_video: bool
+    copy_audio: bool               # True también si no hay audio
+    reasons: Tuple[str, ...]       # por qué no se copia algún stream
+
+    @property
+    def outcome(self) -> str:
+        return OUTCOME_REMUX if self.copy_audio else OUTCOME_AUDIO
+
+    def args(self, audio_args: Optional[List[str]] = None) -> List[str]:
+        """Mapeo y códecs para el remux (primer vídeo y primer audio, como ffmpeg por defecto)."""
+        audio = ["-c:a", "copy"] if self.copy_audio else (audio_args or ["-c:a", "aac", "-ac", "2"])
+        return ["-map", "0:v:0", "-map", "0:a:0?", "-c:v", "copy", *audio, "-movflags", "faststart"]
+
+
+def copy_plan(info: MediaInfo, profile: OutputProfile = OutputProfile()) -> CopyPlan:
+    reasons = []
+    video = info.video
+    if video is None:
+        return CopyPlan(False, False, ("sin vídeo",))
+    if video.codec_name != profile.vcodec:
+        reasons.append(f"códec de vídeo {video.codec_name}")
+    if video.width > profile.max_width or video.height > profile.max_height:
+        reasons.append(f"resolución {video.width}x{video.height}")
+    if not video.fps or video.fps > profile.max_fps + 0.01:
+        reasons.append(f"{video.fps:.2f} fps")
+    if video.pix_fmt and video.pix_fmt not in profile.pix_fmts:
+        reasons.append(f"formato de píxel {video.pix_fmt}")
+    # Bitrate del stream; si el contenedor no lo da, el total menos el audio
+    audio = info.audio
+    video_bps = video.bit_rate or max(0, info.bit_rate - (audio.bit_rate if audio else 0))
+    if not video_bps or video_bps / 1000 > profile.max_video_kbps:
+        reasons.append(f"bitrate de vídeo {video_bps / 1000:.0f} kb/s" if video_bps else "bitrate desconocido")
+    copy_video = not reasons
+
+    copy_audio = True
+    if audio is not None and (audio.codec_name != profile.acodec or audio.channels > profile.max_channels):
+        copy_audio = False
+        reasons.append(f"audio {audio.codec_name} {audio.channels} canales")
+    return CopyPlan(copy_video, copy_audio, tuple(reasons))
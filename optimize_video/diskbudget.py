@@ -0,0 +1,299 @@
+"""Presupuesto de disco: un trabajo solo arranca si lo que va a escribir cabe.
+
+Cada trabajo estima lo que ocupará en disco (`estimate_bytes`) a partir del
+bitrate y la duración sondeados: en tres pasadas, la copia reparada (≈ la
+fuente) más la reducida y la optimizada; por tuberías o en una pasada, solo
+la salida; por segmentos, los trozos copiados más los codificados y la unión;
+en ABR, todos los peldaños más su empaquetado.
+
+La reserva se hace contra el volumen del directorio de trabajo
+(`DiskBudget`). Las reservas de todos los procesos del nodo que escriben en
+ese volumen (hilos de un servidor, procesos del modo por lotes, workers Ray),
+sea cual sea su raíz de `scratch.py` (cada carpeta de vídeos tiene la suya),
+se apuntan en un único registro por volumen, `disk-<host>-<st_dev>.json` en
+`DISK_BUDGET_DIR` (por defecto ~/.cache/video-optimizer/budget), con `flock`;
+y un trabajo se admite solo si
+
+    libre (shutil.disk_usage) - mínimo libre - lo que aún les falta por escribir a los demás >= su estimación
+
+donde lo que le falta a cada trabajo en curso es su reserva menos lo que ya
+ocupa su directorio de trabajo. Si no cabe se espera a que terminen otros;
+si no cabe ni sin otros trabajos, falla con `DiskFullError`.
+
+Un fallo por disco lleno (ENOSPC, cuota, o un ffmpeg que muere con el disco
+sin espacio) se reconoce con `is_disk_full`: los servidores y la CLI lo
+tratan como reintentable en lugar de como un error más.
+"""
+
+from __future__ import annotations
+
+import errno
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from .probe import MediaInfo
+from .scratch import in_use
+
+try:
+    import fcntl
+except ImportError:  # Windows: el registro solo se protege entre hilos
+    fcntl = None
+
+DEFAULT_LEDGER_DIR = os.path.join(os.path.expanduser("~"), ".cache", "video-optimizer", "budget")
+
+# Espacio que nunca se reserva (el sistema y los ficheros que no son trabajos)
+DEFAULT_MIN_FREE = 1024**3
+
+# Cada cuánto se vuelve a mirar el disco mientras un trabajo espera sitio
+POLL_SECONDS = 5.0
+
+# Margen sobre la estimación (cabeceras, VBR por encima del objetivo)
+MARGIN = 1.15
+
+# Audio AAC estéreo que acompaña a cada salida
+AUDIO_BPS = 192_000
+
+# Con menos de esto libre, un ffmpeg que falla se da por fallo de disco lleno
+LOW_SPACE = 64 * 1024**2
+
+DISK_FULL_MESSAGES = ("No space left on device", "Disk quota exceeded")
+
+_BITRATE = re.compile(r"^(\d+(?:\.\d+)?)([kKM]?)$")
+_lock = threading.Lock()
+
+
+class DiskFullError(OSError):
+    """El trabajo no cabe en el volumen aunque no haya nada más en curso."""
+
+    def __init__(self, message: str) -> None:
+        super().__init__(errno.ENOSPC, message)
+
+
+def bitrate_bps(value: str) -> float:
+    """`"800k"` -> 800000.0, `"2M"` -> 2000000.0 (sufijos de ffmpeg)."""
+    match = _BITRATE.match(value.strip())
+    if not match:
+        raise ValueError(f"Bitrate no válido: {value!r}")
+    return float(match.group(1)) * {"": 1, "k": 1e3, "K": 1e3, "M": 1e6}[match.group(2)]
+
+
+def estimate_bytes(
+    info: Optional[MediaInfo],
+    pipeline: str = "three-pass",
+    *,
+    size: int = 0,
+    reduce_bitrate: str = "2M",
+    opt_bitrate: str = "800k",
+    ladder: Sequence[str] = (),
+    outputs: int = 1,
+) -> int:
+    """Bytes que escribirá un trabajo en `pipeline` (three-pass, single-pass, streamed, chunked, remux, abr).
+
+    `outputs` es el número de contenedores de entrega de la salida final. Sin
+    sondeo (o sin duración) cada fichero se estima del tamaño de la fuente.
+    """
+    duration = info.duration if info is not None else 0.0
+    source = float(info.bit_rate * duration / 8 if info is not None and info.bit_rate and duration else
+                   (info.size if info is not None and info.size else size))
+
+    def encoded(bitrate: str) -> float:
+        return (bitrate_bps(bitrate) + AUDIO_BPS) * duration / 8 if duration else source
+
+    final = encoded(opt_bitrate) * outputs
+    if pipeline == "three-pass":
+        total = source + encoded(reduce_bitrate) + final
+    elif pipeline == "chunked":
+        total = source + encoded(opt_bitrate) + final  # trozos copiados, trozos codificados y la unión
+    elif pipeline == "remux":
+        total = source * outputs
+    elif pipeline == "abr":
+        total = 2 * sum(encoded(b) for b in ladder)  # peldaños y sus segmentos HLS/DASH
+    else:  # single-pass, streamed: los intermedios no tocan el disco
+        total = final
+    return int(total * MARGIN)
+
+
+def _du(path: str) -> int:
+    total = 0
+    for dirpath, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class DiskBudget:
+    """Reservas de disco de los trabajos cuyo directorio de trabajo cuelga de `root`.
+
+    El registro es el del volumen de `root`, compartido con las demás raíces
+    del mismo volumen; cada reserva se apunta por la ruta absoluta del
+    directorio de trabajo.
+    """
+
+    def __init__(
+        self, root: str, min_free: int = DEFAULT_MIN_FREE, poll: float = POLL_SECONDS, ledger_dir: Optional[str] = None
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.min_free = min_free
+        self.poll = poll
+        self.ledger_dir = ledger_dir or DEFAULT_LEDGER_DIR
+        self._ledger: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, root: str) -> "DiskBudget":
+        """`DISK_MIN_FREE_GB` (por defecto 1): espacio que los trabajos dejan siempre libre; `DISK_BUDGET_DIR`: registros."""
+        return cls(
+            root, int(float(os.environ.get("DISK_MIN_FREE_GB", "1")) * 1024**3),
+            ledger_dir=os.environ.get("DISK_BUDGET_DIR") or None,
+        )
+
+    @property
+    def ledger(self) -> str:
+        """Registro del volumen de `root` (la raíz tiene que existir la primera vez)."""
+        if self._ledger is None:
+            volume = os.stat(self.root).st_dev
+            self._ledger = os.path.join(self.ledger_dir, f"disk-{socket.gethostname()}-{volume}.json")
+        return self._ledger
+
+    def _locked(self, update: Callable[[Dict[str, int]], bool]) -> bool:
+        """Ejecuta `update` sobre las reservas con el registro bloqueado; devuelve lo que devuelva."""
+        with _lock:
+            os.makedirs(self.ledger_dir, exist_ok=True)
+            fd = os.open(self.ledger, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                with os.fdopen(os.dup(fd), "r+", encoding="utf-8") as fh:
+                    try:
+                        reservations = json.loads(fh.read() or "{}")
+                    except ValueError:
+                        reservations = {}
+                    # Reservas de trabajos que ya no tienen su directorio bloqueado (murieron)
+                    reservations = {k: v for k, v in reservations.items() if in_use(k)}
+                    changed = update(reservations)
+                    fh.seek(0)
+                    fh.truncate()
+                    fh.write(json.dumps(reservations))
+                return changed
+            finally:
+                os.close(fd)
+
+    def _usage(self, reservations: Dict[str, int], exclude: str) -> Tuple[int, int]:
+        """(lo que aún les falta por escribir a los demás, lo que ya ocupan sus directorios de trabajo)"""
+        pending = written = 0
+        for path, n in reservations.items():
+            if path == exclude:
+                continue
+            # Lo ya escrito ocupa disco (y sale de `free`): solo cuenta lo que falta por escribir
+            used = _du(path)
+            pending += max(0, n - used)
+            written += used
+        return pending, written
+
+    def acquire(self, key: str, nbytes: int, *, on_wait: Optional[Callable[[int], None]] = None) -> None:
+        """Reserva `nbytes` para el trabajo `key` (su directorio de trabajo, ya abierto); espera si no caben.
+
+        `on_wait(libres)` se llama al empezar a esperar. Lanza DiskFullError si
+        no cabrían ni cuando terminen los demás trabajos y liberen sus directorios.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        job_dir = os.path.join(self.root, key)
+        waiting = False
+        while True:
+            result: Dict[str, int] = {}
+
+            def admit(reservations: Dict[str, int]) -> bool:
+                free = shutil.disk_usage(self.root).free - self.min_free
+                pending, written = self._usage(reservations, job_dir)
+                result.update(free=free, reclaimable=written)
+                if nbytes <= free - pending:
+                    reservations[job_dir] = nbytes
+                    return True
+                return False
+
+            if self._locked(admit):
+                return
+            if nbytes > result["free"] + result["reclaimable"]:
+                raise DiskFullError(
+                    f"No hay espacio en {self.root}: el trabajo necesita {nbytes / 1024**3:.1f} GB "
+                    f"y quedan {max(0, result['free']) / 1024**3:.1f} GB"
+                )
+            if not waiting and on_wait is not None:
+                on_wait(result["free"])
+            waiting = True
+            time.sleep(self.poll)
+
+    def release(self, key: str) -> None:
+        job_dir = os.path.join(self.root, key)
+
+        def drop(reservations: Dict[str, int]) -> bool:
+            return reservations.pop(job_dir, None) is not None
+
+        try:
+            self._locked(drop)
+        except OSError:
+            pass  # la raíz nunca llegó a existir: no hay nada reservado
+
+
+class DiskRetries:
+    """Reintentos por disco lleno de cada entrada: como mucho `limit`, separados `delay` segundos."""
+
+    def __init__(self, limit: int = 3, delay: float = 300.0) -> None:
+        self.limit = limit
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._attempts: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "DiskRetries":
+        """`DISK_RETRIES` (por defecto 3) y `DISK_RETRY_DELAY` en segundos (por defecto 300)."""
+        return cls(int(os.environ.get("DISK_RETRIES", "3")), float(os.environ.get("DISK_RETRY_DELAY", "300")))
+
+    def next(self, path: str) -> Optional[int]:
+        """Número del próximo reintento de `path`, o None si ya se agotaron (y se olvida la cuenta)."""
+        with self._lock:
+            attempt = self._attempts.get(path, 0) + 1
+            if attempt > self.limit:
+                self._attempts.pop(path, None)
+                return None
+            self._attempts[path] = attempt
+            return attempt
+
+    def clear(self, path: str) -> None:
+        with self._lock:
+            self._attempts.pop(path, None)
+
+
+def is_disk_full(exc: BaseException, path: Optional[str] = None) -> bool:
+    """¿Falló por falta de espacio? Mira la cadena de excepciones y, si es un ffmpeg, el disco de `path`."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, OSError) and exc.errno in (errno.ENOSPC, errno.EDQUOT):
+            return True
+        text = str(exc)
+        if isinstance(exc, subprocess.CalledProcessError):
+            for extra in (exc.stderr, exc.output):
+                if isinstance(extra, bytes):
+                    extra = extra.decode("utf-8", "replace")
+                text += f"\n{extra or ''}"
+        if any(m in text for m in DISK_FULL_MESSAGES):
+            return True
+        if isinstance(exc, subprocess.CalledProcessError) and path:
+            # ffmpeg sin stderr capturado: solo se ve un código de salida
+            try:
+                if shutil.disk_usage(path).free < LOW_SPACE:
+                    return True
+            except OSError:
+                pass
+        exc = exc.__cause__ or exc.__context__
+    return False
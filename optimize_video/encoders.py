@@ -0,0 +1,334 @@
+"""Registro de codificadores de vídeo disponibles en el host.
+
+Cada nodo puede tener una GPU NVIDIA (NVENC), una Jetson (nvmpi), una iGPU
+Intel/AMD (VAAPI, QSV) o solo CPU. `EncoderRegistry` lo averigua una única
+vez: lista los codificadores con `ffmpeg -encoders`, hace una codificación de
+prueba de unos pocos frames con cada candidato y guarda el resultado en disco
+por host (invalidado si cambia el binario de ffmpeg). Los pipelines piden
+`best_encoder()` y construyen sus argumentos con `Encoder.args(...)`, que
+traduce una calidad en escala CQ/CRF (0-51) y un bitrate al control de tasa de
+cada familia.
+
+También se guardan aquí, con la misma caché, las comprobaciones de plugins de
+GStreamer (`gst_has`), que antes lanzaban `gst-inspect-1.0` por cada vídeo.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "video-optimizer")
+VAAPI_DEVICE = os.environ.get("VAAPI_DEVICE", "/dev/dri/renderD128")
+PROBE_TIMEOUT = 30
+
+# Control de tasa de la codificación de prueba: el de los pipelines (calidad con
+# techo de bitrate), así un driver sin ese modo (p. ej. VAAPI sin QVBR) no se elige
+PROBE_SETTINGS = {"quality": 30, "bitrate": "1M"}
+
+
+@dataclass(frozen=True)
+class Encoder:
+    name: str       # nombre del codificador en ffmpeg (h264_nvenc, libx264, ...)
+    family: str     # nvenc | nvmpi | vaapi | qsv | software
+    codec: str      # h264 | hevc | av1
+
+    @property
+    def hardware(self) -> bool:
+        return self.family != "software"
+
+    def filters(self, vf: Optional[str] = None) -> Optional[str]:
+        """Cadena `-vf` con la subida a superficie hardware que necesite la familia."""
+        if self.family == "vaapi":
+            return f"{vf},format=nv12,hwupload" if vf else "format=nv12,hwupload"
+        if self.family == "qsv":
+            return f"{vf},format=nv12" if vf else "format=nv12"
+        return vf
+
+    def args(
+        self,
+        *,
+        quality: Optional[int] = None,
+        bitrate: Optional[str] = None,
+        vf: Optional[str] = None,
+        preset: str = "fast",
+        gpu: Optional[str] = None,
+        with_filters: bool = True,
+    ) -> List[str]:
+        """Argumentos de vídeo: filtros, codificador y control de tasa.
+
+        `quality` va en escala CQ/CRF de H.264 (0-51, menor es mejor); `bitrate`
+        es el objetivo (`800k`, `2M`). Con ambos, en todas las familias la
+        calidad manda y el bitrate es el techo (`-maxrate`, búfer del doble):
+        NVENC (CQ), VAAPI (QVBR), QSV (QVBR), libx264/libx265 y libsvtav1 (CRF
+        limitado). Excepciones: QSV solo elige QVBR si el techo es distinto del
+        objetivo, así que el techo es el doble del bitrate; nvmpi no tiene modo
+        de calidad y codifica siempre en VBR al bitrate.
+        Con `with_filters=False` no se emite `-vf`: el filtrado (incluida la
+        subida de `filters`) va en un `-filter_complex` del llamador.
+        """
+        out: List[str] = []
+        if self.family == "vaapi":
+            # Opción global: ffmpeg la acepta en cualquier posición
+            out += ["-vaapi_device", VAAPI_DEVICE]
+        filters = self.filters(vf) if with_filters else None
+        if filters:
+            out += ["-vf", filters]
+        out += ["-c:v", self.name]
+
+        if self.family == "nvenc":
+            out += ["-preset", preset]
+            if quality is not None:
+                out += ["-cq", str(quality)]
+            if bitrate:
+                out += ["-b:v", bitrate]
+                if quality is not None:
+                    out += _cap(bitrate)
+            elif quality is not None:
+                out += ["-b:v", "0"]  # CQ puro: sin esto NVENC aplica su bitrate por defecto
+            if gpu is not None:
+                out += ["-gpu", str(gpu)]
+        elif self.family == "nvmpi":
+            # nvmpi solo tiene control por bitrate: la calidad se ignora
+            out += ["-preset", preset, "-rc", "vbr", "-b:v", bitrate or "2M"]
+        elif self.family == "vaapi":
+            if quality is not None and bitrate:
+                out += ["-rc_mode", "QVBR", "-global_quality", str(quality), "-b:v", bitrate, *_cap(bitrate)]
+            elif quality is not None:
+                out += ["-rc_mode", "CQP", "-qp", str(quality)]
+            elif bitrate:
+                out += ["-b:v", bitrate]
+        elif self.family == "qsv":
+            out += ["-preset", preset]
+            if quality is not None and bitrate:
+                # Con techo == objetivo QSV elegiría CBR
+                out += ["-global_quality", str(quality), "-b:v", bitrate, *_cap(_double(bitrate))]
+            elif quality is not None:
+                out += ["-global_quality", str(quality)]
+            elif bitrate:
+                out += ["-b:v", bitrate]
+        elif self.name == "libsvtav1":
+            out += ["-preset", "8" if preset in ("fast", "faster", "veryfast") else "6"]
+            if quality is not None:
+                out += ["-crf", str(min(63, round(quality * 63 / 51)))]
+                if bitrate:
+                    out += _cap(bitrate)  # CRF limitado (max_bit_rate de SVT-AV1)
+            elif bitrate:
+                out += ["-b:v", bitrate]
+        else:
+            # libx264 / libx265: CRF con el bitrate como techo (VBV)
+            out += ["-preset", preset]
+            if quality is not None:
+                out += ["-crf", str(quality)]
+                if bitrate:
+                    out += _cap(bitrate)
+            elif bitrate:
+                out += ["-b:v", bitrate]
+        return out
+
+
+def _cap(bitrate: str) -> List[str]:
+    """Techo de bitrate con búfer VBV de dos veces el techo."""
+    return ["-maxrate", bitrate, "-bufsize", _double(bitrate)]
+
+
+def _double(bitrate: str) -> str:
+    """`800k` → `1600k` (tamaño de búfer VBV habitual: dos veces el bitrate)."""
+    unit = bitrate[-1] if bitrate[-1:].isalpha() else ""
+    try:
+        value = float(bitrate[: -1] if unit else bitrate)
+    except ValueError:
+        return bitrate
+    return f"{value * 2:g}{unit}"
+
+
+# Orden de preferencia: el primero que funcione en el host es el elegido
+RANKING: Sequence[Encoder] = (
+    Encoder("h264_nvenc", "nvenc", "h264"),
+    Encoder("h264_nvmpi", "nvmpi", "h264"),
+    Encoder("h264_vaapi", "vaapi", "h264"),
+    Encoder("h264_qsv", "qsv", "h264"),
+    Encoder("libx264", "software", "h264"),
+    Encoder("libx265", "software", "hevc"),
+    Encoder("libsvtav1", "software", "av1"),
+)
+BY_NAME: Dict[str, Encoder] = {e.name: e for e in RANKING}
+
+
+def listed_encoders(ffmpeg: str = "ffmpeg") -> List[str]:
+    """Nombres de los codificadores de vídeo compilados en ffmpeg (`ffmpeg -encoders`)."""
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-encoders"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+    )
+    names = []
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # " V....D h264_nvenc  NVIDIA NVENC H.264 encoder"
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0].startswith("V"):
+            names.append(parts[1])
+    return names
+
+
+def test_encode(encoder: Encoder, ffmpeg: str = "ffmpeg") -> bool:
+    """Codifica unos frames sintéticos; falla si no hay hardware o driver para el codificador."""
+    cmd = [
+        ffmpeg, "-hide_banner", "-v", "error",
+        "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=30",
+        "-frames:v", "10",
+        *encoder.args(**PROBE_SETTINGS, vf="format=yuv420p"),
+        "-f", "null", "-",
+    ]
+    try:
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, timeout=PROBE_TIMEOUT)
+        return True
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return False
+
+
+def _ffmpeg_identity(ffmpeg: str) -> Optional[str]:
+    """Identifica un binario (ruta + mtime + tamaño) para invalidar la caché si cambia."""
+    path = shutil.which(ffmpeg)
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    return f"{path}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class EncoderRegistry:
+    """Codificadores que funcionan en este host, sondeados una vez y cacheados en disco."""
+
+    def __init__(self, path: Optional[str] = None, ffmpeg: str = "ffmpeg") -> None:
+        self.path = path or os.path.join(DEFAULT_DIR, f"encoders-{socket.gethostname()}.json")
+        self.ffmpeg = ffmpeg
+        self._lock = threading.Lock()
+        self._data: Optional[dict] = None
+
+    def _load(self) -> dict:
+        if self._data is not None:
+            return self._data
+        try:
+            with open(self.path) as fh:
+                self._data = json.load(fh)
+        except (OSError, ValueError):
+            self._data = {}
+        return self._data
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".encoders-")
+            with os.fdopen(fd, "w") as fh:
+                json.dump(self._data, fh, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # sin caché en disco se vuelve a sondear en el próximo arranque
+
+    def available(self, refresh: bool = False) -> List[Encoder]:
+        """Codificadores operativos, en orden de preferencia."""
+        with self._lock:
+            data = self._load()
+            identity = _ffmpeg_identity(self.ffmpeg)
+            cached = data.get("ffmpeg")
+            if not refresh and cached and cached.get("identity") == identity and cached.get("probe") == PROBE_SETTINGS:
+                return [BY_NAME[n] for n in cached.get("working", []) if n in BY_NAME]
+
+            try:
+                listed = set(listed_encoders(self.ffmpeg))
+            except (OSError, subprocess.CalledProcessError):
+                listed = set()
+            candidates = [e for e in RANKING if e.name in listed]
+            with ThreadPoolExecutor(max_workers=len(candidates) or 1) as pool:
+                ok = list(pool.map(lambda e: test_encode(e, self.ffmpeg), candidates))
+            working = [e for e, good in zip(candidates, ok) if good]
+
+            data["ffmpeg"] = {"identity": identity, "probe": PROBE_SETTINGS, "working": [e.name for e in working]}
+            self._save()
+            return working
+
+    def best(self, codec: Optional[str] = None, family: Optional[str] = None) -> Encoder:
+        """El codificador más rápido que funciona (opcionalmente de un códec o familia concretos).
+
+        `VIDEO_ENCODER` fuerza uno por nombre. Si el sondeo no encuentra ninguno,
+        se devuelve libx264 para que el error, si lo hay, lo dé ffmpeg al codificar.
+        """
+        forced = os.environ.get("VIDEO_ENCODER")
+        if forced:
+            return BY_NAME.get(forced) or Encoder(forced, "software", codec or "h264")
+        for encoder in self.available():
+            if (codec is None or encoder.codec == codec) and (family is None or encoder.family == family):
+                return encoder
+        return BY_NAME["libx264"]
+
+    def gst_has(self, plugin: str) -> bool:
+        """¿Existe el elemento de GStreamer `plugin`? (resultado cacheado por host)."""
+        with self._lock:
+            data = self._load()
+            identity = _ffmpeg_identity("gst-inspect-1.0")
+            if "gst" not in data or data["gst"].get("identity") != identity:
+                data["gst"] = {"identity": identity, "plugins": {}}
+            plugins = data["gst"]["plugins"]
+            if plugin not in plugins:
+                try:
+                    subprocess.run(["gst-inspect-1.0", plugin], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+                    plugins[plugin] = True
+                except Exception:
+                    plugins[plugin] = False
+                self._save()
+            return plugins[plugin]
+
+    def summary(self) -> dict:
+        working = self.available()
+        return {"best": self.best().name, "available": [e.name for e in working]}
+
+
+_registry: Optional[EncoderRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def registry() -> EncoderRegistry:
+    """Registro compartido del proceso (ruta de caché en `ENCODER_CACHE`, opcional)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = EncoderRegistry(os.environ.get("ENCODER_CACHE") or None)
+        return _registry
+
+
+def best_encoder(codec: Optional[str] = None, family: Optional[str] = None) -> Encoder:
+    return registry().best(codec, family)
+
+
+# Marcador para comandos que se ejecutan en otro nodo (segmentos en Ray): los
+# argumentos del codificador se construyen allí, con lo que tenga ese host.
+DEFERRED = "@encoder"
+
+
+def deferred_args(**settings: object) -> List[str]:
+    """Argumentos de vídeo diferidos; `resolve` los expande con `best_encoder().args(**settings)`."""
+    return [DEFERRED, json.dumps(settings)]
+
+
+def resolve(cmd: Sequence[str], family: Optional[str] = None) -> List[str]:
+    """Sustituye el marcador de `deferred_args` por los argumentos del codificador local.
+
+    `family` restringe la elección a la familia reservada para la tarea (ver `placement`).
+    """
+    cmd = list(cmd)
+    if DEFERRED not in cmd:
+        return cmd
+    i = cmd.index(DEFERRED)
+    return [*cmd[:i], *best_encoder(family=family).args(**json.loads(cmd[i + 1])), *cmd[i + 2:]]
+
+
+def gst_has(plugin: str) -> bool:
+    return registry().gst_has(plugin)
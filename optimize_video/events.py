@@ -0,0 +1,291 @@
+"""Difusión de eventos de estado por Server-Sent Events.
+
+Un único publicador (el hilo que refresca el estado) añade eventos a un búfer
+circular con número de secuencia; los suscriptores solo recuerdan la última
+secuencia que vieron y esperan en una `Condition`. Publicar cuesta lo mismo
+con uno que con cientos de clientes conectados, y un cliente inactivo no
+consume nada salvo el latido periódico.
+
+Un cliente que se queda atrás (o reconecta con un `Last-Event-ID` que ya salió
+del búfer) recibe un evento `snapshot` con el estado completo y sigue desde ahí.
+
+`EventBroker.stream` sirve a un suscriptor desde un hilo WSGI (uno por conexión
+abierta). `SSEServer` atiende a todos desde un único hilo con un bucle asyncio:
+un solo difusor lee el búfer y reparte cada evento a una cola por cliente.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Iterator, List, Optional, Set, Tuple
+
+Event = Tuple[int, str, str]  # (secuencia, nombre, datos JSON)
+
+
+def format_sse(seq: Optional[int], name: str, data: str) -> str:
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {name}\ndata: {data}\n\n"
+
+
+def status_delta(prev: dict, new: dict) -> Tuple[dict, Optional[dict]]:
+    """Cambios entre dos estados: (campos modificados, historial añadido o reiniciado)."""
+    changes = {k: v for k, v in new.items() if k != "history" and prev.get(k) != v}
+    old_hist = prev.get("history") or []
+    new_hist = new.get("history") or []
+    if new_hist == old_hist:
+        history = None
+    elif len(new_hist) >= len(old_hist) and new_hist[: len(old_hist)] == old_hist:
+        history = {"reset": False, "items": new_hist[len(old_hist):]}
+    else:
+        history = {"reset": True, "items": new_hist}
+    return changes, history
+
+
+class EventBroker:
+    """Búfer circular de eventos compartido por todos los suscriptores."""
+
+    def __init__(self, backlog: int = 512) -> None:
+        self._cond = threading.Condition()
+        self._events: Deque[Event] = deque(maxlen=backlog)
+        self._seq = 0
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, events: List[Tuple[str, object]], commit: Optional[Callable[[], None]] = None) -> None:
+        """Publica `events` [(nombre, datos)] de forma atómica.
+
+        `commit`, si se indica, se ejecuta bajo el mismo cerrojo: sirve para
+        actualizar el estado completo a la vez que sus deltas, de modo que un
+        suscriptor nuevo nunca recibe un `snapshot` que ya incluya eventos
+        que luego se le vuelvan a enviar.
+        """
+        payloads = [(name, json.dumps(data)) for name, data in events]
+        with self._cond:
+            if commit is not None:
+                commit()
+            for name, payload in payloads:
+                self._seq += 1
+                self._events.append((self._seq, name, payload))
+            self._cond.notify_all()
+
+    def _since(self, after: int) -> Tuple[List[Event], bool]:
+        """Eventos posteriores a `after` y si se ha perdido alguno por el tamaño del búfer."""
+        if after >= self._seq:
+            return [], False
+        lost = not self._events or self._events[0][0] > after + 1
+        return [e for e in self._events if e[0] > after], lost
+
+    def wait(self, after: int, timeout: float) -> Tuple[List[Event], bool]:
+        with self._cond:
+            if after >= self._seq:
+                self._cond.wait(timeout)
+            return self._since(after)
+
+    def attach(self, snapshot: Callable[[], str], last_event_id: Optional[str] = None) -> Tuple[int, Optional[str], List[Event]]:
+        """Punto de partida de un suscriptor: (secuencia, `snapshot()` o None, eventos pendientes).
+
+        Si `last_event_id` sigue en el búfer se reanuda desde ahí sin snapshot.
+        """
+        with self._cond:
+            if last_event_id and last_event_id.isdigit() and int(last_event_id) <= self._seq:
+                events, lost = self._since(int(last_event_id))
+                if not lost:
+                    return self._seq, None, events
+            return self._seq, snapshot(), []
+
+    def stream(self, snapshot: Callable[[], str], last_event_id: Optional[str] = None, heartbeat: float = 15.0) -> Iterator[str]:
+        """Generador SSE para un suscriptor; `snapshot()` devuelve el estado completo en JSON."""
+        seq, initial, events = self.attach(snapshot, last_event_id)
+        if initial is not None:
+            yield format_sse(seq, "snapshot", initial)
+        for event in events:
+            yield format_sse(*event)
+
+        while True:
+            events, lost = self.wait(seq, heartbeat)
+            if lost:
+                seq, initial, _ = self.attach(snapshot)
+                yield format_sse(seq, "snapshot", initial)
+            elif not events:
+                yield ": ping\n\n"
+            else:
+                for event_seq, name, data in events:
+                    yield format_sse(event_seq, name, data)
+                seq = events[-1][0]
+
+
+_SSE_HEADERS = (
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: text/event-stream\r\n"
+    "Cache-Control: no-cache\r\n"
+    "X-Accel-Buffering: no\r\n"
+    "Access-Control-Allow-Origin: *\r\n"
+    "Connection: close\r\n\r\n"
+)
+_PREFLIGHT_HEADERS = (
+    "HTTP/1.1 204 No Content\r\n"
+    "Access-Control-Allow-Origin: *\r\n"
+    "Access-Control-Allow-Methods: GET\r\n"
+    "Access-Control-Allow-Headers: Last-Event-ID, Cache-Control\r\n"
+    "Content-Length: 0\r\nConnection: close\r\n\r\n"
+)
+_NOT_FOUND = "HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+class _Client:
+    __slots__ = ("after", "queue", "writer", "task")
+
+    def __init__(self, after: int, queue: "asyncio.Queue[Optional[str]]", writer: asyncio.StreamWriter) -> None:
+        self.after = after  # eventos con secuencia <= after ya van en su snapshot o en su reanudación
+        self.queue = queue  # None: cerrar la conexión
+        self.writer = writer
+        self.task = asyncio.current_task()
+
+
+class SSEServer:
+    """Servidor SSE propio (puerto aparte) para todos los suscriptores de un `EventBroker`.
+
+    Corre en un hilo con su bucle asyncio: cada conexión es una corrutina y un
+    único difusor espera en el broker y deja cada evento en la cola de cada
+    cliente. Cien pestañas abiertas no cuestan cien hilos. Un cliente que no
+    lee y llena su cola se desconecta; el navegador reconecta con
+    `Last-Event-ID` y se pone al día desde el búfer o con un `snapshot`.
+    """
+
+    def __init__(
+        self,
+        broker: EventBroker,
+        snapshot: Callable[[], str],
+        host: str = "0.0.0.0",
+        port: int = 5001,
+        path: str = "/events",
+        heartbeat: float = 15.0,
+        queue_size: int = 256,
+    ) -> None:
+        self.broker = broker
+        self.snapshot = snapshot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self._clients: Set[_Client] = set()
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SSEServer":
+        """Arranca el hilo y espera a que escuche; `port=0` elige uno libre (ver `self.port`)."""
+        self._thread = threading.Thread(target=asyncio.run, args=(self._main(),), name="sse", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None and self._closing is not None:
+            self._loop.call_soon_threadsafe(self._closing.set)
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        try:
+            server = await asyncio.start_server(self._serve, self.host, self.port)
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        broadcaster = asyncio.ensure_future(self._broadcast())
+        try:
+            await self._closing.wait()
+        finally:
+            broadcaster.cancel()
+            server.close()
+            clients = list(self._clients)
+            for client in clients:
+                try:
+                    client.queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    client.writer.transport.abort()
+            await asyncio.gather(*(c.task for c in clients if c.task is not None), return_exceptions=True)
+            await server.wait_closed()
+
+    async def _broadcast(self) -> None:
+        loop = asyncio.get_running_loop()
+        seq = self.broker.last_seq
+        while True:
+            events, lost = await loop.run_in_executor(None, self.broker.wait, seq, self.heartbeat)
+            if lost:
+                seq, initial, _ = self.broker.attach(self.snapshot)
+                self._fan_out(format_sse(seq, "snapshot", initial))
+            elif not events:
+                self._fan_out(": ping\n\n")
+            else:
+                for event in events:
+                    self._fan_out(format_sse(*event), event[0])
+                seq = events[-1][0]
+
+    def _fan_out(self, chunk: str, seq: Optional[int] = None) -> None:
+        for client in list(self._clients):
+            if seq is not None and seq <= client.after:
+                continue
+            try:
+                client.queue.put_nowait(chunk)
+            except asyncio.QueueFull:
+                logging.info("SSE: cliente lento desconectado (cola llena)")
+                self._clients.discard(client)
+                client.writer.transport.abort()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = None
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            lines = head.decode("latin-1").split("\r\n")
+            method, target = (lines[0].split(" ") + ["", ""])[:2]
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if method == "OPTIONS":
+                writer.write(_PREFLIGHT_HEADERS.encode())
+            elif method != "GET" or target.split("?")[0] != self.path:
+                writer.write(_NOT_FOUND.encode())
+            else:
+                seq, initial, events = self.broker.attach(self.snapshot, headers.get("last-event-id"))
+                client = _Client(seq, asyncio.Queue(self.queue_size), writer)
+                self._clients.add(client)
+                writer.write(_SSE_HEADERS.encode())
+                if initial is not None:
+                    writer.write(format_sse(seq, "snapshot", initial).encode())
+                for event in events:
+                    writer.write(format_sse(*event).encode())
+                chunk: Optional[str] = ""
+                while chunk is not None:
+                    writer.write(chunk.encode())
+                    await writer.drain()
+                    chunk = await client.queue.get()
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            if client is not None:
+                self._clients.discard(client)
+            writer.close()
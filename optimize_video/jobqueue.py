@@ -0,0 +1,178 @@
+"""Cola de trabajos acotada con clases de prioridad.
+
+Los trabajos se guardan en un montículo ordenado por (prioridad, orden de
+llegada): las subidas pasan por delante de los escaneos masivos de carpetas y,
+dentro de una misma clase, se respeta el orden FIFO. Cancelar o cambiar la
+prioridad de un trabajo en cola no reordena el montículo: la entrada antigua
+se descarta al salir (borrado perezoso).
+
+La cola tiene un tamaño máximo; `push` lanza `QueueFull` cuando se alcanza para
+que quien encola aplique contrapresión (esperar o rechazar). No lanza nada por
+sí misma: quien la usa (el actor de `server-gpu-ray.py`) saca trabajos con
+`pop` a medida que quedan plazas libres.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Clases de prioridad (menor valor = antes)
+PRIORITIES: Dict[str, int] = {"upload": 0, "file": 1, "folder": 2}
+
+FINISHED = ("done", "error", "cancelled")
+
+
+class QueueFull(Exception):
+    """La cola ha alcanzado su tamaño máximo."""
+
+
+class QueuedJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, path: str, priority: str, job_id: Optional[int] = None) -> None:
+        # Con un registro persistente (`jobstore`) el id es el de su fila
+        self.id = job_id if job_id is not None else next(QueuedJob._ids)
+        self.path = path
+        self.name = os.path.basename(path)
+        self.priority = priority
+        self.state = "queued"  # queued | running | done | error | cancelled
+        self.error = ""
+        self.enqueued = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "path": self.path,
+            "priority": self.priority,
+            "state": self.state,
+            "error": self.error,
+            "enqueued": self.enqueued,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """Cola de prioridad acotada; no es segura entre hilos (la usa un único actor)."""
+
+    def __init__(self, maxsize: int = 10000, keep_finished: int = 1000) -> None:
+        self.maxsize = maxsize
+        self.keep_finished = keep_finished
+        self._heap: List[Tuple[int, int, int]] = []  # (prioridad, secuencia, id)
+        self._seq = itertools.count()
+        self._jobs: Dict[int, QueuedJob] = {}
+        self._by_path: Dict[str, int] = {}            # trabajos activos (en cola o en curso) por ruta
+        self._finished: List[int] = []
+        self._queued = 0
+        self.counters: Counter = Counter()
+        self._wait_total = 0.0
+
+    def __len__(self) -> int:
+        return self._queued
+
+    def __contains__(self, path: str) -> bool:
+        """¿Está `path` en cola o en curso?"""
+        return path in self._by_path
+
+    def get(self, job_id: int) -> Optional[QueuedJob]:
+        return self._jobs.get(job_id)
+
+    def push(self, path: str, priority: str = "folder", job_id: Optional[int] = None) -> Optional[QueuedJob]:
+        """Encola `path`; devuelve None si ya está en cola o en curso."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Prioridad desconocida: {priority}")
+        if path in self._by_path:
+            return None
+        if self._queued >= self.maxsize:
+            raise QueueFull(f"Cola llena ({self.maxsize} trabajos)")
+        job = QueuedJob(path, priority, job_id)
+        self._jobs[job.id] = job
+        self._by_path[path] = job.id
+        heapq.heappush(self._heap, (PRIORITIES[priority], next(self._seq), job.id))
+        self._queued += 1
+        self.counters["enqueued"] += 1
+        return job
+
+    def pop(self) -> Optional[QueuedJob]:
+        """Saca el siguiente trabajo en cola (lo marca como en curso)."""
+        while self._heap:
+            prio, _, job_id = heapq.heappop(self._heap)
+            job = self._jobs.get(job_id)
+            # Entradas obsoletas: cancelado o con la prioridad cambiada después de encolar
+            if job is None or job.state != "queued" or PRIORITIES[job.priority] != prio:
+                continue
+            job.state = "running"
+            job.started = time.time()
+            self._queued -= 1
+            self._wait_total += job.started - job.enqueued
+            self.counters["started"] += 1
+            return job
+        return None
+
+    def reprioritize(self, job_id: int, priority: str) -> bool:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Prioridad desconocida: {priority}")
+        job = self._jobs.get(job_id)
+        if job is None or job.state != "queued":
+            return False
+        if job.priority != priority:
+            job.priority = priority
+            heapq.heappush(self._heap, (PRIORITIES[priority], next(self._seq), job.id))
+        return True
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancela un trabajo en cola; los que están en curso los cancela quien los lanzó."""
+        job = self._jobs.get(job_id)
+        if job is None or job.state != "queued":
+            return False
+        self._queued -= 1
+        self.finish(job, "cancelled")
+        return True
+
+    def finish(self, job: QueuedJob, state: str, error: str = "") -> None:
+        job.state = state
+        job.error = error
+        job.finished = time.time()
+        self._by_path.pop(job.path, None)
+        self.counters[state] += 1
+        # Solo se conservan los últimos `keep_finished` terminados
+        self._finished.append(job.id)
+        while len(self._finished) > self.keep_finished:
+            self._jobs.pop(self._finished.pop(0), None)
+
+    def jobs(self, states: Optional[Tuple[str, ...]] = None, limit: int = 100) -> List[dict]:
+        """Trabajos (en cola primero, en orden de salida) filtrados por estado."""
+        selected = [j for j in self._jobs.values() if states is None or j.state in states]
+        selected.sort(key=lambda j: (j.state != "running", j.state != "queued", PRIORITIES[j.priority], j.id))
+        return [j.to_dict() for j in selected[:limit]]
+
+    def metrics(self) -> dict:
+        """Profundidad y antigüedad de la cola por clase, trabajos en curso y contadores."""
+        now = time.time()
+        depth: Counter = Counter()
+        oldest: Dict[str, float] = {}
+        running = 0
+        for job in self._jobs.values():
+            if job.state == "queued":
+                depth[job.priority] += 1
+                oldest[job.priority] = max(oldest.get(job.priority, 0.0), now - job.enqueued)
+            elif job.state == "running":
+                running += 1
+        started = self.counters["started"]
+        return {
+            "depth": self._queued,
+            "depth_by_priority": {p: depth.get(p, 0) for p in PRIORITIES},
+            "oldest_age_s": {p: round(oldest[p], 1) for p in oldest},
+            "running": running,
+            "max_size": self.maxsize,
+            "avg_wait_s": round(self._wait_total / started, 1) if started else 0.0,
+            "counters": dict(self.counters),
+        }
@@ -0,0 +1,230 @@
+"""Registro persistente de trabajos en SQLite (modo WAL).
+
+Cada vídeo es una fila con su estado, el último paso completado (`stage`) y
+las rutas de salida de cada paso. Los servidores consultan el registro antes
+de procesar un vídeo:
+
+ - si ya terminó correctamente y la entrada no ha cambiado, se omite;
+ - si quedó a medias (el proceso murió con el trabajo `queued`/`running`), se
+   reanuda desde el último paso completado, borrando antes las salidas
+   parciales de los pasos posteriores (`discard_partial`);
+ - si falló por un motivo pasajero (`retry`, p. ej. disco lleno), se vuelve a
+   encolar en la misma fila, desde el principio.
+
+El historial y el estado de la UI se leen de aquí con índices por ruta,
+estado y fecha de fin, así que siguen siendo rápidos con cientos de miles de
+filas. "Limpiar el historial" solo mueve una marca de tiempo: las filas se
+conservan para poder reanudar y omitir.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "video-optimizer", "jobs.db")
+
+ACTIVE = ("queued", "running")
+
+# Fallo reintentable: el trabajo se vuelve a encolar (también tras un reinicio)
+RETRY = "retry"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    state TEXT NOT NULL,
+    stage INTEGER NOT NULL DEFAULT 0,
+    message TEXT NOT NULL DEFAULT '',
+    outputs TEXT NOT NULL DEFAULT '{}',
+    priority TEXT NOT NULL DEFAULT 'folder',
+    options TEXT NOT NULL DEFAULT '{}',
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_path ON jobs (path, id);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished) WHERE finished IS NOT NULL;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def input_fingerprint(path: str) -> str:
+    """Identidad barata de la entrada (tamaño + mtime) para saber si cambió desde el último trabajo."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def discard_partial(outputs: Dict[int, Union[str, Sequence[str]]], completed: int) -> None:
+    """Borra las salidas de los pasos posteriores a `completed` (restos de una ejecución interrumpida).
+
+    Un paso puede tener una ruta o una lista de rutas (p. ej. varios contenedores de entrega).
+    """
+    for stage, paths in outputs.items():
+        if stage <= completed:
+            continue
+        for path in [paths] if isinstance(paths, str) else paths or ():
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class JobStore:
+    """Registro de trabajos compartido por los hilos del servidor (una conexión con cerrojo)."""
+
+    def __init__(self, path: str = DEFAULT_PATH) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._live: set = set()  # trabajos encolados por este proceso y aún sin terminar
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # Registros creados antes de que existieran las opciones por trabajo
+        columns = {r["name"] for r in self._db.execute("PRAGMA table_info(jobs)")}
+        if "options" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN options TEXT NOT NULL DEFAULT '{}'")
+
+    @classmethod
+    def from_env(cls) -> "JobStore":
+        """`JOB_DB`: ruta del fichero SQLite (por defecto en ~/.cache); vacío = solo en memoria."""
+        path = os.environ.get("JOB_DB", DEFAULT_PATH)
+        return cls(path or ":memory:")
+
+    def _row(self, row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["outputs"] = {int(k): v for k, v in json.loads(job["outputs"]).items()}
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def latest(self, path: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE path = ? ORDER BY id DESC LIMIT 1", (path,)).fetchone()
+        return self._row(row)
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def enqueue(self, path: str, priority: str = "folder", options: Optional[dict] = None) -> Tuple[Optional[int], int]:
+        """Registra `path` en cola y devuelve (id, paso desde el que reanudar).
+
+        Devuelve (None, 0) si el último trabajo de esa entrada terminó bien y la
+        entrada no ha cambiado, o si este mismo proceso ya lo tiene en cola o en
+        curso. Si hay un trabajo activo de una ejecución anterior (interrumpido),
+        se reutiliza su fila y su último paso completado. `options` (p. ej. la
+        escalera ABR) se guardan con el trabajo para que una reanudación produzca
+        la misma salida; sin ellas se conservan las de la fila reutilizada.
+        """
+        path = os.path.abspath(path)
+        fingerprint = input_fingerprint(path)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE path = ? ORDER BY id DESC LIMIT 1", (path,)).fetchone()
+            if row is not None and row["state"] == "done" and row["fingerprint"] == fingerprint:
+                return None, 0
+            if row is not None and (row["state"] in ACTIVE or row["state"] == RETRY):
+                if row["id"] in self._live:
+                    return None, 0
+                self._live.add(row["id"])
+                self._db.execute(
+                    "UPDATE jobs SET state = 'queued', priority = ?, options = COALESCE(?, options), updated = ?, finished = NULL WHERE id = ?",
+                    (priority, json.dumps(options) if options is not None else None, now, row["id"]),
+                )
+                return row["id"], row["stage"]
+            cur = self._db.execute(
+                "INSERT INTO jobs (path, name, fingerprint, state, priority, options, created, updated) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (path, os.path.basename(path), fingerprint, priority, json.dumps(options or {}), now, now),
+            )
+            self._live.add(cur.lastrowid)
+            return cur.lastrowid, 0
+
+    def start(self, job_id: int) -> None:
+        with self._lock:
+            self._db.execute("UPDATE jobs SET state = 'running', updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def checkpoint(self, job_id: int, stage: int, outputs: Optional[Dict[int, str]] = None) -> None:
+        """Marca `stage` como completado y guarda las rutas de salida conocidas."""
+        with self._lock:
+            row = self._db.execute("SELECT outputs FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            merged = json.loads(row["outputs"]) if row else {}
+            merged.update({str(k): v for k, v in (outputs or {}).items()})
+            self._db.execute(
+                "UPDATE jobs SET stage = MAX(stage, ?), outputs = ?, updated = ? WHERE id = ?",
+                (stage, json.dumps(merged), time.time(), job_id),
+            )
+
+    def finish(self, job_id: int, state: str, message: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self._live.discard(job_id)
+            self._db.execute(
+                "UPDATE jobs SET state = ?, message = ?, updated = ?, finished = ? WHERE id = ?",
+                (state, message, now, now, job_id),
+            )
+
+    def retry(self, job_id: int, message: str = "") -> None:
+        """Fallo reintentable: la próxima vez el trabajo empieza de cero (sus intermedios ya no existen)."""
+        now = time.time()
+        with self._lock:
+            self._live.discard(job_id)
+            self._db.execute(
+                "UPDATE jobs SET state = ?, stage = 0, outputs = '{}', message = ?, updated = ?, finished = ? WHERE id = ?",
+                (RETRY, message, now, now, job_id),
+            )
+
+    def resumable(self) -> List[dict]:
+        """Trabajos que quedaron en cola, en curso o pendientes de reintento al parar el servidor, en orden de llegada."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs WHERE state IN ('queued', 'running', 'retry') ORDER BY id").fetchall()
+        return [self._row(r) for r in rows]
+
+    def active(self, limit: int = 100) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE state IN ('queued', 'running') ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def clear_history(self) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO meta (key, value) VALUES ('history_since', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (str(time.time()),),
+            )
+
+    def history(self, limit: int = 100) -> List[dict]:
+        """Últimos trabajos terminados desde la última limpieza, en orden cronológico ({name, status})."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'history_since'").fetchone()
+            since = float(row["value"]) if row else 0.0
+            rows = self._db.execute(
+                "SELECT name, message FROM jobs WHERE finished IS NOT NULL AND finished >= ? "
+                "ORDER BY finished DESC LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        return [{"name": r["name"], "status": r["message"]} for r in reversed(rows)]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        return {r["state"]: r["n"] for r in rows}
@@ -0,0 +1,229 @@
+"""Instrumentación por etapa: tiempo, CPU de los procesos hijos, bytes y fps.
+
+Cada etapa del pipeline (probe, repair, reduce, optimize, package, validate,
+cleanup; `encode` cuando los pasos 1-3 van fusionados y `remux` en la copia
+directa) se mide con `StageMetrics.stage(...)`:
+
+ - tiempo de pared;
+ - CPU de los procesos hijos, tomada del rusage que devuelve `os.wait4` al
+   recoger cada ffmpeg (`run_child`/`wait_child`); a diferencia de
+   `RUSAGE_CHILDREN`, es exacta aunque varios trabajos corran a la vez en
+   hilos del mismo proceso;
+ - bytes leídos y escritos (tamaño de los ficheros de entrada y salida);
+ - fps de codificación: frames de salida / tiempo de pared.
+
+La CLI imprime `StageMetrics.summary()` como JSON. Los servidores vuelcan
+cada etapa en histogramas y contadores de `prometheus_client` (si está
+instalado) y los exponen en `/metrics` con `exposition()`; en Ray las etapas
+se miden en los workers y el resumen viaja con el resultado del trabajo hasta
+el proceso del servidor, que lo registra con `record`.
+"""
+
+from __future__ import annotations
+
+import os
+import platform
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import prometheus_client
+except ImportError:  # opcional: sin él solo queda el resumen JSON
+    prometheus_client = None
+
+STAGES = ("probe", "repair", "reduce", "optimize", "encode", "remux", "package", "validate", "cleanup")
+
+LABELS = ("stage", "encoder", "node")
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+FPS_BUCKETS = (1, 5, 10, 15, 24, 30, 60, 120, 240, 480, 960)
+
+_local = threading.local()
+
+
+@dataclass
+class StageStats:
+    stage: str
+    wall_s: float = 0.0
+    cpu_s: float = 0.0             # CPU (usuario + sistema) de los hijos recogidos en la etapa
+    bytes_in: int = 0
+    bytes_out: int = 0
+    frames: float = 0.0            # frames de salida (0 si la etapa no codifica)
+    processes: int = 0
+    ok: bool = True
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.wall_s if self.frames and self.wall_s > 0 else 0.0
+
+    def add_cpu(self, seconds: float, processes: int = 1) -> None:
+        # Los segmentos en paralelo suman desde varios hilos
+        with self._lock:
+            self.cpu_s += seconds
+            self.processes += processes
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.stage,
+            "ok": self.ok,
+            "wall_s": round(self.wall_s, 3),
+            "cpu_s": round(self.cpu_s, 3),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "fps": round(self.fps, 2),
+            "processes": self.processes,
+        }
+
+
+def current_stage() -> Optional[StageStats]:
+    """Etapa abierta en este hilo (para pasarla a hilos auxiliares)."""
+    return getattr(_local, "stage", None)
+
+
+def add_cpu(seconds: float, stats: Optional[StageStats] = None, processes: int = 1) -> None:
+    """Suma CPU medida en otra parte (p. ej. tareas Ray remotas) a la etapa abierta."""
+    stats = stats or current_stage()
+    if stats is not None:
+        stats.add_cpu(seconds, processes)
+
+
+def _reap(proc: subprocess.Popen) -> Tuple[int, float]:
+    """Espera a `proc` con `os.wait4`; devuelve (código de salida, segundos de CPU)."""
+    if proc.returncode is not None:
+        return proc.returncode, 0.0
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # Ya lo recogió otro hilo (poll/kill): sin rusage
+        return proc.wait(), 0.0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, usage.ru_utime + usage.ru_stime
+
+
+def wait_child(proc: subprocess.Popen, stats: Optional[StageStats] = None) -> int:
+    """Como `proc.wait()`, anotando la CPU del proceso en `stats` (o en la etapa del hilo)."""
+    returncode, cpu = _reap(proc)
+    add_cpu(cpu, stats)
+    return returncode
+
+
+def run_child(cmd: List[str], *, stats: Optional[StageStats] = None, check: bool = True, **kwargs) -> float:
+    """Como `subprocess.run(cmd, check=True)` sin capturar salida; devuelve los segundos de CPU."""
+    with subprocess.Popen(cmd, **kwargs) as proc:
+        try:
+            returncode, cpu = _reap(proc)
+        except BaseException:
+            proc.kill()
+            raise
+    add_cpu(cpu, stats)
+    if check and returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return cpu
+
+
+def _size(paths: Iterable[str]) -> int:
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except (OSError, TypeError):
+            pass
+    return total
+
+
+class StageMetrics:
+    """Etapas medidas de un trabajo; con `export=True` se vuelcan a Prometheus al cerrarse."""
+
+    def __init__(self, *, encoder: str = "", export: bool = False) -> None:
+        self.labels: Dict[str, str] = {"encoder": encoder, "node": platform.node()}
+        self.export = export
+        self.stages: List[StageStats] = []
+
+    @contextmanager
+    def stage(self, name: str, inputs: Iterable[str] = (), outputs: Iterable[str] = (), frames: float = 0.0) -> Iterator[StageStats]:
+        """Mide el bloque; los procesos lanzados con `run_child` en este hilo cuentan para la etapa."""
+        stats = StageStats(name, frames=frames, bytes_in=_size(inputs))
+        previous = current_stage()
+        _local.stage = stats
+        start = time.perf_counter()
+        try:
+            yield stats
+        except BaseException:
+            stats.ok = False
+            raise
+        finally:
+            _local.stage = previous
+            stats.wall_s = time.perf_counter() - start
+            stats.bytes_out = _size(outputs)
+            self.stages.append(stats)
+            if self.export:
+                observe(stats.to_dict(), self.labels)
+
+    def summary(self) -> dict:
+        return {
+            **self.labels,
+            "stages": [s.to_dict() for s in self.stages],
+            "wall_s": round(sum(s.wall_s for s in self.stages), 3),
+            "cpu_s": round(sum(s.cpu_s for s in self.stages), 3),
+        }
+
+
+# -- Prometheus ----------------------------------------------------------------
+
+_instruments: Optional[dict] = None
+_instruments_lock = threading.Lock()
+
+
+def available() -> bool:
+    return prometheus_client is not None
+
+
+def _get_instruments() -> Optional[dict]:
+    global _instruments
+    if prometheus_client is None:
+        return None
+    with _instruments_lock:
+        if _instruments is None:
+            p = prometheus_client
+            _instruments = {
+                "wall": p.Histogram("video_stage_seconds", "Tiempo de pared por etapa", LABELS, buckets=SECONDS_BUCKETS),
+                "cpu": p.Histogram("video_stage_cpu_seconds", "CPU de los procesos hijos por etapa", LABELS, buckets=SECONDS_BUCKETS),
+                "fps": p.Histogram("video_stage_encode_fps", "Frames por segundo de las etapas que codifican", LABELS, buckets=FPS_BUCKETS),
+                "read": p.Counter("video_stage_read_bytes", "Bytes de entrada por etapa", LABELS),
+                "written": p.Counter("video_stage_written_bytes", "Bytes de salida por etapa", LABELS),
+                "runs": p.Counter("video_stage_runs", "Etapas ejecutadas por resultado", (*LABELS, "result")),
+            }
+        return _instruments
+
+
+def observe(stage: dict, labels: Dict[str, str]) -> None:
+    """Registra una etapa (`StageStats.to_dict()`) en las métricas del proceso."""
+    instruments = _get_instruments()
+    if instruments is None:
+        return
+    values = {"stage": stage["stage"], "encoder": labels.get("encoder", ""), "node": labels.get("node", "")}
+    instruments["runs"].labels(**values, result="ok" if stage["ok"] else "error").inc()
+    instruments["wall"].labels(**values).observe(stage["wall_s"])
+    instruments["cpu"].labels(**values).observe(stage["cpu_s"])
+    instruments["read"].labels(**values).inc(stage["bytes_in"])
+    instruments["written"].labels(**values).inc(stage["bytes_out"])
+    if stage["fps"]:
+        instruments["fps"].labels(**values).observe(stage["fps"])
+
+
+def record(summary: dict) -> None:
+    """Registra todas las etapas de un `StageMetrics.summary()` medido en otro proceso."""
+    for stage in summary.get("stages", ()):
+        observe(stage, summary)
+
+
+def exposition() -> Tuple[bytes, str]:
+    """Cuerpo y content-type de `/metrics` (formato de texto de Prometheus)."""
+    if prometheus_client is None:
+        raise RuntimeError("prometheus_client no está instalado")
+    _get_instruments()
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,80 @@
+"""Empaquetado de la salida codificada en los contenedores de entrega.
+
+El vídeo ya codificado no se vuelve a codificar para cambiar de contenedor:
+
+ - `remux_args` empaqueta un fichero existente con copia de streams
+   (`-c copy`, y `faststart` en MP4/MOV);
+ - `output_args` hace que la propia codificación escriba directamente todas
+   las salidas: una sola se escribe tal cual y varias, con el muxer `tee` de
+   ffmpeg (una codificación alimenta todos los contenedores en una pasada).
+
+Las salidas se indican como `{formato: ruta}` con formatos de `MUXERS`.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+# formato -> muxer de ffmpeg
+MUXERS: Dict[str, str] = {"mp4": "mp4", "mov": "mov", "mkv": "matroska", "ts": "mpegts"}
+
+# Opciones del muxer por formato (índice al principio para reproducir en streaming)
+MUXER_OPTIONS: Dict[str, Dict[str, str]] = {
+    "mp4": {"movflags": "+faststart"},
+    "mov": {"movflags": "+faststart"},
+}
+
+
+def parse_formats(value: str) -> Tuple[str, ...]:
+    """`"mkv, mp4"` -> `("mkv", "mp4")`; lanza ValueError con formatos desconocidos."""
+    formats: List[str] = []
+    for fmt in (f.strip().lower().lstrip(".") for f in value.split(",")):
+        if not fmt:
+            continue
+        if fmt not in MUXERS:
+            raise ValueError(f"Formato de entrega desconocido: {fmt} (válidos: {', '.join(MUXERS)})")
+        if fmt not in formats:
+            formats.append(fmt)
+    return tuple(formats)
+
+
+def _tee_escape(path: str) -> str:
+    # El muxer tee separa salidas con '|' y admite comillas y '\' como escape
+    return path.replace("\\", "\\\\").replace("'", "\\'").replace("|", "\\|")
+
+
+def _tee_slave(fmt: str, path: str) -> str:
+    options = [f"f={MUXERS[fmt]}", *(f"{k}={v}" for k, v in MUXER_OPTIONS.get(fmt, {}).items())]
+    return "[{}]{}".format(":".join(options), _tee_escape(path))
+
+
+def output_args(outputs: Mapping[str, str], *, encoding: bool = False, maps: bool = True) -> List[str]:
+    """Argumentos de salida que escriben `outputs` en una sola invocación.
+
+    Con varias salidas se usa `tee`, que no elige streams por sí mismo: con
+    `maps` se añade el primer vídeo y el primer audio de la entrada 0 (pásese
+    `maps=False` si los argumentos previos ya llevan `-map`). Con `encoding`
+    se pide a los codificadores la cabecera global, que `tee` no puede
+    negociar con cada contenedor y MP4 necesita.
+    """
+    items = list(outputs.items())
+    if not items:
+        raise ValueError("Se necesita al menos una salida")
+    if len(items) == 1:
+        fmt, path = items[0]
+        options = [arg for k, v in MUXER_OPTIONS.get(fmt, {}).items() for arg in (f"-{k}", v)]
+        return [*options, "-f", MUXERS[fmt], path]
+    args = ["-map", "0:v:0", "-map", "0:a:0?"] if maps else []
+    if encoding:
+        args += ["-flags:v", "+global_header", "-flags:a", "+global_header"]
+    return [*args, "-f", "tee", "|".join(_tee_slave(fmt, path) for fmt, path in items)]
+
+
+def remux_args(outputs: Mapping[str, str]) -> List[str]:
+    """Copia de streams (primer vídeo y primer audio) a `outputs`, sin recodificar."""
+    return ["-map", "0:v:0", "-map", "0:a:0?", "-c", "copy", *output_args(outputs, maps=False)]
+
+
+def delivery_paths(base: str, formats: Iterable[str], suffix: str = "-final") -> Dict[str, str]:
+    """`{formato: <base><suffix>.<formato>}` para cada formato de entrega."""
+    return {fmt: f"{base}{suffix}.{fmt}" for fmt in formats}
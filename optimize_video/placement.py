@@ -0,0 +1,269 @@
+"""Reparto de trabajos entre los nodos del cluster Ray según sus recursos.
+
+Cada nodo declara al arrancar (`ray start --resources=...`, ver
+`node_resources`) recursos personalizados:
+
+ - `enc_<familia>` (p. ej. `enc_nvenc`, `enc_nvmpi`, `enc_software`): sesiones
+   de codificación simultáneas de esa familia. Hace a la vez de etiqueta del
+   nodo (qué codificadores tiene) y de contador de plazas;
+ - `scratch_gb`: espacio de trabajo en disco para intermedios y segmentos.
+
+Una tarea pide sesiones de una familia (una por codificación simultánea: dos
+en el modo por tuberías, una por peldaño en ABR), CPUs y disco; la política de
+colocación (`PlacementPolicy`) elige nodo y familia a partir de la vista del
+cluster, y Ray garantiza que nunca se superan las plazas declaradas. Si ningún
+nodo declara `enc_*` (cluster antiguo), las tareas se lanzan sin requisitos,
+como antes.
+
+Las políticas son intercambiables (`POLICIES`) y no dependen de Ray: reciben
+una lista de `NodeView`, así que se pueden probar con un cluster local de
+nodos con recursos ficticios (`benchmarks/ray_placement.py`).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .encoders import RANKING, registry
+
+PREFIX = "enc_"
+SCRATCH = "scratch_gb"
+
+# Familias de la más rápida a la más lenta (orden del registro de codificadores)
+FAMILIES: Tuple[str, ...] = tuple(dict.fromkeys(e.family for e in RANKING))
+
+
+def node_resources(sessions: int = 3, scratch_gb: float = 100, cpu_sessions: Optional[int] = None) -> Dict[str, float]:
+    """Recursos a declarar en este nodo según los codificadores que funcionan en él.
+
+    Las familias hardware reciben `sessions` plazas; la de CPU, `cpu_sessions`
+    (por defecto un encode por cada 4 núcleos).
+    """
+    if cpu_sessions is None:
+        cpu_sessions = max(1, (os.cpu_count() or 1) // 4)
+    resources: Dict[str, float] = {SCRATCH: scratch_gb}
+    for encoder in registry().available():
+        key = PREFIX + encoder.family
+        if key not in resources:
+            resources[key] = sessions if encoder.hardware else cpu_sessions
+    resources.setdefault(PREFIX + "software", cpu_sessions)
+    return resources
+
+
+def scratch_capacity_gb(path: str, min_free_gb: float = 1) -> float:
+    """`scratch_gb` por defecto: lo libre ahora en el volumen de `path`, menos `min_free_gb`."""
+    return max(0.0, float(int(shutil.disk_usage(path).free / 1024**3 - min_free_gb)))
+
+
+@dataclass
+class NodeView:
+    """Foto de un nodo: recursos totales, disponibles según Ray y reservas locales pendientes."""
+
+    node_id: str
+    host: str
+    total: Dict[str, float]
+    available: Dict[str, float]
+    pending: Dict[str, float] = field(default_factory=dict)
+
+    def families(self) -> List[str]:
+        return [f for f in FAMILIES if self.total.get(PREFIX + f, 0) > 0]
+
+    def capacity(self, family: str) -> float:
+        return self.total.get(PREFIX + family, 0)
+
+    def free(self, family: str) -> float:
+        key = PREFIX + family
+        used = max(self.total.get(key, 0) - self.available.get(key, 0), self.pending.get(key, 0))
+        return self.total.get(key, 0) - used
+
+    def load(self, family: str) -> float:
+        """Fracción ocupada (puede pasar de 1 si hay trabajos en cola para el nodo)."""
+        capacity = self.capacity(family)
+        return (capacity - self.free(family)) / capacity if capacity else float("inf")
+
+    def node_load(self) -> float:
+        """Ocupación de todas las plazas de codificación del nodo."""
+        families = self.families()
+        capacity = sum(self.capacity(f) for f in families)
+        return sum(self.capacity(f) - self.free(f) for f in families) / capacity if capacity else float("inf")
+
+
+@dataclass(frozen=True)
+class JobRequest:
+    cpus: float = 1
+    scratch_gb: float = 0
+    encoder: bool = True                       # False: solo CPU/disco (p. ej. el padre de un trabajo por segmentos)
+    sessions: int = 1                          # codificaciones simultáneas del trabajo (plazas enc_<familia>)
+    families: Optional[Sequence[str]] = None   # familias aceptables; None = cualquiera
+
+
+Choice = Tuple[NodeView, Optional[str]]
+
+
+class PlacementPolicy:
+    """Elige (nodo, familia) para un trabajo; `None` deja la decisión a Ray."""
+
+    name = "base"
+
+    def choose(self, nodes: Sequence[NodeView], request: JobRequest) -> Optional[Choice]:
+        raise NotImplementedError
+
+    @staticmethod
+    def candidates(nodes: Sequence[NodeView], request: JobRequest) -> List[Choice]:
+        out: List[Choice] = []
+        for node in nodes:
+            # Solo se filtra por disco en los nodos que lo declaran
+            if request.scratch_gb and SCRATCH in node.total and node.total[SCRATCH] < request.scratch_gb:
+                continue
+            if not request.encoder:
+                out.append((node, None))
+                continue
+            for family in node.families():
+                if request.families is None or family in request.families:
+                    out.append((node, family))
+        return out
+
+
+class LeastLoaded(PlacementPolicy):
+    """El nodo con menor ocupación relativa; dentro de él, la familia más rápida con plaza libre."""
+
+    name = "least-loaded"
+
+    def choose(self, nodes: Sequence[NodeView], request: JobRequest) -> Optional[Choice]:
+        def key(choice: Choice) -> Tuple[float, bool, int]:
+            node, family = choice
+            if family is None:
+                cpus = node.total.get("CPU", 0)
+                return ((cpus - node.available.get("CPU", 0)) / cpus if cpus else 1.0, False, 0)
+            return (node.node_load(), node.free(family) < min(request.sessions, node.capacity(family)), FAMILIES.index(family))
+
+        options = self.candidates(nodes, request)
+        return min(options, key=key) if options else None
+
+
+class FastestEncoderFirst(PlacementPolicy):
+    """La familia más rápida con plazas libres; si no hay ninguna libre, la menos cargada."""
+
+    name = "fastest-encoder"
+
+    def choose(self, nodes: Sequence[NodeView], request: JobRequest) -> Optional[Choice]:
+        options = self.candidates(nodes, request)
+        if not request.encoder:
+            return LeastLoaded().choose(nodes, request)
+        free = [c for c in options if c[0].free(c[1]) >= min(request.sessions, c[0].capacity(c[1]))]
+        if free:
+            return min(free, key=lambda c: (FAMILIES.index(c[1]), c[0].load(c[1])))
+        return min(options, key=lambda c: (c[0].load(c[1]), FAMILIES.index(c[1]))) if options else None
+
+
+POLICIES: Dict[str, Callable[[], PlacementPolicy]] = {
+    LeastLoaded.name: LeastLoaded,
+    FastestEncoderFirst.name: FastestEncoderFirst,
+}
+
+
+def ray_cluster() -> List[NodeView]:
+    """Vista de los nodos vivos del cluster Ray (totales y disponibles por nodo)."""
+    import ray
+
+    try:
+        # API interna de Ray; sin ella se asume todo libre y cuentan solo las reservas locales
+        from ray._private.state import available_resources_per_node
+        available = available_resources_per_node()
+    except Exception:
+        available = {}
+    nodes = []
+    for info in ray.nodes():
+        if not info.get("Alive"):
+            continue
+        node_id = info["NodeID"]
+        total = dict(info.get("Resources", {}))
+        nodes.append(NodeView(node_id, info.get("NodeManagerHostname", node_id), total, dict(available.get(node_id, total))))
+    return nodes
+
+
+class Placer:
+    """Traduce la decisión de la política a opciones de tarea Ray y lleva las reservas en vuelo.
+
+    Las reservas locales cubren el hueco entre lanzar una tarea y que Ray la
+    cuente como en ejecución, para que un lote de envíos no caiga entero en el
+    mismo nodo.
+    """
+
+    def __init__(self, policy: PlacementPolicy, cluster: Callable[[], List[NodeView]] = ray_cluster) -> None:
+        self.policy = policy
+        self._cluster = cluster
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_env(cls) -> "Placer":
+        """`PLACEMENT_POLICY`: `least-loaded` (por defecto) o `fastest-encoder`."""
+        name = os.environ.get("PLACEMENT_POLICY", LeastLoaded.name)
+        if name not in POLICIES:
+            raise ValueError(f"Política de colocación desconocida: {name} (opciones: {', '.join(POLICIES)})")
+        return cls(POLICIES[name]())
+
+    def place(self, request: JobRequest) -> Tuple[dict, Optional[str], Optional[str]]:
+        """Devuelve (opciones para `.options(...)`, familia elegida, node_id)."""
+        with self._lock:
+            nodes = self._cluster()
+            for node in nodes:
+                node.pending = dict(self._pending.get(node.node_id, {}))
+            if not any(n.families() for n in nodes):
+                return {}, None, None  # cluster sin recursos declarados: comportamiento clásico
+            choice = self.policy.choose(nodes, request)
+            if choice is None:
+                return {}, None, None
+            node, family = choice
+            resources: Dict[str, float] = {}
+            if family is not None:
+                # Como mucho las plazas del nodo: si no, Ray no podría lanzarla nunca
+                resources[PREFIX + family] = max(1, min(request.sessions, node.capacity(family)))
+            if request.scratch_gb and node.total.get(SCRATCH):
+                resources[SCRATCH] = request.scratch_gb
+            pending = self._pending.setdefault(node.node_id, {})
+            for key, amount in resources.items():
+                pending[key] = pending.get(key, 0) + amount
+
+        from ray.util.scheduling_strategies import NodeAffinitySchedulingStrategy
+
+        options = {
+            "num_cpus": request.cpus,
+            "resources": resources,
+            # soft: si el nodo cae, Ray puede llevarla a otro con la misma familia
+            "scheduling_strategy": NodeAffinitySchedulingStrategy(node.node_id, soft=True),
+        }
+        return options, family, node.node_id
+
+    def release(self, node_id: Optional[str], options: dict) -> None:
+        if node_id is None:
+            return
+        with self._lock:
+            pending = self._pending.get(node_id, {})
+            for key, amount in options.get("resources", {}).items():
+                pending[key] = max(0.0, pending.get(key, 0) - amount)
+
+    def submit(self, remote_fn, request: JobRequest, *args, **kwargs):
+        """Lanza `remote_fn` con la colocación elegida; la familia se pasa como `family=`."""
+        options, family, node_id = self.place(request)
+        fn = remote_fn.options(**options) if options else remote_fn
+        ref = fn.remote(*args, family=family, **kwargs)
+        ref.future().add_done_callback(lambda _f: self.release(node_id, options))
+        return ref
+
+
+if __name__ == "__main__":
+    # Imprime los recursos de este nodo para `ray start --resources='...'`
+    print(json.dumps(node_resources(
+        sessions=int(os.environ.get("ENCODER_SESSIONS", "3")),
+        # Sin SCRATCH_GB, el espacio libre del volumen de trabajo (SCRATCH_DIR o el directorio actual)
+        scratch_gb=float(os.environ.get("SCRATCH_GB") or scratch_capacity_gb(
+            os.environ.get("SCRATCH_DIR") or ".", float(os.environ.get("DISK_MIN_FREE_GB", "1")),
+        )),
+    )))
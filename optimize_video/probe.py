@@ -0,0 +1,180 @@
+"""Capa única de sondeo de metadatos con ffprobe.
+
+`probe(path)` ejecuta `ffprobe -show_format -show_streams -of json` una sola
+vez por (ruta, mtime, tamaño) y devuelve un `MediaInfo` tipado. El resultado
+queda en una caché LRU acotada que comparten todas las etapas del pipeline y
+el endpoint `/status`: mientras el fichero no cambie, no se vuelve a lanzar
+ffprobe.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+CACHE_SIZE = 256
+
+
+def _float(value: object, default: float = 0.0) -> float:
+    try:
+        return float(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return default
+
+
+def _int(value: object, default: int = 0) -> int:
+    try:
+        return int(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return default
+
+
+def _rate(value: Optional[str]) -> float:
+    """Convierte `30000/1001` o `25` a fps; 0.0 si no es válido."""
+    if not value:
+        return 0.0
+    if "/" in value:
+        num, _, den = value.partition("/")
+        return _float(num) / _float(den) if _float(den) else 0.0
+    return _float(value)
+
+
+@dataclass(frozen=True)
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: str
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    pix_fmt: str = ""
+    channels: int = 0
+    sample_rate: int = 0
+    bit_rate: int = 0
+    duration: float = 0.0
+    nb_frames: int = 0
+
+    @classmethod
+    def from_ffprobe(cls, data: dict) -> "StreamInfo":
+        return cls(
+            index=_int(data.get("index")),
+            codec_type=data.get("codec_type", ""),
+            codec_name=data.get("codec_name", ""),
+            width=_int(data.get("width")),
+            height=_int(data.get("height")),
+            fps=_rate(data.get("avg_frame_rate")) or _rate(data.get("r_frame_rate")),
+            pix_fmt=data.get("pix_fmt", ""),
+            channels=_int(data.get("channels")),
+            sample_rate=_int(data.get("sample_rate")),
+            bit_rate=_int(data.get("bit_rate")),
+            duration=_float(data.get("duration")),
+            nb_frames=_int(data.get("nb_frames")),
+        )
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    path: str
+    format_name: str
+    duration: float
+    size: int
+    bit_rate: int
+    streams: Tuple[StreamInfo, ...] = field(default_factory=tuple)
+
+    @classmethod
+    def from_ffprobe(cls, path: str, data: dict) -> "MediaInfo":
+        fmt = data.get("format", {})
+        return cls(
+            path=path,
+            format_name=fmt.get("format_name", ""),
+            duration=_float(fmt.get("duration")),
+            size=_int(fmt.get("size")),
+            bit_rate=_int(fmt.get("bit_rate")),
+            streams=tuple(StreamInfo.from_ffprobe(s) for s in data.get("streams", [])),
+        )
+
+    def _first(self, codec_type: str) -> Optional[StreamInfo]:
+        return next((s for s in self.streams if s.codec_type == codec_type), None)
+
+    @property
+    def video(self) -> Optional[StreamInfo]:
+        return self._first("video")
+
+    @property
+    def audio(self) -> Optional[StreamInfo]:
+        return self._first("audio")
+
+    @property
+    def total_frames(self) -> int:
+        """Frames del vídeo: `nb_frames` si el contenedor lo da, si no fps * duración."""
+        video = self.video
+        if video is None:
+            return 0
+        if video.nb_frames:
+            return video.nb_frames
+        return int(video.fps * (video.duration or self.duration))
+
+    def summary(self) -> Dict[str, str]:
+        """Resumen legible para la UI (formato histórico de `get_video_info`)."""
+        video = self.video
+        audio = self.audio
+        return {
+            "name": os.path.basename(self.path),
+            "duration": f"{self.duration:.0f} sec",
+            "resolution": f"{video.width if video else '?'}x{video.height if video else '?'}",
+            "format": self.format_name or "–",
+            "vcodec": video.codec_name if video else "–",
+            "acodec": audio.codec_name if audio else "–",
+            "size": f"{self.size / (1024**2):.1f} MB",
+        }
+
+
+_cache: "OrderedDict[Tuple[str, int, int], MediaInfo]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def probe(path: str) -> MediaInfo:
+    """Sondea `path` (o lo recupera de la caché si no ha cambiado desde el último sondeo).
+
+    Lanza `OSError` si el fichero no existe, `subprocess.CalledProcessError`
+    si ffprobe falla y `ValueError` si su salida no es JSON válido.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _lock:
+        info = _cache.get(key)
+        if info is not None:
+            _cache.move_to_end(key)
+            return info
+
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    info = MediaInfo.from_ffprobe(path, json.loads(result.stdout or "{}"))
+
+    with _lock:
+        _cache[key] = info
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return info
+
+
+def probe_duration(path: str) -> float:
+    """Duración en segundos; 0.0 si no se puede sondear (semántica de `get_video_duration`)."""
+    try:
+        return probe(path).duration
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return 0.0
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,169 @@
+"""Progreso de ffmpeg: parseo por proceso y envío agrupado y limitado en frecuencia.
+
+`ProgressParser` interpreta los bloques `clave=valor` de `-progress` de un
+único proceso de ffmpeg (un parser por proceso, sin estado global) y emite un
+`ProgressRecord` por bloque completo, con porcentaje y ETA calculados a partir
+de la duración sondeada.
+
+Los lectores de stderr producen una actualización por cada bloque de
+`-progress`; enviarlas una a una (y esperando respuesta) satura al receptor
+cuando hay muchas codificaciones en paralelo y frena al propio lector. El
+`ProgressReporter` se queda solo con el último valor de cada campo y lo envía
+en un lote como mucho cada `interval` segundos, sin esperar respuesta.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+# Claves de `-progress` que se conservan; el resto del bloque se descarta sin copiarlo
+_KEYS = frozenset(("frame", "fps", "out_time_us", "out_time_ms", "bitrate", "speed"))
+
+
+def _number(value: Optional[str], suffix: str = "") -> float:
+    """`"3.91x"` → 3.91, `"790.1kbits/s"` → 790.1; 0.0 para `N/A` o valores vacíos."""
+    if not value:
+        return 0.0
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def format_time(us: int) -> str:
+    """Microsegundos → `HH:MM:SS.ffffff` (formato de `out_time` de ffmpeg)."""
+    seconds, micros = divmod(max(us, 0), 1_000_000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{micros:06d}"
+
+
+@dataclass(frozen=True)
+class ProgressRecord:
+    frame: int
+    fps: float
+    out_time_us: int
+    speed: float
+    bitrate_kbps: float
+    percent: float = 0.0
+    eta: Optional[float] = None  # segundos restantes; None si aún no se puede estimar
+    done: bool = False
+
+    def summary(self) -> str:
+        """Línea legible con el formato histórico que espera la UI (`frames= … | speed= …`)."""
+        if self.done:
+            return "completed"
+        return (
+            f" frames= {self.frame} | fps= {self.fps:.2f} | "
+            f"time= {format_time(self.out_time_us)} | bitrate= {self.bitrate_kbps:.1f}kbits/s | "
+            f"speed= {self.speed:.2f}x"
+        )
+
+    def to_updates(self) -> Dict[str, object]:
+        """Campos para `StatusTracker.apply_updates`."""
+        return {"log_line": self.summary(), "progress": round(self.percent, 1), "eta": self.eta}
+
+
+class ProgressParser:
+    """Parser incremental de la salida `-progress` de un proceso de ffmpeg.
+
+    `feed(line)` devuelve un `ProgressRecord` al cerrar cada bloque (línea
+    `progress=continue|end`) y `None` en el resto de líneas. No es seguro
+    compartirlo entre procesos: cada ffmpeg debe tener el suyo.
+    """
+
+    __slots__ = ("duration", "_fields", "last")
+
+    def __init__(self, duration: float = 0.0) -> None:
+        self.duration = duration
+        self._fields: Dict[str, str] = {}
+        self.last: Optional[ProgressRecord] = None
+
+    def feed(self, line: str) -> Optional[ProgressRecord]:
+        key, sep, value = line.partition("=")
+        if not sep:
+            return None
+        key = key.strip()
+        if key == "progress":
+            record = self._record(value.strip() == "end")
+            self._fields.clear()
+            self.last = record
+            return record
+        if key in _KEYS:
+            self._fields[key] = value.strip()
+        return None
+
+    def _record(self, done: bool) -> ProgressRecord:
+        f = self._fields
+        # `out_time_ms` también va en microsegundos (error histórico de ffmpeg)
+        out_time_us = int(_number(f.get("out_time_us") or f.get("out_time_ms")))
+        speed = _number(f.get("speed"), "x")
+        percent, eta = 0.0, None
+        if self.duration > 0:
+            elapsed = out_time_us / 1_000_000
+            percent = 100.0 if done else min(100.0, 100.0 * elapsed / self.duration)
+            if done:
+                eta = 0.0
+            elif speed > 0:
+                eta = max(0.0, self.duration - elapsed) / speed
+        return ProgressRecord(
+            frame=int(_number(f.get("frame"))),
+            fps=_number(f.get("fps")),
+            out_time_us=out_time_us,
+            speed=speed,
+            bitrate_kbps=_number(f.get("bitrate"), "kbits/s"),
+            percent=percent,
+            eta=eta,
+            done=done,
+        )
+
+
+# Recibe un lote {campo: último valor}; no debe bloquear (p. ej. `actor.m.remote`)
+Sender = Callable[[Dict[str, object]], object]
+
+
+class ProgressReporter:
+    """Agrupa actualizaciones y las envía como mucho cada `interval` segundos."""
+
+    def __init__(self, send: Sender, interval: float = 0.5) -> None:
+        self._send = send
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending: Dict[str, object] = {}
+        self._last_flush = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self.sent = 0
+
+    def update(self, **fields: object) -> None:
+        """Registra los últimos valores; si ha pasado el intervalo, envía el lote."""
+        with self._lock:
+            self._pending.update(fields)
+            wait = self._last_flush + self.interval - time.monotonic()
+            if wait > 0:
+                # Garantiza que el último valor sale aunque no lleguen más líneas
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if batch:
+            self.sent += 1
+            self._send(batch)
+
+    def close(self) -> None:
+        """Envía lo pendiente; llamar al terminar el proceso de ffmpeg."""
+        self.flush()
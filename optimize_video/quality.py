@@ -0,0 +1,183 @@
+"""Búsqueda de calidad por título: el CQ/CRF más alto que cumple una métrica objetivo.
+
+En lugar de codificar todo con un CQ/CRF fijo, se extraen unos pocos clips
+cortos repartidos por el vídeo (ya escalados como en el paso de
+optimización), se codifican con cada valor candidato y se comparan con su
+referencia con los filtros de ffmpeg (`ssim`, `psnr` o `libvmaf` si está
+compilado). Se elige el valor de menor bitrate cuya puntuación media llega al
+objetivo: una grabación de pantalla estática acaba con un CQ alto y un vídeo
+con mucho movimiento con uno bajo.
+
+Las codificaciones de muestra (clips x candidatos) se lanzan en paralelo.
+"""
+
+from __future__ import annotations
+
+import functools
+import os
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .encoders import Encoder
+from .probe import probe_duration
+
+METRICS = ("ssim", "psnr", "vmaf")
+
+# Objetivos por defecto: diferencias poco visibles a 720p
+DEFAULT_TARGETS: Dict[str, float] = {"ssim": 0.97, "psnr": 40.0, "vmaf": 93.0}
+
+# Candidatos en escala CQ/CRF de H.264 (ver `Encoder.args`)
+DEFAULT_CANDIDATES: Tuple[int, ...] = (19, 22, 25, 28, 31, 34)
+
+_SCORE = {
+    "ssim": re.compile(r"SSIM .*All:([0-9.]+)"),
+    "psnr": re.compile(r"PSNR .*average:([0-9.]+|inf)"),
+    "vmaf": re.compile(r"VMAF score[:=]\s*([0-9.]+)"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def has_vmaf(ffmpeg: str = "ffmpeg") -> bool:
+    """¿Está compilado el filtro `libvmaf` en ffmpeg?"""
+    try:
+        out = subprocess.run([ffmpeg, "-hide_banner", "-filters"], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return any(line.split()[1:2] == ["libvmaf"] for line in out.splitlines())
+
+
+def sample_starts(duration: float, clips: int, clip_seconds: float) -> List[float]:
+    """Inicios de `clips` clips repartidos por el vídeo, evitando el 5 % inicial y final."""
+    if duration <= clip_seconds * clips or clips <= 1:
+        # Vídeo corto: un único clip desde el principio (o el vídeo entero)
+        return [0.0]
+    lo, hi = duration * 0.05, duration * 0.95 - clip_seconds
+    step = (hi - lo) / (clips - 1)
+    return [round(lo + i * step, 3) for i in range(clips)]
+
+
+def score(distorted: str, reference: str, metric: str) -> float:
+    """Puntuación de `distorted` frente a `reference` (mismo tamaño y frames)."""
+    graph = {
+        "ssim": "[0:v][1:v]ssim",
+        "psnr": "[0:v][1:v]psnr",
+        "vmaf": f"[0:v][1:v]libvmaf=n_threads={os.cpu_count() or 1}",
+    }[metric]
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", distorted, "-i", reference, "-lavfi", graph, "-f", "null", "-"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    match = _SCORE[metric].findall(result.stderr)
+    if not match:
+        raise ValueError(f"ffmpeg no devolvió puntuación {metric}")
+    return 100.0 if match[-1] == "inf" else float(match[-1])
+
+
+@dataclass(frozen=True)
+class Trial:
+    quality: int
+    score: float       # media de los clips
+    kbps: float        # bitrate medio de los clips codificados
+
+    def to_dict(self) -> dict:
+        return {"quality": self.quality, "score": round(self.score, 4), "kbps": round(self.kbps, 1)}
+
+
+@dataclass(frozen=True)
+class QualityChoice:
+    quality: int
+    metric: str
+    target: float
+    met: bool                     # False: ningún candidato llegó y se usa el mejor
+    trials: Tuple[Trial, ...]
+
+    def to_dict(self) -> dict:
+        return {
+            "quality": self.quality,
+            "metric": self.metric,
+            "target": self.target,
+            "met": self.met,
+            "trials": [t.to_dict() for t in self.trials],
+        }
+
+
+def search_quality(
+    video_path: str,
+    encoder: Encoder,
+    *,
+    duration: float,
+    target: Optional[float] = None,
+    metric: str = "ssim",
+    candidates: Sequence[int] = DEFAULT_CANDIDATES,
+    clips: int = 3,
+    clip_seconds: float = 4.0,
+    vf: str = "scale=1280:720,fps=30",
+    bitrate: Optional[str] = None,
+    gpu: Optional[str] = None,
+    jobs: int = 4,
+    workdir: Optional[str] = None,
+) -> QualityChoice:
+    """Prueba `candidates` sobre clips de muestra y devuelve el CQ/CRF elegido.
+
+    `bitrate` se pasa tal cual a `Encoder.args` (techo/objetivo), para que las
+    muestras se codifiquen igual que la pasada final.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Métrica desconocida: {metric}")
+    if metric == "vmaf" and not has_vmaf():
+        print("libvmaf no disponible en ffmpeg: se usa SSIM")
+        metric = "ssim"
+    if target is None:
+        target = DEFAULT_TARGETS[metric]
+    candidates = sorted(set(candidates))
+    starts = sample_starts(duration, clips, clip_seconds)
+
+    with tempfile.TemporaryDirectory(prefix="quality-", dir=workdir) as tmp, ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        # Referencias: clips ya escalados y sin pérdidas, así muestra y referencia comparten frames
+        def reference(i: int, start: float) -> str:
+            out = os.path.join(tmp, f"ref{i}.mkv")
+            subprocess.run(
+                ["ffmpeg", "-hide_banner", "-v", "error", "-y", "-ss", str(start), "-i", video_path,
+                 "-t", str(clip_seconds), "-vf", vf, "-an", "-c:v", "ffv1", out],
+                check=True,
+            )
+            return out
+
+        refs = list(pool.map(lambda args: reference(*args), enumerate(starts)))
+
+        def trial(job: Tuple[int, int]) -> Tuple[int, float, float]:
+            i, quality = job
+            out = os.path.join(tmp, f"q{quality}-{i}.mkv")
+            subprocess.run(
+                ["ffmpeg", "-hide_banner", "-v", "error", "-y", "-i", refs[i],
+                 *encoder.args(quality=quality, bitrate=bitrate, gpu=gpu), "-an", out],
+                check=True,
+            )
+            seconds = _seconds(refs[i]) or clip_seconds
+            return quality, score(out, refs[i], metric), os.path.getsize(out) * 8 / 1000 / seconds
+
+        results = list(pool.map(trial, [(i, q) for q in candidates for i in range(len(refs))]))
+
+    trials = []
+    for quality in candidates:
+        rows = [(s, k) for q, s, k in results if q == quality]
+        trials.append(Trial(quality, sum(s for s, _ in rows) / len(rows), sum(k for _, k in rows) / len(rows)))
+
+    passing = [t for t in trials if t.score >= target]
+    if passing:
+        best = min(passing, key=lambda t: (t.kbps, -t.quality))
+        return QualityChoice(best.quality, metric, target, True, tuple(trials))
+    best = max(trials, key=lambda t: t.score)
+    return QualityChoice(best.quality, metric, target, False, tuple(trials))
+
+
+def _seconds(path: str) -> float:
+    try:
+        return probe_duration(path)
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return 0.0
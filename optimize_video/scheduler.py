@@ -0,0 +1,148 @@
+"""Planificador de trabajos con un pool acotado de workers.
+
+Cada vídeo es un `Job` con su propio estado (paso actual, mensaje, tiempos).
+Los workers compiten por dos tipos de plaza que se cuentan por separado:
+
+ - plazas de codificador (`encoder_slots`): sesiones NVENC/GPU simultáneas;
+ - plazas de CPU (`cpu_slots`): copias de streams, ffprobe, validación, limpieza.
+
+Así, con un único codificador, el resto de workers puede ir reparando,
+validando o limpiando otros vídeos en lugar de esperar en cola.
+
+Además, antes de escribir nada cada trabajo reserva su espacio en disco
+(`disk`, ver `diskbudget.py`) y espera en `waiting` mientras no quepa.
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .diskbudget import DiskBudget
+
+
+class Job:
+    """Estado de un vídeo en proceso; lo actualiza el worker que lo ejecuta."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, path: str) -> None:
+        self.id = next(Job._ids)
+        self.path = path
+        self.name = os.path.basename(path)
+        self.step = 0
+        self.state = "queued"  # queued | waiting | running | done | error
+        self.message = ""
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "path": self.path,
+            "step": self.step,
+            "state": self.state,
+            "message": self.message,
+            "elapsed": round((self.finished or time.time()) - (self.started or self.created), 1),
+        }
+
+
+class JobScheduler:
+    """Ejecuta trabajos en `workers` hilos limitando plazas de codificador y de CPU."""
+
+    def __init__(self, workers: Optional[int] = None, encoder_slots: int = 1, cpu_slots: Optional[int] = None) -> None:
+        cpus = os.cpu_count() or 1
+        self.workers = workers or cpus
+        self.encoder_slots = encoder_slots
+        self.cpu_slots = cpu_slots or cpus
+        self._encoder = threading.BoundedSemaphore(self.encoder_slots)
+        self._cpu = threading.BoundedSemaphore(self.cpu_slots)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Job] = {}
+
+    @classmethod
+    def from_env(cls) -> "JobScheduler":
+        """Configuración por variables de entorno: WORKERS, ENCODER_SLOTS, CPU_SLOTS."""
+        def env_int(name: str) -> Optional[int]:
+            value = os.environ.get(name)
+            return int(value) if value else None
+
+        return cls(
+            workers=env_int("WORKERS"),
+            encoder_slots=env_int("ENCODER_SLOTS") or 1,
+            cpu_slots=env_int("CPU_SLOTS"),
+        )
+
+    @contextmanager
+    def _slot(self, job: Job, sem: threading.BoundedSemaphore, step: int) -> Iterator[None]:
+        job.step = step
+        job.state = "waiting"
+        with sem:
+            job.state = "running"
+            yield
+
+    def encoder(self, job: Job, step: int):
+        """Contexto que reserva una plaza de codificador para el paso `step`."""
+        return self._slot(job, self._encoder, step)
+
+    def cpu(self, job: Job, step: int):
+        """Contexto que reserva una plaza de CPU para el paso `step`."""
+        return self._slot(job, self._cpu, step)
+
+    def disk(self, job: Job, step: int, budget: DiskBudget, key: str, nbytes: int) -> None:
+        """Reserva `nbytes` en `budget` para el paso `step`; el trabajo espera en `waiting` si no caben."""
+        job.step = step
+
+        def waiting(free: int) -> None:
+            job.state = "waiting"
+            job.message = f"Esperando espacio en disco ({nbytes / 1024**3:.1f} GB, libres {max(0, free) / 1024**3:.1f} GB)"
+
+        budget.acquire(key, nbytes, on_wait=waiting)
+        job.state = "running"
+        job.message = ""
+
+    def submit(self, path: str, fn: Callable[[Job], None]) -> Job:
+        """Encola `fn(job)`; el trabajo se olvida al terminar (su resultado va al historial)."""
+        job = Job(path)
+        with self._lock:
+            self._jobs[job.id] = job
+
+        def run() -> None:
+            job.started = time.time()
+            job.state = "running"
+            try:
+                fn(job)
+                job.state = "done"
+            except Exception as e:
+                job.state = "error"
+                job.message = str(e)
+            finally:
+                job.finished = time.time()
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+
+        self._executor.submit(run)
+        return job
+
+    def jobs(self) -> List[dict]:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def status(self) -> dict:
+        jobs = self.jobs()
+        return {
+            "jobs": jobs,
+            "running": sum(1 for j in jobs if j["state"] == "running"),
+            "queued": sum(1 for j in jobs if j["state"] in ("queued", "waiting")),
+            "workers": self.workers,
+            "encoder_slots": self.encoder_slots,
+            "cpu_slots": self.cpu_slots,
+        }
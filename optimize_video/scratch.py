@@ -0,0 +1,213 @@
+"""Directorio de trabajo por vídeo y publicación atómica de las salidas.
+
+Los pasos del pipeline (`_repaired`, `_reduced`, la salida optimizada, los
+segmentos, los clips de muestra, los peldaños ABR...) se escriben en un
+directorio propio de cada trabajo, nunca junto al original ni en la ruta
+final:
+
+    <raíz>/<clave>/            raíz = SCRATCH_DIR / --scratch-dir, o
+        .lock                         <carpeta>/.video-optimizer-tmp
+        video_repaired.mkv
+        video-optimized.mkv
+        ...
+
+Solo tras validar se publica cada salida con `publish`: un `rename` atómico
+(o, si el directorio de trabajo está en otro disco, copia a un temporal
+oculto en el destino + `rename`), así que un fallo o un `kill` nunca dejan
+un `-optimized.mkv` truncado a la vista.
+
+Mientras un trabajo usa su directorio mantiene un `flock` sobre `.lock`;
+`sweep` (al arrancar) borra los directorios que nadie tiene bloqueados y que
+no pertenecen a un trabajo que se vaya a reanudar. Los escáneres de carpetas
+no entran en `SCRATCH_DIRNAME` (ver `watcher.py`).
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import platform
+import shutil
+import time
+from typing import Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, se usa la antigüedad del directorio
+    fcntl = None
+
+# Nombre de la raíz por defecto, junto a los vídeos (mismo volumen: rename atómico)
+SCRATCH_DIRNAME = ".video-optimizer-tmp"
+
+# Sin flock: un directorio sin tocar durante este tiempo se considera huérfano
+STALE_SECONDS = 24 * 3600
+
+LOCK_NAME = ".lock"
+
+
+def scratch_root(video_path: str, configured: Optional[str] = None) -> str:
+    """Raíz de trabajo: la configurada o `<carpeta del vídeo>/.video-optimizer-tmp`."""
+    if configured:
+        return os.path.abspath(configured)
+    return os.path.join(os.path.dirname(os.path.abspath(video_path)), SCRATCH_DIRNAME)
+
+
+def job_key(video_path: str, job_id: Optional[int] = None) -> str:
+    """Clave del directorio: fija por trabajo registrado (para reanudar) o por ruta de entrada."""
+    if job_id is not None:
+        return f"job-{job_id}"
+    digest = hashlib.sha1(os.path.abspath(video_path).encode("utf-8", "surrogateescape")).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(video_path))[0][:40]
+    return f"{stem}-{digest}"
+
+
+class JobScratch:
+    """Directorio de trabajo de un vídeo; `with` lo crea y lo bloquea mientras dura el trabajo."""
+
+    def __init__(self, root: str, key: str) -> None:
+        self.root = root
+        self.key = key
+        self.dir = os.path.join(root, key)
+        self._lock_fd: Optional[int] = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def open(self) -> "JobScratch":
+        for attempt in range(3):
+            try:
+                os.makedirs(self.dir, exist_ok=True)
+                break
+            except FileNotFoundError:
+                # Otro trabajo borró la raíz vacía (`remove_if_empty`) entre crearla y crear la nuestra
+                if attempt == 2:
+                    raise
+        fd = os.open(self.path(LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                raise RuntimeError(f"El directorio de trabajo {self.dir} está en uso por otro proceso")
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps({"pid": os.getpid(), "host": platform.node(), "started": time.time()}).encode())
+        self._lock_fd = fd
+        return self
+
+    def close(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # libera el flock
+            self._lock_fd = None
+
+    def remove(self) -> None:
+        """Borra el directorio entero (tras publicar, o al fallar)."""
+        self.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self) -> "JobScratch":
+        return self.open()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _hidden_temp(dest: str) -> str:
+    # Oculto y con el marcador de parcial: ningún escáner lo toma por entrada
+    return os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.partial-{os.getpid()}")
+
+
+def publish(src: str, dest: str) -> None:
+    """Mueve `src` (fichero o carpeta) a `dest` de forma atómica, reemplazando lo que hubiera."""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)) or ".", exist_ok=True)
+    try:
+        _replace(src, dest)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Otro volumen: se copia junto al destino y se publica con rename (atómico en ese volumen)
+    tmp = _hidden_temp(dest)
+    try:
+        if os.path.isdir(src):
+            shutil.copytree(src, tmp)
+        else:
+            shutil.copyfile(src, tmp)
+            with open(tmp, "rb") as fh:
+                os.fsync(fh.fileno())
+        _replace(tmp, dest)
+    except BaseException:
+        _discard(tmp)
+        raise
+    _discard(src)
+
+
+def _replace(src: str, dest: str) -> None:
+    if os.path.isdir(src) and os.path.isdir(dest):
+        # rename no reemplaza carpetas no vacías: la anterior se aparta y se borra después
+        old = _hidden_temp(dest) + ".old"
+        os.rename(dest, old)
+        os.rename(src, dest)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(src, dest)
+
+
+def _discard(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_if_empty(root: str) -> None:
+    """Borra la raíz de trabajo si ya no queda ningún trabajo en ella."""
+    try:
+        os.rmdir(root)
+    except OSError:
+        pass
+
+
+def in_use(path: str) -> bool:
+    """¿Tiene algún proceso bloqueado el directorio de trabajo `path`?"""
+    lock = os.path.join(path, LOCK_NAME)
+    if fcntl is None:
+        try:
+            return time.time() - os.path.getmtime(lock) < STALE_SECONDS
+        except OSError:
+            return time.time() - os.path.getmtime(path) < STALE_SECONDS
+    try:
+        fd = os.open(lock, os.O_RDWR)
+    except OSError:
+        return False  # sin .lock: nunca llegó a abrirse o ya se soltó
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except OSError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def sweep(root: str, keep: Iterable[str] = ()) -> int:
+    """Borra los directorios de trabajo huérfanos de `root`; devuelve cuántos.
+
+    Se conservan los de `keep` (trabajos que se van a reanudar) y los que otro
+    proceso tiene bloqueados (en curso).
+    """
+    keep = set(keep)
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return 0
+    removed = 0
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False) or entry.name in keep or in_use(entry.path):
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed += 1
+    return removed
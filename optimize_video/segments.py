@@ -0,0 +1,129 @@
+"""Codificación por segmentos en paralelo.
+
+Un vídeo largo se divide en segmentos alineados con keyframes (copia de
+streams, sin recodificar), cada segmento se codifica por separado y en
+paralelo (procesos locales en la CLI, tareas Ray en el servidor), el audio se
+codifica una única vez como un trabajo más, y el resultado se une con el
+demuxer `concat` sin volver a codificar.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from .encoders import resolve
+from .metrics import current_stage, run_child
+from .probe import probe
+
+# Ejecuta una lista de comandos independientes y espera a que terminen todos
+Runner = Callable[[Sequence[List[str]]], None]
+
+
+def keyframe_times(video_path: str) -> List[float]:
+    """Instantes (s) de los keyframes del primer stream de vídeo, leyendo solo paquetes."""
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags",
+            "-of", "csv=p=0",
+            video_path,
+        ],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    times = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            times.append(float(pts))
+    return sorted(times)
+
+
+def plan_split_points(keyframes: Sequence[float], duration: float, segments: int) -> List[float]:
+    """Elige `segments - 1` keyframes lo más cerca posible de cortes equidistantes."""
+    points: List[float] = []
+    candidates = [t for t in keyframes if 0 < t < duration]
+    for i in range(1, segments):
+        if not candidates:
+            break
+        target = duration * i / segments
+        best = min(candidates, key=lambda t: abs(t - target))
+        if not points or best > points[-1]:
+            points.append(best)
+    return points
+
+
+def run_parallel(cmds: Sequence[List[str]], jobs: Optional[int] = None) -> None:
+    """Runner local: lanza los comandos con como mucho `jobs` procesos a la vez."""
+    stats = current_stage()  # los hilos del pool anotan la CPU en la etapa de quien llama
+
+    def run(cmd: List[str]) -> None:
+        cmd = resolve(cmd)
+        print("Ejecutando:", " ".join(cmd))
+        run_child(cmd, stats=stats)
+
+    with ThreadPoolExecutor(max_workers=jobs or len(cmds) or 1) as pool:
+        for future in [pool.submit(run, cmd) for cmd in cmds]:
+            future.result()
+
+
+def encode_chunked(
+    video_path: str,
+    output_path: str,
+    *,
+    duration: float,
+    segments: int,
+    video_args: Sequence[str],
+    audio_args: Sequence[str] = ("-c:a", "aac", "-ac", "2"),
+    runner: Runner = run_parallel,
+    workdir: Optional[str] = None,
+) -> int:
+    """Codifica `video_path` en `output_path` repartiendo el vídeo en segmentos.
+
+    `video_args` son los argumentos de filtro/codificador de vídeo que se
+    aplican a cada segmento (pueden ser `encoders.deferred_args(...)` para que
+    cada nodo use su propio codificador). Devuelve el número de segmentos realmente usados.
+    """
+    points = plan_split_points(keyframe_times(video_path), duration, segments)
+    workdir = workdir or tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        # 1) Partir por keyframes copiando el vídeo (rápido, sin pérdidas)
+        split_cmd = ["ffmpeg", "-y", "-v", "error", "-err_detect", "ignore_err", "-i", video_path, "-map", "0:v:0", "-c", "copy"]
+        if points:
+            split_cmd += ["-f", "segment", "-segment_times", ",".join(f"{p:.6f}" for p in points),
+                          "-reset_timestamps", "1", os.path.join(workdir, "src%04d.mkv")]
+        else:
+            split_cmd += [os.path.join(workdir, "src0000.mkv")]
+        run_child(split_cmd)
+        sources = sorted(f for f in os.listdir(workdir) if f.startswith("src"))
+
+        # 2) Codificar segmentos y audio a la vez; el audio se hace una sola vez
+        encoded = [os.path.join(workdir, "enc" + name[3:]) for name in sources]
+        cmds = [
+            ["ffmpeg", "-y", "-v", "error", "-i", os.path.join(workdir, src), "-an", *video_args, enc]
+            for src, enc in zip(sources, encoded)
+        ]
+        audio = os.path.join(workdir, "audio.mka")
+        has_audio = probe(video_path).audio is not None
+        if has_audio:
+            cmds.append(["ffmpeg", "-y", "-v", "error", "-i", video_path, "-vn", "-map", "0:a:0", *audio_args, audio])
+        runner(cmds)
+
+        # 3) Unir con el demuxer concat (copia) y añadir el audio
+        concat_list = os.path.join(workdir, "concat.txt")
+        with open(concat_list, "w") as fh:
+            for enc in encoded:
+                fh.write("file '{}'\n".format(enc.replace("'", "'\\''")))
+        concat_cmd = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", concat_list]
+        if has_audio:
+            concat_cmd += ["-i", audio, "-map", "0:v:0", "-map", "1:a:0"]
+        concat_cmd += ["-c", "copy", "-movflags", "faststart", output_path]
+        run_child(concat_cmd)
+        return len(sources)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,122 @@
+"""Encadena etapas de ffmpeg mediante tuberías del sistema operativo.
+
+Cuando un pipeline necesita varias pasadas, los intermedios viajan por
+stdout/stdin en Matroska o NUT en lugar de escribirse junto al original:
+las etapas se solapan en el tiempo y el único fichero en disco es la salida
+de la última etapa. El búfer entre etapas es el de la propia tubería (acotado
+por el kernel), de modo que una etapa lenta frena a la anterior en vez de
+acumular datos en memoria.
+"""
+
+from __future__ import annotations
+
+import queue
+import subprocess
+import threading
+from typing import IO, Callable, List, Optional, Sequence
+
+from .metrics import current_stage, wait_child
+
+pipe_formats = ("matroska", "nut")
+
+# Tamaño de las tuberías entre etapas (Linux permite ampliarlo con F_SETPIPE_SZ;
+# el valor por defecto de 64 KiB provoca demasiados cambios de contexto).
+PIPE_SIZE = 1024 * 1024
+
+
+def pipe_output(pipe_format: str = "matroska") -> List[str]:
+    """Argumentos de salida de una etapa intermedia (escribe en stdout)."""
+    return ["-f", pipe_format, "pipe:1"]
+
+
+def pipe_input(pipe_format: str = "matroska") -> List[str]:
+    """Argumentos de entrada de una etapa que lee de la anterior (stdin)."""
+    return ["-f", pipe_format, "-i", "pipe:0"]
+
+
+def _set_pipe_size(stream: IO[bytes], size: int) -> None:
+    try:
+        import fcntl
+
+        fcntl.fcntl(stream.fileno(), fcntl.F_SETPIPE_SZ, size)
+    except (ImportError, AttributeError, OSError):
+        pass
+
+
+def run_stages(
+    stages: Sequence[List[str]],
+    *,
+    stderr_reader: Optional[Callable[[IO[str]], None]] = None,
+    pipe_size: int = PIPE_SIZE,
+) -> None:
+    """Ejecuta `stages` en paralelo conectando stdout de cada una con stdin de la siguiente.
+
+    Cada etapa salvo la última debe escribir en `pipe:1` y cada etapa salvo la
+    primera leer de `pipe:0` (ver `pipe_output`/`pipe_input`). Si se indica
+    `stderr_reader`, consume en un hilo el stderr (texto) de la última etapa,
+    que es la que refleja el progreso de la salida final.
+
+    Lanza `subprocess.CalledProcessError` con la etapa que originó el fallo:
+    la primera en terminar con error (las demás acaban por EOF o tubería rota).
+    """
+    if not stages:
+        raise ValueError("Se necesita al menos una etapa")
+
+    procs: List[subprocess.Popen] = []
+    culprit: Optional[subprocess.Popen] = None
+    reader: Optional[threading.Thread] = None
+    try:
+        prev_stdout: Optional[IO[bytes]] = None
+        for idx, cmd in enumerate(stages):
+            last = idx == len(stages) - 1
+            read_err = last and stderr_reader is not None
+            print("Ejecutando:", " ".join(cmd))
+            proc = subprocess.Popen(
+                cmd,
+                stdin=prev_stdout if prev_stdout is not None else subprocess.DEVNULL,
+                stdout=None if last else subprocess.PIPE,
+                stderr=subprocess.PIPE if read_err else None,
+                text=read_err,
+                errors="replace" if read_err else None,
+            )
+            # El padre no debe conservar el extremo de lectura: así la etapa
+            # anterior recibe SIGPIPE/EPIPE si la siguiente termina antes de tiempo.
+            if prev_stdout is not None:
+                prev_stdout.close()
+            if not last:
+                _set_pipe_size(proc.stdout, pipe_size)
+                prev_stdout = proc.stdout
+            procs.append(proc)
+
+        if stderr_reader is not None:
+            reader = threading.Thread(target=stderr_reader, args=(procs[-1].stderr,), daemon=True)
+            reader.start()
+
+        # Si una etapa falla, las demás no tienen sentido: se terminan.
+        # La CPU de cada etapa se anota en la etapa de métricas del hilo que llama.
+        stats = current_stage()
+        exited: "queue.Queue[subprocess.Popen]" = queue.Queue()
+        for proc in procs:
+            threading.Thread(target=lambda p=proc: (wait_child(p, stats), exited.put(p)), daemon=True).start()
+        for _ in procs:
+            proc = exited.get()
+            if proc.returncode != 0 and culprit is None:
+                culprit = proc
+                for other in procs:
+                    if other.poll() is None:
+                        other.kill()
+    except BaseException:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+        raise
+    finally:
+        for proc in procs:
+            proc.wait()
+        if reader is not None:
+            reader.join()
+        if procs and procs[-1].stderr is not None:
+            procs[-1].stderr.close()
+
+    if culprit is not None:
+        raise subprocess.CalledProcessError(culprit.returncode, culprit.args)
@@ -0,0 +1,224 @@
+"""Subidas por trozos reanudables, escritas directamente en su ruta final.
+
+Protocolo (ver rutas `/upload` de `server-gpu-ray.py`):
+
+ 1. `init(nombre, tamaño)` crea la sesión y el fichero destino;
+ 2. el cliente envía trozos con su desplazamiento; cada uno se escribe con
+    `os.pwrite` en el fichero final, sin ficheros temporales ni copias;
+ 3. `complete` comprueba que llegó todo y entrega la ruta para encolarla.
+
+La sesión se guarda en un JSON junto a las subidas (`.uploads/<id>.json`): si
+se corta la conexión o se reinicia el servidor, el cliente pregunta el
+desplazamiento recibido y continúa desde ahí. Los trozos deben llegar en
+orden (se admite reenviar uno ya recibido), así lo recibido es siempre un
+prefijo del fichero y el tamaño en disco basta para saber dónde seguir.
+
+Con `early=True` se sondea la cabecera con ffprobe en cuanto llegan los
+primeros `early_bytes`, mientras sigue subiendo el resto: un fichero que no
+es vídeo se rechaza sin esperar a los gigas que faltan.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Optional
+
+from werkzeug.utils import secure_filename
+
+from .probe import probe
+from .watcher import VIDEO_EXTENSIONS
+
+CHUNK_SIZE = 8 * 1024 * 1024
+EARLY_BYTES = 16 * 1024 * 1024
+COPY_BUFFER = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Petición de subida no válida; `status` es el código HTTP a devolver."""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class Upload:
+    """Una subida en curso; los trozos de una misma subida se escriben de uno en uno."""
+
+    def __init__(self, upload_id: str, path: str, size: int, early: bool, created: Optional[float] = None) -> None:
+        self.id = upload_id
+        self.path = path
+        self.size = size
+        self.early = early
+        self.created = created or time.time()
+        self.lock = threading.Lock()
+        self.probe: Optional[dict] = None          # resultado del sondeo anticipado
+        self._probing = False
+        try:
+            self.offset = min(os.path.getsize(path), size)
+        except OSError:
+            self.offset = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": os.path.basename(self.path),
+            "size": self.size,
+            "offset": self.offset,
+            "early": self.early,
+            "probe": self.probe,
+        }
+
+    def meta(self) -> dict:
+        return {"id": self.id, "path": self.path, "size": self.size, "early": self.early, "created": self.created}
+
+
+class UploadManager:
+    """Sesiones de subida bajo `folder`; seguro entre los hilos de Flask."""
+
+    def __init__(self, folder: str, chunk_size: int = CHUNK_SIZE, early_bytes: int = EARLY_BYTES) -> None:
+        self.folder = os.path.abspath(folder)
+        self.state_dir = os.path.join(self.folder, ".uploads")
+        self.chunk_size = chunk_size
+        self.early_bytes = early_bytes
+        self._lock = threading.Lock()
+        self._uploads: Dict[str, Upload] = {}
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, folder: str) -> "UploadManager":
+        """`UPLOAD_CHUNK_MB` (tamaño de trozo sugerido) y `UPLOAD_EARLY_MB` (cabecera a sondear)."""
+        return cls(
+            folder,
+            chunk_size=int(float(os.environ.get("UPLOAD_CHUNK_MB", "8")) * 1024 * 1024),
+            early_bytes=int(float(os.environ.get("UPLOAD_EARLY_MB", "16")) * 1024 * 1024),
+        )
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.state_dir, f"{upload_id}.json")
+
+    def init(self, filename: str, size: int, early: bool = False) -> Upload:
+        name = secure_filename(filename or "")
+        if not name or os.path.splitext(name)[1].lower() not in VIDEO_EXTENSIONS:
+            raise UploadError(f"Nombre o extensión no válidos: {filename}")
+        if size <= 0:
+            raise UploadError("Tamaño de subida no válido")
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.folder, name)
+        if os.path.exists(path):
+            stem, ext = os.path.splitext(name)
+            path = os.path.join(self.folder, f"{stem}-{upload_id[:8]}{ext}")
+        # Se crea vacío: el tamaño en disco es lo recibido hasta ahora
+        open(path, "wb").close()
+        upload = Upload(upload_id, path, size, early)
+        with open(self._meta_path(upload_id), "w") as fh:
+            json.dump(upload.meta(), fh)
+        with self._lock:
+            self._uploads[upload_id] = upload
+        return upload
+
+    def get(self, upload_id: str) -> Upload:
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is not None:
+                return upload
+            # Tras un reinicio: se recupera la sesión del JSON y lo recibido del fichero
+            try:
+                with open(self._meta_path(os.path.basename(upload_id))) as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                raise UploadError("Subida no encontrada", 404)
+            upload = Upload(meta["id"], meta["path"], meta["size"], meta.get("early", False), meta.get("created"))
+            self._uploads[upload_id] = upload
+            return upload
+
+    def write(self, upload_id: str, offset: int, stream: BinaryIO, length: Optional[int] = None) -> Upload:
+        """Escribe el cuerpo de `stream` en `offset` con `os.pwrite`, por bloques y sin cargarlo en memoria."""
+        upload = self.get(upload_id)
+        with upload.lock:
+            if offset > upload.offset:
+                raise UploadError("Desplazamiento por delante de lo recibido", 409, upload.offset)
+            fd = os.open(upload.path, os.O_WRONLY)
+            try:
+                position = offset
+                remaining = length
+                while remaining is None or remaining > 0:
+                    block = stream.read(COPY_BUFFER if remaining is None else min(COPY_BUFFER, remaining))
+                    if not block:
+                        break
+                    if position + len(block) > upload.size:
+                        raise UploadError("El trozo sobrepasa el tamaño declarado", 400, upload.offset)
+                    written = 0
+                    while written < len(block):
+                        written += os.pwrite(fd, block[written:], position + written)
+                    position += len(block)
+                    if remaining is not None:
+                        remaining -= len(block)
+            finally:
+                os.close(fd)
+                # Aunque el trozo se corte a medias, lo escrito cuenta (prefijo contiguo)
+                upload.offset = max(upload.offset, min(os.path.getsize(upload.path), upload.size))
+        if upload.early and upload.probe is None and upload.offset >= min(self.early_bytes, upload.size):
+            self._probe_early(upload)
+        return upload
+
+    def _probe_early(self, upload: Upload) -> None:
+        """Sondea la cabecera en segundo plano mientras sigue llegando el resto."""
+        with upload.lock:
+            if upload._probing:
+                return
+            upload._probing = True
+
+        def run() -> None:
+            try:
+                info = probe(upload.path)
+                result = {"ok": info.video is not None, **info.summary()}
+            except (subprocess.CalledProcessError, OSError, ValueError):
+                # Contenedores con el índice al final (mp4 sin faststart): se valida al completar
+                result = {"ok": None}
+            with upload.lock:
+                upload.probe = result
+
+        threading.Thread(target=run, name=f"probe:{upload.id}", daemon=True).start()
+
+    def complete(self, upload_id: str) -> Upload:
+        """Cierra la subida; lanza UploadError si falta algo o (en modo early) no es vídeo."""
+        upload = self.get(upload_id)
+        with upload.lock:
+            if upload.offset < upload.size:
+                raise UploadError("Faltan datos por subir", 409, upload.offset)
+            if upload.early and upload.probe is not None and upload.probe.get("ok") is False:
+                self._discard(upload)
+                raise UploadError("El archivo no contiene vídeo", 415)
+            fd = os.open(upload.path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._forget(upload)
+        return upload
+
+    def abort(self, upload_id: str) -> None:
+        upload = self.get(upload_id)
+        with upload.lock:
+            self._discard(upload)
+
+    def _discard(self, upload: Upload) -> None:
+        try:
+            os.remove(upload.path)
+        except OSError:
+            pass
+        self._forget(upload)
+
+    def _forget(self, upload: Upload) -> None:
+        with self._lock:
+            self._uploads.pop(upload.id, None)
+        try:
+            os.remove(self._meta_path(upload.id))
+        except OSError:
+            pass
@@ -0,0 +1,357 @@
+"""Vigilancia incremental de carpetas de entrada.
+
+En lugar de recorrer la carpeta entera con `os.walk` en cada `/process`, un
+`FolderWatcher` mantiene un índice de los ficheros vistos por (inodo, tamaño,
+mtime) y solo entrega los nuevos o reemplazados:
+
+ - en Linux se apoya en inotify (vía ctypes, sin dependencias): los eventos
+   de creación, escritura y renombrado marcan los ficheros como pendientes;
+ - si inotify no está disponible (otro sistema, límite de watches agotado),
+   hace un escaneo incremental: un `stat` por directorio conocido y solo se
+   relistan los directorios cuyo mtime cambió.
+
+Un fichero pendiente solo se entrega cuando deja de crecer (mismo tamaño y
+mtime durante `settle` segundos), así las subidas o copias a medias nunca se
+transcodifican. Las salidas e intermedios del propio pipeline se ignoran
+(`is_candidate`), y no se entra en los directorios de trabajo (`is_work_dir`).
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .scratch import SCRATCH_DIRNAME
+
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
+
+# Sufijos exactos (antes de la extensión) de los ficheros que genera el propio pipeline
+GENERATED_SUFFIXES = ("-optimized", "-final", "_repaired", "_reduced")
+
+# Directorios de trabajo del pipeline (scratch por trabajo, segmentos)
+WORK_DIR_PREFIXES = (SCRATCH_DIRNAME, ".segments-")
+
+# Máscara de inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+
+Key = Tuple[int, int, int]  # (inodo, tamaño, mtime_ns)
+
+
+def is_candidate(path: str) -> bool:
+    """¿Es un vídeo de entrada? (extensión válida y no es salida ni intermedio del pipeline)."""
+    stem, ext = os.path.splitext(os.path.basename(path))
+    if ext.lower() not in VIDEO_EXTENSIONS or stem.startswith("."):
+        return False
+    # Solo el sufijo: "video-final.mp4" es salida, "semi-finals.mkv" es una entrada más
+    return not stem.endswith(GENERATED_SUFFIXES)
+
+
+def is_work_dir(path: str) -> bool:
+    """¿Es un directorio de trabajo del pipeline? (su contenido son intermedios, nunca entradas)."""
+    return os.path.basename(path.rstrip(os.sep)).startswith(WORK_DIR_PREFIXES)
+
+
+def scan_videos(root: str) -> List[str]:
+    """Recorrido completo (modo clásico de `/process`), ignorando salidas e intermedios."""
+    if os.path.isfile(root):
+        return [root] if is_candidate(root) else []
+    found = []
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not is_work_dir(d)]
+        found.extend(os.path.join(dirpath, f) for f in files if is_candidate(f))
+    return found
+
+
+def _file_key(st: os.stat_result) -> Key:
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class _Inotify:
+    """Envoltorio mínimo de inotify(7) con ctypes; lanza OSError si no está disponible."""
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify solo existe en Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.dirs: Dict[int, str] = {}
+
+    def add(self, path: str) -> None:
+        wd = self._add(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)  # ENOSPC: límite max_user_watches
+        self.dirs[wd] = path
+
+    def read(self, timeout: float) -> List[Tuple[str, int]]:
+        """Eventos (ruta, máscara) llegados en `timeout` segundos; ("", IN_Q_OVERFLOW) si se perdieron."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, offset)
+            name = buf[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(("", IN_Q_OVERFLOW))
+                continue
+            directory = self.dirs.get(wd)
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            if directory is not None:
+                events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Vigila `root` y llama a `on_ready(rutas)` con los vídeos nuevos ya estables.
+
+    `poll()` hace una pasada y es lo único que hace falta para usarlo sin
+    hilos; `start()` lo ejecuta en segundo plano hasta `stop()`.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        on_ready: Callable[[List[str]], None],
+        settle: float = 10.0,
+        interval: float = 2.0,
+        use_inotify: Optional[bool] = None,
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.on_ready = on_ready
+        self.settle = settle
+        self.interval = interval
+        self.seen: Dict[str, Key] = {}                         # entregados
+        self.pending: Dict[str, Tuple[Key, float]] = {}        # ruta -> (clave, último cambio)
+        self._dirs: Dict[str, Tuple[int, List[str]]] = {}      # directorio -> (mtime_ns, subdirectorios)
+        self._inotify: Optional[_Inotify] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.delivered = 0
+        if use_inotify is not False:
+            try:
+                self._inotify = _Inotify()
+            except OSError:
+                if use_inotify:
+                    raise
+        self._scan_dir(self.root, force=True)
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "scan"
+
+    # -- descubrimiento -------------------------------------------------------
+
+    def _watch_dir(self, path: str) -> None:
+        if self._inotify is None:
+            return
+        try:
+            self._inotify.add(path)
+        except OSError:
+            # Sin más watches disponibles: se pasa al escaneo incremental
+            self._inotify.close()
+            self._inotify = None
+
+    def _scan_dir(self, path: str, force: bool = False) -> None:
+        """Relista `path` si su mtime cambió (o `force`) y desciende a sus subdirectorios."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._forget_dir(path)
+            return
+        known = self._dirs.get(path)
+        if known is not None and known[0] == mtime and not force:
+            for sub in known[1]:
+                self._scan_dir(sub)
+            return
+        if known is None:
+            self._watch_dir(path)
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not is_work_dir(entry.name):
+                            subdirs.append(entry.path)
+                    elif entry.is_file() and is_candidate(entry.name):
+                        self._touch(entry.path)
+        except OSError:
+            pass
+        self._dirs[path] = (mtime, subdirs)
+        for sub in subdirs:
+            self._scan_dir(sub, force=sub not in self._dirs)
+
+    def _forget_dir(self, path: str) -> None:
+        prefix = path.rstrip(os.sep) + os.sep
+        for d in [d for d in self._dirs if d == path or d.startswith(prefix)]:
+            del self._dirs[d]
+
+    def _touch(self, path: str) -> None:
+        """Registra un posible cambio en `path`: pasa a pendiente si su clave es nueva."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.seen.pop(path, None)
+            self.pending.pop(path, None)
+            return
+        key = _file_key(st)
+        if self.seen.get(path) == key:
+            return
+        previous = self.pending.get(path)
+        if previous is None or previous[0] != key:
+            self.pending[path] = (key, time.monotonic())
+
+    def _handle_events(self, events: Iterable[Tuple[str, int]]) -> None:
+        for path, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                self._scan_dir(self.root, force=True)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not is_work_dir(path):
+                    self._scan_dir(path, force=True)
+                elif mask & (IN_DELETE | IN_MOVED_FROM | IN_DELETE_SELF):
+                    self._forget_dir(path)
+            elif mask & IN_DELETE_SELF:
+                self._forget_dir(path)
+            elif is_candidate(path):
+                self._touch(path)
+
+    # -- ciclo ----------------------------------------------------------------
+
+    def poll(self, timeout: float = 0.0) -> List[str]:
+        """Una pasada: recoge cambios, comprueba los pendientes y entrega los estables."""
+        if self._inotify is not None:
+            self._handle_events(self._inotify.read(timeout))
+        else:
+            if timeout:
+                self._stop.wait(timeout)
+            self._scan_dir(self.root)
+
+        now = time.monotonic()
+        ready = []
+        for path, (key, changed) in list(self.pending.items()):
+            try:
+                current = _file_key(os.stat(path))
+            except OSError:
+                del self.pending[path]
+                continue
+            if current != key:
+                self.pending[path] = (current, now)   # sigue creciendo
+            elif now - changed >= self.settle:
+                del self.pending[path]
+                self.seen[path] = key
+                ready.append(path)
+        if ready:
+            self.delivered += len(ready)
+            self.on_ready(ready)
+        return ready
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll(self.interval)
+            except Exception as e:  # un error puntual (permisos, E/S) no debe parar la vigilancia
+                print(f"Error vigilando {self.root}: {e}")
+                self._stop.wait(self.interval)
+
+    def start(self) -> "FolderWatcher":
+        self._thread = threading.Thread(target=self._run, name=f"watch:{self.root}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def stats(self) -> dict:
+        return {
+            "folder": self.root,
+            "mode": self.mode,
+            "directories": len(self._dirs),
+            "pending": len(self.pending),
+            "delivered": self.delivered,
+        }
+
+
+class WatchManager:
+    """Vigilantes activos de un servidor, uno por carpeta (`WATCH_SETTLE`, `WATCH_INTERVAL`)."""
+
+    def __init__(self, on_ready: Callable[[List[str]], None], settle: float = 10.0, interval: float = 2.0) -> None:
+        self.on_ready = on_ready
+        self.settle = settle
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watchers: Dict[str, FolderWatcher] = {}
+
+    @classmethod
+    def from_env(cls, on_ready: Callable[[List[str]], None]) -> "WatchManager":
+        return cls(
+            on_ready,
+            settle=float(os.environ.get("WATCH_SETTLE", "10")),
+            interval=float(os.environ.get("WATCH_INTERVAL", "2")),
+        )
+
+    def watch(self, folder: str) -> FolderWatcher:
+        folder = os.path.abspath(folder)
+        with self._lock:
+            watcher = self._watchers.get(folder)
+            if watcher is None:
+                watcher = FolderWatcher(folder, self.on_ready, self.settle, self.interval).start()
+                self._watchers[folder] = watcher
+            return watcher
+
+    def unwatch(self, folder: str) -> bool:
+        with self._lock:
+            watcher = self._watchers.pop(os.path.abspath(folder), None)
+        if watcher is None:
+            return False
+        watcher.stop()
+        return True
+
+    def watch_env(self) -> None:
+        """Arranca los vigilantes de `WATCH_FOLDERS` (rutas separadas por `os.pathsep`)."""
+        for folder in filter(None, os.environ.get("WATCH_FOLDERS", "").split(os.pathsep)):
+            if os.path.isdir(folder):
+                self.watch(folder)
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [w.stats() for w in self._watchers.values()]
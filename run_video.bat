@@ -3,16 +3,25 @@ setlocal enabledelayedexpansion
 
 :: --- Validación de parámetros ---
 if "%~2"=="" (
-    echo Uso: %~nx0 ruta\al\video.mp4 ruta\de\salida
+    echo Uso: %~nx0 ruta\al\video.mp4^|ruta\a\carpeta ruta\de\salida [opciones de optimize_video, p. ej. --jobs 4]
     exit /b 1
 )
 
 set "INPUT_FILE=%~1"
 set "OUTPUT_DIR=%~2"
 
+:: Opciones adicionales (a partir del tercer parámetro) para optimize_video
+set "EXTRA_ARGS="
+:args
+if "%~3"=="" goto args_done
+set "EXTRA_ARGS=!EXTRA_ARGS! %3"
+shift /3
+goto args
+:args_done
+
 :: --- Comprobaciones ---
 if not exist "%INPUT_FILE%" (
-    echo Error: El archivo de entrada no existe: %INPUT_FILE%
+    echo Error: El archivo o carpeta de entrada no existe: %INPUT_FILE%
     exit /b 1
 )
 
@@ -23,22 +32,27 @@ if not exist "%OUTPUT_DIR%" (
 
 :: --- Rutas absolutas ---
 for %%A in ("%INPUT_FILE%") do set "INPUT_FILE_ABS=%%~fA"
-for %%A in ("%INPUT_FILE_ABS%") do set "INPUT_DIR_ABS=%%~dpA"
 for %%A in ("%OUTPUT_DIR%") do set "OUTPUT_DIR_ABS=%%~fA"
 
+:: --- Entrada dentro del contenedor: la carpeta entera (modo por lotes) o el archivo ---
+if exist "%INPUT_FILE_ABS%\*" (
+    set "INPUT_DIR_ABS=%INPUT_FILE_ABS%"
+    set "CONTAINER_INPUT=/app/inputs"
+) else (
+    for %%A in ("%INPUT_FILE_ABS%") do set "INPUT_DIR_ABS=%%~dpA"
+    for %%A in ("%INPUT_FILE_ABS%") do set "CONTAINER_INPUT=/app/inputs/%%~nxA"
+)
+
 :: Quitar barra final si existe
 if "%INPUT_DIR_ABS:~-1%"=="\" set "INPUT_DIR_ABS=%INPUT_DIR_ABS:~0,-1%"
 if "%OUTPUT_DIR_ABS:~-1%"=="\" set "OUTPUT_DIR_ABS=%OUTPUT_DIR_ABS:~0,-1%"
 
-:: --- Nombre del archivo ---
-for %%A in ("%INPUT_FILE_ABS%") do set "INPUT_BASENAME=%%~nxA"
-
-:: --- Ejecución del contenedor ---
+:: --- Ejecución del contenedor (un solo arranque para toda la carpeta) ---
 docker run --rm -it ^
     -v "%INPUT_DIR_ABS%":/app/inputs ^
     -v "%OUTPUT_DIR_ABS%":/app/outputs ^
     felixmurcia/video-optimizer:cuda ^
-    -i "/app/inputs/%INPUT_BASENAME%" ^
-    -o "/app/outputs"
+    -i "%CONTAINER_INPUT%" ^
+    -o "/app/outputs" %EXTRA_ARGS%
 
 endlocal
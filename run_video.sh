@@ -1,17 +1,18 @@
 #!/bin/bash
 
 # --- Validación de parámetros ---
-if [ "$#" -ne 2 ]; then
-    echo "Uso: $0 /ruta/al/video.mp4 /ruta/de/salida"
+if [ "$#" -lt 2 ]; then
+    echo "Uso: $0 /ruta/al/video.mp4|/ruta/a/carpeta /ruta/de/salida [opciones de optimize_video, p. ej. --jobs 4]"
     exit 1
 fi
 
 INPUT_FILE="$1"
 OUTPUT_DIR="$2"
+shift 2
 
 # --- Comprobaciones ---
-if [ ! -f "$INPUT_FILE" ]; then
-    echo "Error: El archivo de entrada no existe: $INPUT_FILE"
+if [ ! -e "$INPUT_FILE" ]; then
+    echo "Error: El archivo o carpeta de entrada no existe: $INPUT_FILE"
     exit 1
 fi
 
@@ -22,16 +23,22 @@ fi
 
 # --- Rutas absolutas ---
 INPUT_FILE_ABS="$(realpath "$INPUT_FILE")"
-INPUT_DIR_ABS="$(dirname "$INPUT_FILE_ABS")"
 OUTPUT_DIR_ABS="$(realpath "$OUTPUT_DIR")"
 
-# --- Nombre del archivo dentro del contenedor ---
-INPUT_BASENAME="$(basename "$INPUT_FILE_ABS")"
+# --- Entrada dentro del contenedor: la carpeta entera (modo por lotes) o el archivo ---
+if [ -d "$INPUT_FILE_ABS" ]; then
+    INPUT_DIR_ABS="$INPUT_FILE_ABS"
+    CONTAINER_INPUT="/app/inputs"
+else
+    INPUT_DIR_ABS="$(dirname "$INPUT_FILE_ABS")"
+    CONTAINER_INPUT="/app/inputs/$(basename "$INPUT_FILE_ABS")"
+fi
 
-# --- Ejecución del contenedor ---
+# --- Ejecución del contenedor (un solo arranque para toda la carpeta) ---
 docker run --rm -it \
     -v "$INPUT_DIR_ABS":/app/inputs \
     -v "$OUTPUT_DIR_ABS":/app/outputs \
     felixmurcia/video-optimizer:cuda \
-    -i "/app/inputs/$INPUT_BASENAME" \
-    -o "/app/outputs"
+    -i "$CONTAINER_INPUT" \
+    -o "/app/outputs" \
+    "$@"
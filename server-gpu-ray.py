@@ -1,22 +1,98 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 import os
 import subprocess
 import ray
+from ray.util.scheduling_strategies import NodeAffinitySchedulingStrategy
 import logging
 import threading
-import tempfile
-import shutil
+import asyncio
+import time
 import json
+import math
 import platform
+import uuid
+from collections import deque
 from pathlib import Path
 
+import optimize_video
+from optimize_video import abr
+from optimize_video.cache import ResultCache, cache_key
+from optimize_video.compliance import OutputProfile, copy_plan
+from optimize_video.diskbudget import DiskBudget, DiskRetries, estimate_bytes, is_disk_full
+from optimize_video.encoders import DEFERRED, best_encoder, deferred_args, resolve
+from optimize_video.jobqueue import PRIORITIES, JobQueue, QueueFull
+from optimize_video.jobstore import RETRY, JobStore, discard_partial
+from optimize_video.metrics import StageMetrics, add_cpu, exposition, record, run_child, wait_child
+from optimize_video.packaging import delivery_paths, output_args, parse_formats, remux_args
+from optimize_video.placement import JobRequest, Placer
+from optimize_video.events import EventBroker, SSEServer, status_delta
+from optimize_video.progress import ProgressParser, ProgressReporter
+from optimize_video.probe import probe, probe_duration
+from optimize_video.scratch import JobScratch, job_key, publish, remove_if_empty, scratch_root, sweep
+from optimize_video.segments import encode_chunked
+from optimize_video.streaming import pipe_input, pipe_output, run_stages
+from optimize_video.uploads import UploadError, UploadManager
+from optimize_video.watcher import WatchManager, is_candidate, scan_videos
+
 app = Flask(__name__)
 os.environ["RAY_DEDUP_LOGS"] = "0"
-ray.init()
-
-valid_extensions = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
-
-ultimo_resumen = None  # estado global/local del último resumen enviado
+# Los workers remotos reciben el paquete optimize_video junto con las tareas
+ray.init(runtime_env={"py_modules": [optimize_video]})
+
+# Encadenar reparar/reducir/optimizar por tuberías (sin intermedios en disco).
+# STREAM_INTERMEDIATES=0 vuelve a escribir _repaired/_reduced en el directorio de trabajo.
+STREAM_INTERMEDIATES = os.environ.get("STREAM_INTERMEDIATES", "1") != "0"
+PIPE_FORMAT = os.environ.get("PIPE_FORMAT", "nut")
+
+# Vídeos de al menos CHUNK_MIN_DURATION segundos se parten en CHUNK_SEGMENTS
+# segmentos (por keyframes) que se codifican como tareas Ray independientes.
+CHUNK_SEGMENTS = int(os.environ.get("CHUNK_SEGMENTS", "4"))
+CHUNK_MIN_DURATION = float(os.environ.get("CHUNK_MIN_DURATION", "1800"))
+
+# Colocación por recursos: cada nodo declara enc_<familia> y scratch_gb al
+# arrancar (ver start_ray_pc.sh); PLACEMENT_POLICY elige least-loaded o
+# fastest-encoder. Cada trabajo pide como scratch_gb lo que estima que escribirá
+# (bitrate y duración sondeados, ver optimize_video/diskbudget.py) y, ya en el
+# worker, lo reserva contra el espacio libre real del volumen de trabajo.
+
+# Cola de trabajos: como mucho QUEUE_WINDOW pipelines lanzados a la vez y
+# QUEUE_MAX_SIZE en espera; las subidas van antes que los escaneos de carpetas.
+QUEUE_WINDOW = int(os.environ.get("QUEUE_WINDOW", "8"))
+QUEUE_MAX_SIZE = int(os.environ.get("QUEUE_MAX_SIZE", "10000"))
+ENQUEUE_BATCH = 500
+
+# Entradas del historial de /status: los últimos trabajos terminados del registro
+HISTORY_LIMIT = 100
+
+# Entradas que ya cumplen el perfil de salida (H.264 ≤720p ≤30 fps ≤800k, AAC
+# estéreo) se remuxan sin recodificar; COPY_COMPLIANT=0 recodifica siempre.
+COPY_COMPLIANT = os.environ.get("COPY_COMPLIANT", "1") != "0"
+PROFILE = OutputProfile.for_bitrate("800k")
+
+# Contenedores de entrega (DELIVERY_FORMATS, de mkv/mp4/mov/ts). "mkv" es el
+# propio -optimized.mkv; los demás se escriben como -final.<formato> desde la
+# misma codificación (muxer tee) o, si no, con un remux de copia de streams.
+DELIVERY_FORMATS = parse_formats(os.environ.get("DELIVERY_FORMATS", "mkv,mp4")) or ("mkv",)
+
+# Escalera ABR por defecto de /process con "abr": true (altura:bitrate) y formatos HLS/DASH.
+# Salida en <nombre>-abr/ junto al original, en lugar de -optimized.mkv.
+ABR_LADDER = abr.format_ladder(abr.parse_ladder(os.environ.get("ABR_LADDER", abr.DEFAULT_LADDER)))
+ABR_FORMATS = abr.parse_formats(os.environ.get("ABR_FORMATS", "hls"))
+
+# Intermedios y salidas sin validar van a un directorio por trabajo (por defecto
+# <carpeta del vídeo>/.video-optimizer-tmp) y se publican con un rename tras
+# validar. Para reanudar en otro nodo, SCRATCH_DIR debe estar en almacenamiento compartido.
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR") or None
+
+# El progreso de ffmpeg se envía al actor en lotes, como mucho cada
+# PROGRESS_INTERVAL_MS; las líneas crudas solo se imprimen con LOG_FFMPEG_LINES=1.
+PROGRESS_INTERVAL = int(os.environ.get("PROGRESS_INTERVAL_MS", "500")) / 1000
+LOG_FFMPEG_LINES = os.environ.get("LOG_FFMPEG_LINES", "0") == "1"
+
+# La UI lee /events de un servidor asyncio propio en EVENTS_PORT: un solo hilo
+# para todos los suscriptores. Con EVENTS_PORT=0 (o si el módulo no se arranca
+# como script) usa la ruta /events de Flask, que ocupa un hilo por conexión.
+EVENTS_PORT = int(os.environ.get("EVENTS_PORT", "5001"))
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s [%(levelname)s] %(message)s")
 
@@ -25,20 +101,34 @@ class StatusTracker:
     def __init__(self):
         self.last_log_line = ""
         self.last_pretty_line = ""
-        self.history = []                # [(video, mensaje), ...]
+        self.history = []                # [(video, mensaje), ...], los últimos HISTORY_LIMIT del registro
         self.current_video = None
         self.current_step = None
         self.progress = 0
         self.total_frames = 0
+        self.eta = None                  # segundos restantes del paso actual
         self.current_file_path = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Versión del estado: se incrementa en cada cambio para que el servidor
+        # web mantenga una copia local y solo la refresque cuando cambie.
+        self.version = 0
+        self._changed = asyncio.Event()
+
+    def _touch(self):
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
 
     def set_video(self, name, full_path=None):
         self.current_video = name
         self.current_file_path = full_path
+        self._touch()
 
     def set_step(self, step):
         """Guardar el número/paso actual del pipeline."""
         self.current_step = step
+        self._touch()
 
     def set_progress(self, value, total_frames=0):
         """
@@ -49,25 +139,51 @@ class StatusTracker:
         self.progress = value
         if total_frames:
             self.total_frames = total_frames
+        self._touch()
 
     def reset_progress(self):
         """Reiniciar progreso y total de frames."""
         self.progress = 0
         self.total_frames = 0
+        self.eta = None
+        self._touch()
 
     def set_log_line(self, line):
         """Registrar la última línea de log y la 'bonita' si aplica."""
+        self._set_log_line(line)
+        self._touch()
+
+    def _set_log_line(self, line):
         if line and "frames" in line:
             self.last_pretty_line = line
         self.last_log_line = line
 
-    def add_history(self, video_name, message):
-        """Añadir entrada al historial."""
-        self.history.append((video_name, message))
+    def apply_updates(self, updates):
+        """Aplicar un lote agrupado de actualizaciones ({campo: último valor}) con un solo cambio de versión."""
+        if "log_line" in updates:
+            self._set_log_line(updates["log_line"])
+        if "progress" in updates:
+            self.progress = updates["progress"]
+        if "eta" in updates:
+            self.eta = updates["eta"]
+        if updates.get("total_frames"):
+            self.total_frames = updates["total_frames"]
+        if "step" in updates:
+            self.current_step = updates["step"]
+        self._touch()
+
+    def record_cache(self, hit):
+        """Contabilizar un acierto/fallo de la caché de resultados."""
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        self._touch()
 
-    def clear_history(self):
-        """Vaciar historial."""
-        self.history = []
+    def load_history(self, entries):
+        """Historial visible: lo publica la cola de trabajos desde el registro cada vez que cambia."""
+        self.history = list(entries)[-HISTORY_LIMIT:]
+        self._touch()
 
     def get_status(self):
         """Obtener snapshot del estado actual."""
@@ -76,92 +192,103 @@ class StatusTracker:
             "current_step": self.current_step,
             "progress": self.progress,
             "total_frames": self.total_frames,
+            "eta": self.eta,
             "log_line": self.last_pretty_line or self.last_log_line,
             "history": self.history,
             "current_file_path": self.current_file_path,
+            "cache": {"hits": self.cache_hits, "misses": self.cache_misses},
         }
 
+    async def wait_status(self, version, timeout=10.0):
+        """Long-poll: devuelve (versión, estado) en cuanto difiera de `version`, o None al expirar."""
+        if self.version == version:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.version, self.get_status()
+
 status_actor = StatusTracker.options(resources={"jetson": 0}).remote()
 
-def get_gpu_encoder():
-    if Path("/usr/lib/aarch64-linux-gnu/tegra").exists():
-        return "h264_nvmpi"  # Jetson
-    else:
-        return "h264_nvenc"  # PC con NVIDIA
 
-def get_video_duration(video_path):
-    try:
-        result = subprocess.run(
-            ["ffprobe", "-v", "error",
-             "-select_streams", "v:0",
-             "-show_entries", "format=duration",
-             "-of", "default=noprint_wrappers=1:nokey=1",
-             video_path],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            text=True, check=True
-        )
-        return float(result.stdout.strip())
-    except (subprocess.CalledProcessError, ValueError):
-        return 0.0
+class StatusSnapshot:
+    """Copia local del estado del tracker, serializada una vez por versión.
+
+    Un único hilo la mantiene al día con `wait_status` (long-poll al actor), así
+    que `/status` nunca bloquea en Ray ni lanza ffprobe: solo lee esta copia.
+    Cada versión nueva se difunde además como deltas a los suscriptores de
+    `/events` (campos cambiados y entradas de historial añadidas).
+    """
+
+    def __init__(self, broker):
+        self._lock = threading.Lock()
+        self._broker = broker
+        # Prefijo por arranque: un actor nuevo reinicia las versiones
+        self._boot = uuid.uuid4().hex[:8]
+        self.version = -1
+        self.etag = f"{self._boot}-init"
+        self.estado = {"history": [], "video_info": {}}
+        self.body = json.dumps(self.estado)
+
+    def publish(self, version, estado):
+        file_path = estado.get("current_file_path")
+        estado["video_info"] = get_video_info(file_path) if file_path else {}
+        body = json.dumps(estado)
+        changes, history = status_delta(self.estado, estado)
+        events = []
+        if changes:
+            events.append(("status", changes))
+        if history is not None:
+            events.append(("history", history))
+
+        def commit():
+            with self._lock:
+                self.version = version
+                self.etag = f"{self._boot}-{version}"
+                self.estado = estado
+                self.body = body
+
+        self._broker.publish(events, commit=commit)
+
+    def get(self):
+        with self._lock:
+            return self.etag, self.body
+
+
+status_events = EventBroker()
+status_snapshot = StatusSnapshot(status_events)
+sse_server = None
+
+
+def refresh_status_snapshot():
+    """Hilo de fondo: espera cambios en el actor y publica la nueva versión."""
+    while True:
+        try:
+            result = ray.get(status_actor.wait_status.remote(status_snapshot.version))
+            if result is not None:
+                status_snapshot.publish(*result)
+        except Exception as e:
+            logging.error(f"Error refrescando estado: {e}")
+            time.sleep(1)
 
+def get_gpu_encoder(family=None):
+    """Codificador más rápido del nodo actual (nvenc, nvmpi en Jetson, vaapi, qsv o CPU).
 
-def get_total_frames(video_path):
-    print(f"get_total_frames({video_path})")
+    `family` es la familia reservada por la colocación para esta tarea. Se sondea
+    una vez por host y queda cacheado en disco; ver `optimize_video.encoders`.
+    """
+    return best_encoder(family=family)
 
-    def probe(path):
-        try:
-            result = subprocess.run(
-                [
-                    "ffprobe", "-v", "error",
-                    "-analyzeduration", "100M",
-                    "-probesize", "100M",
-                    "-select_streams", "v:0",
-                    "-show_entries", "stream=r_frame_rate,duration",
-                    "-of", "default=noprint_wrappers=1:nokey=1",
-                    path
-                ],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                text=True, check=True
-            )
-            lines = result.stdout.strip().splitlines()
-            if len(lines) >= 2:
-                # Parse FPS
-                try:
-                    if "/" in lines[0]:
-                        num, den = map(int, lines[0].split('/'))
-                        fps = num / den if den != 0 else float(num)
-                    else:
-                        fps = float(lines[0]) if lines[0] else 0.0
-                except ValueError:
-                    fps = 0.0
-                # Parse duration
-                try:
-                    duration = float(lines[1])
-                except ValueError:
-                    duration = 0.0
-                total_frames = int(fps * duration)
-                print(f"fps={fps}, dur={duration}, estimado={total_frames}")
-                return total_frames
-        except subprocess.CalledProcessError:
-            pass
-        return 0
+def get_video_duration(video_path):
+    return probe_duration(video_path)
 
-    # Primer intento
-    total_frames = probe(video_path)
 
-    # Si falla, intentamos rehacer encabezados y volver a medir
-    if total_frames == 0:
-        tmp_dir = tempfile.mkdtemp()
-        ext = os.path.splitext(video_path)[1]
-        fixed_path = os.path.join(tmp_dir, f"fixed{ext}")
-        try:
-            subprocess.run(
-                ["ffmpeg", "-y", "-i", video_path, "-c", "copy", "-map", "0", fixed_path],
-                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
-            )
-            total_frames = probe(fixed_path)
-        finally:
-            shutil.rmtree(tmp_dir, ignore_errors=True)
+def get_total_frames(video_path):
+    """Frames totales estimados a partir del sondeo cacheado (sin remux de rescate)."""
+    try:
+        total_frames = probe(video_path).total_frames
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        total_frames = 0
 
     # Valor de seguridad para que la UI no se bloquee
     if total_frames == 0:
@@ -170,31 +297,39 @@ def get_total_frames(video_path):
 
     return total_frames
 
-def stream_reader(stream, stream_name, status_actor, last_line_ref, progress_ref, total_duration):
-    """Lee la salida de FFmpeg línea a línea, actualiza progreso y log en el actor."""
+def stream_reader(stream, stream_name, reporter, last_line_ref, parser=None):
+    """Lee la salida de FFmpeg línea a línea y entrega el progreso al reporter (agrupado).
+
+    `parser` es el `ProgressParser` propio del proceso; sin él solo se drena el stream.
+    """
     for raw_line in iter(stream.readline, ''):
         line = raw_line.strip()
-        print(f"{line}")
-        
-        # Intentamos parsear el progreso 'bonito'
-        resumen = parse_ffmpeg_progress(line)
-
-        if resumen:
-            # Actualizamos última línea y notificamos al actor
-            last_line_ref[0] = resumen
-            try:
-                ray.get(status_actor.set_log_line.remote(last_line_ref[0]))
-            except Exception as e:
-                logging.error(f"Error enviando log al actor: {e}")
-        else:
+        if LOG_FFMPEG_LINES:
+            print(f"[{stream_name}] {line}")
+        if parser is None:
             continue
 
+        record = parser.feed(line)
+        if record is not None:
+            # Guardamos la última línea; el reporter la envía al actor sin bloquear
+            last_line_ref[0] = record.summary()
+            reporter.update(**record.to_updates())
+
     stream.close()
 
-def run_ffmpeg_with_progress(cmd, status_actor):
+def progress_reporter(status_actor):
+    """Reporter que envía lotes al actor sin esperar respuesta (fire-and-forget)."""
+    def send(batch):
+        try:
+            status_actor.apply_updates.remote(batch)
+        except Exception as e:
+            logging.error(f"Error enviando progreso al actor: {e}")
+    return ProgressReporter(send, interval=PROGRESS_INTERVAL)
+
+def run_ffmpeg_with_progress(cmd, status_actor, duration=0.0):
+    """Ejecuta ffmpeg informando del progreso; `duration` (s) permite calcular porcentaje y ETA."""
     last_line_ref = ["Esperando progreso..."]
-    progress_ref = [0]
-    total_duration = [0]
+    reporter = progress_reporter(status_actor)
 
     if "-progress" not in cmd:
         cmd.extend(["-progress", "pipe:2", "-nostats"])
@@ -207,128 +342,467 @@ def run_ffmpeg_with_progress(cmd, status_actor):
         bufsize=1
     )
 
+    # El progreso sale por stderr (-progress pipe:2); stdout solo se drena
     threads = [
-        threading.Thread(target=stream_reader, args=(process.stderr, "STDERR", status_actor, last_line_ref, progress_ref, total_duration)),
-        threading.Thread(target=stream_reader, args=(process.stdout, "STDOUT", status_actor, last_line_ref, progress_ref, total_duration)),
+        threading.Thread(target=stream_reader, args=(process.stderr, "STDERR", reporter, last_line_ref, ProgressParser(duration))),
+        threading.Thread(target=stream_reader, args=(process.stdout, "STDOUT", reporter, last_line_ref)),
     ]
 
     for t in threads:
         t.start()
 
-    process.wait()
+    try:
+        wait_child(process)  # con os.wait4: la CPU de ffmpeg cuenta para la etapa abierta
+    except BaseException:
+        # Tarea cancelada (ray.cancel) o interrumpida: no dejar ffmpeg huérfano
+        process.kill()
+        raise
 
     for t in threads:
         t.join()
+    reporter.close()
 
     if process.returncode != 0:
         raise subprocess.CalledProcessError(process.returncode, cmd)
 
     return last_line_ref[0]
 
+def run_ffmpeg_stages_with_progress(stages, status_actor, duration=0.0):
+    """Como `run_ffmpeg_with_progress`, pero para etapas encadenadas por tuberías.
+
+    El progreso se toma de la última etapa, que es la que escribe la salida.
+    """
+    last_line_ref = ["Esperando progreso..."]
+    reporter = progress_reporter(status_actor)
+    parser = ProgressParser(duration)
+
+    final = stages[-1]
+    if "-progress" not in final:
+        final[-1:-1] = ["-progress", "pipe:2", "-nostats"]
+
+    try:
+        run_stages(
+            stages,
+            stderr_reader=lambda stream: stream_reader(stream, "STDERR", reporter, last_line_ref, parser),
+        )
+    finally:
+        reporter.close()
+    return last_line_ref[0]
+
 @ray.remote
-def process_pipeline(video_path, status_actor):
+def run_command_task(cmd, family=None):
+    """Tarea Ray genérica: ejecuta un comando (p. ej. la codificación de un segmento).
+
+    Los argumentos diferidos del codificador se resuelven con el del nodo que la ejecuta.
+    Devuelve los segundos de CPU del proceso, que se suman a la etapa del padre.
+    """
+    cmd = resolve(cmd, family)
+    print("Ejecutando:", " ".join(cmd))
+    return run_child(cmd)
+
+def ray_runner(cmds):
+    """Runner para `encode_chunked`: reparte los comandos por el cluster.
+
+    Cada segmento reserva una sesión de codificador; el audio solo una CPU.
+    """
+    segment_placer = Placer.from_env()
+    cpu = ray.get([
+        segment_placer.submit(run_command_task, JobRequest(encoder=DEFERRED in cmd), cmd)
+        for cmd in cmds
+    ])
+    add_cpu(sum(cpu), processes=len(cpu))
+
+def submit_pipeline(video_path, status_actor, placer, job_queue=None, job_id=None, resume=0, options=None):
+    """Lanza `process_pipeline` en el nodo que elija la política de colocación.
+
+    Los vídeos que irán por segmentos no reservan sesión de codificador (la
+    reserva cada segmento), así un padre esperando a sus segmentos no bloquea
+    la plaza que estos necesitan. Tampoco la reservan las entradas conformes
+    (solo remux). Un trabajo reanudado con los pasos 1-3 ya hechos no se
+    vuelve a sondear ni a partir. La escalera ABR nunca va por segmentos ni
+    por remux: siempre reserva codificador.
+    """
+    ladder = (options or {}).get("abr")
+    info = None
+    if ladder or resume < 3:
+        try:
+            info = probe(video_path)
+        except (OSError, subprocess.CalledProcessError, ValueError):
+            pass  # process_pipeline vuelve a sondear y da el error
+    chunked = not ladder and resume < 3 and CHUNK_SEGMENTS > 1 and (info.duration if info else probe_duration(video_path)) >= CHUNK_MIN_DURATION
+    remux = False
+    if not ladder and resume < 3 and not chunked and COPY_COMPLIANT and info is not None:
+        try:
+            remux = copy_plan(info, PROFILE).copy_video  # tampoco usa codificador
+        except ValueError:
+            pass
+    # Disco que pide al nodo: lo que escribirá según el modo (ver diskbudget.estimate_bytes)
+    kind = "abr" if ladder else "chunked" if chunked else "remux" if remux else "streamed" if STREAM_INTERMEDIATES else "three-pass"
+    try:
+        size = os.path.getsize(video_path)
+    except OSError:
+        size = 0
+    footprint = estimate_bytes(
+        info, kind, size=size, opt_bitrate="800k", outputs=len(DELIVERY_FORMATS),
+        ladder=[r.bitrate for r in abr.parse_ladder(ladder["ladder"])] if ladder else (),
+    )
+    # Sesiones de codificador a la vez: por tuberías reducir y optimizar se solapan; ABR, una por peldaño
+    sessions = len(abr.parse_ladder(ladder["ladder"])) if ladder else 2 if kind == "streamed" and resume < 3 else 1
+    request = JobRequest(cpus=1, scratch_gb=math.ceil(footprint / 1024**3), encoder=not (chunked or remux), sessions=sessions)
+    return placer.submit(process_pipeline, request, video_path, status_actor, job_queue, job_id, resume, options)
+
+def abr_options(value):
+    """Valida `"abr"` de /process (`true` o `{"ladder", "formats"}`) -> opciones del trabajo.
+
+    Lanza ValueError si la escalera o los formatos no son válidos.
+    """
+    spec = value if isinstance(value, dict) else {}
+    ladder = spec.get("ladder") or ABR_LADDER
+    formats = spec.get("formats") or ABR_FORMATS
+    if not isinstance(formats, str):
+        formats = ",".join(map(str, formats))
+    return {"abr": {
+        "ladder": abr.format_ladder(abr.parse_ladder(str(ladder))),
+        "formats": list(abr.parse_formats(formats)),
+    }}
+
+def run_abr_ladder(video_path, ladder, formats, workdir, dest, status_actor, stages, checkpoint, reserve, resume=0, family=None):
+    """Pasos de la escalera ABR: 3 peldaños codificados (un solo decode), 4 HLS/DASH, 5 validado.
+
+    Todo se genera en `workdir` y, ya validado, se publica como `dest`;
+    `reserve(bytes)` reserva antes el disco que ocupará. Devuelve la última
+    línea de progreso de ffmpeg.
+    """
+    last_log_line = None
+    if resume < 5:
+        with stages.stage("probe", inputs=[video_path]):
+            try:
+                info = probe(video_path)
+            except subprocess.CalledProcessError:
+                info = None
+        if info is None or info.video is None or not info.video.codec_name:
+            raise ValueError("Archivo sin stream de vídeo válido")
+        rungs = abr.fit_ladder(ladder, info.video.height)
+        files = abr.rung_files(workdir, rungs, has_audio=info.audio is not None)
+
+    if resume < 3:
+        reserve(estimate_bytes(info, "abr", ladder=[r.bitrate for r in rungs]))
+        encoder = get_gpu_encoder(family)
+        stages.labels["encoder"] = encoder.name
+        os.makedirs(workdir, exist_ok=True)
+        print("Paso 3: escalera ABR", ", ".join(f"{r.name} {r.bitrate}" for r in rungs))
+        ray.get(status_actor.set_step.remote(3))
+        ray.get(status_actor.set_progress.remote(0, 100))
+        with stages.stage("encode", inputs=[video_path], outputs=files.paths, frames=info.duration * 30 * len(rungs)):
+            last_log_line = run_ffmpeg_with_progress(
+                abr.encode_command(video_path, files, rungs, encoder, source_fps=info.video.fps, gpu="0"),
+                status_actor, info.duration,
+            )
+        checkpoint(3)
+
+    # Paso 4: segmentar en HLS/DASH con copia de streams
+    if resume < 4:
+        print("Paso 4: empaquetar en", ", ".join(formats))
+        ray.get(status_actor.set_step.remote(4))
+        ray.get(status_actor.set_progress.remote(0, 100))
+        with stages.stage("package", inputs=files.paths):
+            abr.package(files, rungs, workdir, formats, run=lambda cmd: run_ffmpeg_with_progress(cmd, status_actor, info.duration))
+        checkpoint(4)
+
+    if resume < 5:
+        print("Validación final")
+        with stages.stage("validate", inputs=[files.videos[0]]):
+            # Todos los peldaños salen del mismo decode: basta con el superior
+            if abs(info.duration - get_video_duration(files.videos[0])) > 2:
+                raise ValueError("La duración de la escalera ABR no coincide con el original")
+            for fmt, path in abr.manifests(workdir, formats).items():
+                if not os.path.isfile(path):
+                    raise ValueError(f"No se generó el manifiesto {fmt}: {path}")
+        checkpoint(5)
+
+    print("Limpieza de temporales")
+    with stages.stage("cleanup"):
+        # Peldaños de toda la escalera configurada: tras reanudar no se sabe cuáles se ajustaron
+        for path in abr.rung_files(workdir, ladder, has_audio=True).paths:
+            if os.path.exists(path):
+                os.remove(path)
+        # Solo los manifiestos y segmentos; si se reanuda y ya se publicó, no queda nada que mover
+        if os.path.isdir(workdir):
+            publish(workdir, dest)
+        if os.path.exists(video_path):
+            try:
+                os.remove(video_path)
+            except Exception as e:
+                logging.warning(f"No se pudo eliminar {video_path}: {e}")
+    return last_log_line
+
+@ray.remote
+def process_pipeline(video_path, status_actor, job_queue=None, job_id=None, resume=0, options=None, family=None):
+    """Pipeline completo de un vídeo; devuelve (estado, mensaje, métricas por etapa).
+
+    `resume` es el último paso completado en una ejecución anterior: 1-3
+    codificación, 4 MP4, 5 validado. Tras cada paso se guarda un punto de
+    control en el registro (a través de `job_queue`). Las métricas se miden
+    en este worker y el servidor las exporta en `/metrics`. Con
+    `options["abr"]` la salida es una escalera HLS/DASH (`run_abr_ladder`).
+    """
     import subprocess, os, logging
     from pathlib import Path
 
-    print(f"process_pipeline({video_path}, {status_actor})")
+    print(f"process_pipeline({video_path}, {status_actor}, resume={resume})")
     last_log_line = None
+    stages = StageMetrics()
 
     if "-optimized" in video_path:
-        return
+        return "done", "Omitido (ya optimizado)", stages.summary()
 
     current_name = os.path.basename(video_path)
+    out_base = video_path.rsplit('.', 1)[0]
+    # Todo se escribe en el directorio de trabajo y se publica junto al original tras validar
+    scratch = JobScratch(scratch_root(video_path, SCRATCH_DIR), job_key(video_path, job_id)).open()
+    work_base = scratch.path(os.path.basename(out_base))
+    repaired_path = work_base + "_repaired.mkv"
+    reduced_path = work_base + "_reduced.mkv"
+    optimized_path = work_base + "-optimized.mkv"
+    # Entregas además de -optimized.mkv: {formato: ruta -final.<formato>}
+    extra_formats = [f for f in DELIVERY_FORMATS if f != "mkv"]
+    extra = delivery_paths(work_base, extra_formats)
+    outputs = {1: repaired_path, 2: reduced_path, 3: optimized_path, 4: list(extra.values())}
+    # -optimized.mkv solo se publica si "mkv" es un formato de entrega
+    published = {**({optimized_path: out_base + "-optimized.mkv"} if "mkv" in DELIVERY_FORMATS else {}),
+                 **dict(zip(extra.values(), delivery_paths(out_base, extra_formats).values()))}
+
+    ladder = (options or {}).get("abr")
+    if ladder:
+        # Escalera ABR: peldaños (paso 3) y manifiestos (paso 4), publicados como <nombre>-abr/
+        abr_work = scratch.path("abr")
+        abr_rungs = abr.parse_ladder(ladder["ladder"])
+        abr_formats = tuple(ladder["formats"])
+        outputs = {
+            3: abr.rung_files(abr_work, abr_rungs, has_audio=True).paths,
+            4: list(abr.manifests(abr_work, abr_formats).values()),
+        }
+
+    def checkpoint(stage):
+        if job_queue is not None and job_id is not None:
+            ray.get(job_queue.checkpoint.remote(job_id, stage, outputs))
+
+    def publish_outputs():
+        # Ya publicadas (reanudación tras el paso 5) no existen en el directorio de trabajo
+        for src, dest in published.items():
+            if os.path.exists(src):
+                publish(src, dest)
+
+    def finish(message, state="done"):
+        # Publicado o fallido, el trabajo no vuelve a necesitar sus intermedios
+        scratch.remove()
+        return state, message, stages.summary()
+
+    # Espacio en disco del volumen de trabajo, compartido con los demás trabajos (DISK_MIN_FREE_GB)
+    budget = DiskBudget.from_env(scratch.root)
+
+    def reserve(nbytes):
+        def waiting(free):
+            ray.get(status_actor.set_log_line.remote(
+                f"{current_name}: esperando espacio en disco ({nbytes / 1024**3:.1f} GB, libres {max(0, free) / 1024**3:.1f} GB)..."
+            ))
+        budget.acquire(scratch.key, nbytes, on_wait=waiting)
+
+    # Salidas a medio escribir de los pasos que no llegaron a completarse
+    discard_partial(outputs, resume)
+
     ray.get(status_actor.set_video.remote(current_name, video_path))
-    ray.get(status_actor.set_step.remote(1))
-    ray.get(status_actor.set_log_line.remote(f"Iniciando {current_name}..."))
+    ray.get(status_actor.set_step.remote(min(resume + 1, 4)))
+    ray.get(status_actor.set_log_line.remote(
+        f"Reanudando {current_name} tras el paso {resume}..." if resume else f"Iniciando {current_name}..."
+    ))
     ray.get(status_actor.reset_progress.remote())
 
+    plan, fast = None, False
+    packaged = False  # la codificación ya escribió también las entregas (paso 4 hecho)
     try:
-        # Validación previa con ffprobe
-        probe_cmd = [
-            "ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries",
-            "stream=codec_name", "-of", "default=noprint_wrappers=1:nokey=1", video_path
-        ]
-        result = subprocess.run(probe_cmd, capture_output=True, text=True)
-        if result.returncode != 0 or not result.stdout.strip():
-            raise ValueError("Archivo sin stream de vídeo válido")
+        if ladder:
+            last_log_line = run_abr_ladder(
+                video_path, abr_rungs, abr_formats, abr_work, out_base + "-abr", status_actor, stages, checkpoint, reserve, resume, family
+            )
+            return finish(f"Procesado correctamente (ABR {', '.join(abr_formats)})")
 
-        # Paso 1: Reparar (recodificación segura)
-        print("Paso 1: reparar")
-        repaired_path = video_path.rsplit('.', 1)[0] + "_repaired.mkv"
-        ray.get(status_actor.set_progress.remote(0, 100))
-        encoder = get_gpu_encoder()
-        last_log_line = run_ffmpeg_with_progress([
-            "ffmpeg", "-i", video_path,
-            "-c:v", encoder, "-preset", "fast", "-crf", "20",
-            "-c:a", "aac", "-b:a", "384k",
-            repaired_path
-        ], status_actor)
-
-        # Paso 2: Reducir
-        print("Paso 2: reducir")
-        ray.get(status_actor.set_step.remote(2))
-        reduced_path = repaired_path.rsplit('.', 1)[0] + "_reduced.mkv"
-        ray.get(status_actor.set_progress.remote(0, 100))
-        last_log_line = run_ffmpeg_with_progress([
-            "ffmpeg", "-i", repaired_path,
-            "-vf", "scale=1280:720,format=yuv420p",
-            "-c:v", encoder, "-preset", "fast", "-b:v", "2M",
-            "-c:a", "aac", "-ac", "2",
-            reduced_path
-        ], status_actor)
-
-        # Paso 3: Optimizar
-        print("Paso 3: optimizar")
-        ray.get(status_actor.set_step.remote(3))
-        optimized_path = video_path.rsplit('.', 1)[0] + "-optimized.mkv"
-        ray.get(status_actor.set_progress.remote(0, 100))
-        last_log_line = run_ffmpeg_with_progress([
-            "ffmpeg", "-i", reduced_path,
-            "-vf", "scale=1280:720,format=yuv420p",
-            "-c:v", encoder, "-preset", "fast",
-            "-cq", "27", "-b:v", "800k", "-r", "30",
-            "-c:a", "aac", "-ac", "2",
-            "-movflags", "faststart", "-gpu", "0",
-            optimized_path
-        ], status_actor)
-        
-        # Paso 4: Convertir a MP4
-        print("Paso 4: convertir a MP4")
-        ray.get(status_actor.set_step.remote(4))
-        mp4_path = video_path.rsplit('.', 1)[0] + "-final.mp4"
-        ray.get(status_actor.set_progress.remote(0, 100))
-        last_log_line = run_ffmpeg_with_progress([
-            "ffmpeg", "-i", optimized_path,
-            "-c:v", "libx264",
-            "-c:a", "aac",
-            mp4_path
-        ], status_actor)
+        if resume < 5:
+            # Validación previa con ffprobe (un único sondeo, reutilizado por todas las etapas)
+            with stages.stage("probe", inputs=[video_path]):
+                try:
+                    info = probe(video_path)
+                except subprocess.CalledProcessError:
+                    info = None
+            if info is None or info.video is None or not info.video.codec_name:
+                raise ValueError("Archivo sin stream de vídeo válido")
+            duration = info.duration
+            src_frames, out_frames = info.total_frames, duration * 30  # la salida va a 30 fps
+
+            encoder = get_gpu_encoder(family)
+            stages.labels["encoder"] = encoder.name
+            repair_args = [*encoder.args(quality=20), "-c:a", "aac", "-b:a", "384k"]
+            reduce_args = [*encoder.args(bitrate="2M", vf="scale=1280:720,format=yuv420p"), "-c:a", "aac", "-ac", "2"]
+            optimize_args = [*encoder.args(quality=27, bitrate="800k", vf="scale=1280:720,format=yuv420p", gpu="0"),
+                             "-r", "30", "-c:a", "aac", "-ac", "2"]
+            # La última codificación escribe -optimized.mkv y todas las entregas en una pasada
+            optimize_outputs = output_args({"mkv": optimized_path, **extra}, encoding=True)
+
+            # Caché de resultados del nodo: copias renombradas o re-subidas no se recodifican
+            cache = ResultCache.from_env()
+            key = None
+            if cache is not None:
+                key = cache_key(video_path, {"encoder": encoder.name, "reduce_bitrate": "2M", "cq": 27, "opt_bitrate": "800k", "final": ",".join(extra)})
+            if cache is not None and resume == 0:
+                hit = cache.get(key, optimized_path, *extra.values())
+                status_actor.record_cache.remote(hit)
+                if hit:
+                    publish_outputs()
+                    try:
+                        os.remove(video_path)
+                    except OSError as e:
+                        logging.warning(f"No se pudo eliminar {video_path}: {e}")
+                    return finish("Procesado correctamente (caché)")
+
+            # Decisión con el mismo sondeo: entrada conforme = remux, sin codificador de vídeo
+            plan = copy_plan(info, PROFILE) if COPY_COMPLIANT else None
+            fast = plan is not None and plan.copy_video
+            if plan is not None and not fast:
+                print("Recodificación necesaria:", ", ".join(plan.reasons))
+
+            # No se escribe nada hasta que quepa (con lo que les falta por escribir a los demás trabajos)
+            if resume < 3:
+                kind = ("remux" if fast else "chunked" if CHUNK_SEGMENTS > 1 and duration >= CHUNK_MIN_DURATION
+                        else "streamed" if STREAM_INTERMEDIATES else "three-pass")
+                reserve(estimate_bytes(info, kind, opt_bitrate="800k", outputs=len(DELIVERY_FORMATS)))
+
+        if resume >= 3:
+            pass  # pasos 1-3 hechos en una ejecución anterior
+        elif fast:
+            # Pasos 1-3 = copia de streams (y audio recodificado si es lo único no conforme)
+            print("Pasos 1-3: remux (entrada conforme)")
+            ray.get(status_actor.set_progress.remote(0, 100))
+            with stages.stage("remux", inputs=[video_path], outputs=[optimized_path]):
+                last_log_line = run_ffmpeg_with_progress(
+                    ["ffmpeg", "-err_detect", "ignore_err", "-i", video_path, *plan.args(), optimized_path],
+                    status_actor, duration,
+                )
+            ray.get(status_actor.set_step.remote(3))
+            checkpoint(3)
+        elif CHUNK_SEGMENTS > 1 and duration >= CHUNK_MIN_DURATION:
+            # Pasos 1-3 por segmentos alineados a GOP repartidos entre los workers
+            print(f"Pasos 1-3: {CHUNK_SEGMENTS} segmentos en paralelo")
+            ray.get(status_actor.set_log_line.remote(f"Codificando {current_name} en {CHUNK_SEGMENTS} segmentos..."))
+            with stages.stage("encode", inputs=[video_path], outputs=[optimized_path], frames=out_frames):
+                encode_chunked(
+                    video_path, optimized_path,
+                    duration=duration,
+                    segments=CHUNK_SEGMENTS,
+                    # Cada nodo codifica sus segmentos con su propio codificador (GPU o CPU)
+                    video_args=deferred_args(quality=27, bitrate="800k", vf="scale=1280:720,format=yuv420p,fps=30", gpu="0"),
+                    runner=ray_runner,
+                )
+            ray.get(status_actor.set_step.remote(3))
+            checkpoint(3)
+        elif STREAM_INTERMEDIATES:
+            # Pasos 1-3 solapados por tuberías: solo se escriben -optimized.mkv y las entregas
+            # Reparar es copia de streams (como en la CLI): solo reducir y optimizar ocupan codificador
+            print("Pasos 1-3: reparar | reducir | optimizar (streaming)")
+            ray.get(status_actor.set_progress.remote(0, 100))
+            with stages.stage("encode", inputs=[video_path], outputs=[optimized_path, *extra.values()], frames=out_frames):
+                last_log_line = run_ffmpeg_stages_with_progress([
+                    ["ffmpeg", "-err_detect", "ignore_err", "-i", video_path, "-c", "copy", *pipe_output(PIPE_FORMAT)],
+                    ["ffmpeg", *pipe_input(PIPE_FORMAT), *reduce_args, *pipe_output(PIPE_FORMAT)],
+                    ["ffmpeg", *pipe_input(PIPE_FORMAT), *optimize_args, *optimize_outputs],
+                ], status_actor, duration)
+            ray.get(status_actor.set_step.remote(3))
+            checkpoint(3)
+            packaged = True
+        else:
+            # Paso 1: Reparar (recodificación segura)
+            if resume < 1:
+                print("Paso 1: reparar")
+                ray.get(status_actor.set_progress.remote(0, 100))
+                with stages.stage("repair", inputs=[video_path], outputs=[repaired_path], frames=src_frames):
+                    last_log_line = run_ffmpeg_with_progress(["ffmpeg", "-i", video_path, *repair_args, repaired_path], status_actor, duration)
+                checkpoint(1)
+
+            # Paso 2: Reducir
+            if resume < 2:
+                print("Paso 2: reducir")
+                ray.get(status_actor.set_step.remote(2))
+                ray.get(status_actor.set_progress.remote(0, 100))
+                with stages.stage("reduce", inputs=[repaired_path], outputs=[reduced_path], frames=src_frames):
+                    last_log_line = run_ffmpeg_with_progress(["ffmpeg", "-i", repaired_path, *reduce_args, reduced_path], status_actor, duration)
+                checkpoint(2)
+
+            # Paso 3: Optimizar
+            print("Paso 3: optimizar")
+            ray.get(status_actor.set_step.remote(3))
+            ray.get(status_actor.set_progress.remote(0, 100))
+            with stages.stage("optimize", inputs=[reduced_path], outputs=[optimized_path, *extra.values()], frames=out_frames):
+                last_log_line = run_ffmpeg_with_progress(["ffmpeg", "-i", reduced_path, *optimize_args, *optimize_outputs], status_actor, duration)
+            checkpoint(3)
+            packaged = True
+
+        # Paso 4: Empaquetar en los contenedores de entrega. El vídeo ya es H.264/AAC:
+        # copia de streams con faststart, sin recodificar (segmentos, remux o reanudación)
+        if resume < 4:
+            if extra and not packaged:
+                print("Paso 4: empaquetar en", ", ".join(extra))
+                ray.get(status_actor.set_step.remote(4))
+                ray.get(status_actor.set_progress.remote(0, 100))
+                with stages.stage("package", inputs=[optimized_path], outputs=list(extra.values())):
+                    last_log_line = run_ffmpeg_with_progress(
+                        ["ffmpeg", "-i", optimized_path, *remux_args(extra)], status_actor, duration
+                    )
+            checkpoint(4)
 
         # Validación final
-        print("Validación final")
-        original_duration = get_video_duration(video_path)
-        optimized_duration = get_video_duration(optimized_path)
-        if abs(original_duration - optimized_duration) > 2:
-            raise ValueError("La duración del archivo optimizado no coincide con el original")
-
-        # Limpieza de temporales
+        if resume < 5:
+            print("Validación final")
+            with stages.stage("validate", inputs=[optimized_path]):
+                original_duration = info.duration
+                optimized_duration = get_video_duration(optimized_path)
+                if abs(original_duration - optimized_duration) > 2:
+                    raise ValueError("La duración del archivo optimizado no coincide con el original")
+                for path in extra.values():
+                    if abs(original_duration - get_video_duration(path)) > 2:
+                        raise ValueError(f"La duración de {os.path.basename(path)} no coincide con el original")
+
+                if cache is not None:
+                    cache.put(key, optimized_path, *extra.values())
+            checkpoint(5)
+
+        publish_outputs()
+
+        # Limpieza: el original; los intermedios se van con el directorio de trabajo (finish)
         print("Limpieza de temporales")
-        for path in [video_path, repaired_path, reduced_path]:
-            try:
-                os.remove(path)
-            except Exception as e:
-                logging.warning(f"No se pudo eliminar {path}: {e}")
+        with stages.stage("cleanup"):
+            if os.path.exists(video_path):
+                try:
+                    os.remove(video_path)
+                except Exception as e:
+                    logging.warning(f"No se pudo eliminar {video_path}: {e}")
 
-        ray.get(status_actor.add_history.remote(current_name, "Procesado correctamente"))
+        return finish(plan.outcome if fast else "Procesado correctamente")
 
     except subprocess.CalledProcessError as e:
-        ray.get(status_actor.add_history.remote(current_name, f"Error de ffmpeg: {e.stderr.strip()}"))
+        # Disco lleno: reintentable (la cola lo vuelve a encolar), no un fallo del vídeo
+        if is_disk_full(e, scratch.root):
+            return finish(f"Sin espacio en disco: {str(e)}", RETRY)
+        return finish(f"Error de ffmpeg: {(e.stderr or '').strip()}", "error")
     except ValueError as e:
-        ray.get(status_actor.add_history.remote(current_name, f"Error de validación: {str(e)}"))
+        return finish(f"Error de validación: {str(e)}", "error")
     except Exception as e:
-        ray.get(status_actor.add_history.remote(current_name, f"Error inesperado: {str(e)}"))
+        if is_disk_full(e, scratch.root):
+            return finish(f"Sin espacio en disco: {str(e)}", RETRY)
         logging.exception("Error inesperado en process_pipeline")
+        return finish(f"Error inesperado: {str(e)}", "error")
     finally:
+        budget.release(scratch.key)
+        # Sin otros trabajos en curso no queda un .video-optimizer-tmp vacío junto a los vídeos
+        remove_if_empty(scratch.root)
         ray.get(status_actor.set_video.remote(None))
         ray.get(status_actor.set_step.remote(0))
         ray.get(status_actor.reset_progress.remote())
@@ -336,27 +810,231 @@ def process_pipeline(video_path, status_actor):
             ray.get(status_actor.set_log_line.remote(last_log_line))
 
 @ray.remote
-def process_folder(path, status_actor):
+class JobQueueActor:
+    """Cola de trabajos con ventana de lanzamientos en vuelo.
+
+    Los vídeos se encolan con una clase de prioridad y un bucle de despacho
+    lanza `process_pipeline` solo cuando queda una plaza libre en la ventana,
+    en lugar de crear todas las tareas de golpe. Encolar con `wait=True`
+    espera mientras la cola esté llena (contrapresión para los escaneos de
+    carpetas); con `wait=False` se rechaza.
+
+    Cada trabajo es también una fila del registro persistente (`JOB_DB`, en
+    el nodo del servidor): lo ya procesado con la misma entrada se omite y,
+    tras un reinicio, `resume` vuelve a encolar lo que quedó a medias para
+    que continúe desde su último paso completado.
+    """
+
+    def __init__(self, status_actor, window=QUEUE_WINDOW, max_size=QUEUE_MAX_SIZE):
+        self.status_actor = status_actor
+        self.window = window
+        self.queue = JobQueue(max_size)
+        self.store = JobStore.from_env()
+        self.running = {}                 # id -> ObjectRef de process_pipeline
+        self.stage_metrics = deque(maxlen=10000)  # resúmenes por etapa pendientes de exportar
+        self.placer = Placer.from_env()
+        self.disk_retries = DiskRetries.from_env()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._dispatcher = None
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.get_event_loop().create_task(self._dispatch())
+
+    async def _dispatch(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            while len(self.running) < self.window:
+                job = self.queue.pop()
+                if job is None:
+                    break
+                self._space.set()
+                row = self.store.get(job.id)
+                resume = row["stage"] if row else 0
+                options = row["options"] if row else {}
+                me = ray.get_runtime_context().current_actor
+                # En curso ya en el registro: tras un corte se distingue de lo que nunca arrancó
+                self.store.start(job.id)
+                try:
+                    # La colocación sondea el vídeo y consulta el cluster: fuera del bucle de eventos
+                    ref = await loop.run_in_executor(
+                        None, submit_pipeline, job.path, self.status_actor, self.placer, me, job.id, resume, options
+                    )
+                except Exception as e:
+                    self._finish(job, "error", str(e))
+                    continue
+                self.running[job.id] = ref
+                loop.create_task(self._watch(job, ref))
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def _finish(self, job, state, message=""):
+        if state == RETRY:
+            attempt = self.disk_retries.next(job.path)
+            if attempt is not None:
+                # Disco lleno: vuelve a la cola pasado DISK_RETRY_DELAY, desde el principio
+                message = f"{message} (reintento {attempt} de {self.disk_retries.limit} en {self.disk_retries.delay:g} s)"
+                self.queue.finish(job, state, message)
+                self.store.retry(job.id, message)
+                self._publish_history()
+                asyncio.get_event_loop().call_later(
+                    self.disk_retries.delay, lambda: asyncio.ensure_future(self.enqueue([job.path], job.priority))
+                )
+                return
+            state, message = "error", f"Error: {message} (sin más reintentos)"
+        elif state == "done":
+            self.disk_retries.clear(job.path)
+        self.queue.finish(job, state, message if state == "error" else "")
+        self._store_finish(job.id, state, message)
+
+    def _store_finish(self, job_id, state, message):
+        self.store.finish(job_id, state, message)
+        self._publish_history()
+
+    def _publish_history(self):
+        """El historial de /status sale del registro (acotado), como en server.py."""
+        self.status_actor.load_history.remote([(h["name"], h["status"]) for h in self.store.history(HISTORY_LIMIT)])
+
+    async def _watch(self, job, ref):
+        try:
+            state, message, summary = await ref
+            self.stage_metrics.append(summary)
+            self._finish(job, state, message)
+        except ray.exceptions.TaskCancelledError:
+            self._finish(job, "cancelled", "Cancelado")
+        except Exception as e:
+            # El worker murió sin poder clasificarlo (p. ej. Ray sin disco para sus objetos)
+            if is_disk_full(e):
+                self._finish(job, RETRY, f"Sin espacio en disco: {str(e)}")
+            else:
+                self._finish(job, "error", f"Error inesperado: {str(e)}")
+        finally:
+            self.running.pop(job.id, None)
+            self._wakeup.set()
+
+    async def enqueue(self, paths, priority="folder", wait=True, options=None):
+        """Encola `paths`; devuelve ids aceptados, duplicados ignorados y rechazados por cola llena.
+
+        `options` (p. ej. la escalera ABR) se guardan con cada trabajo en el registro.
+        """
+        self._ensure_dispatcher()
+        accepted, duplicates = [], 0
+        for idx, path in enumerate(paths):
+            path = os.path.abspath(path)
+            # Ya en cola o en curso: no se crea fila en el registro
+            if path in self.queue:
+                duplicates += 1
+                continue
+            # Ya procesado con la misma entrada
+            job_id, _resume = self.store.enqueue(path, priority, options)
+            if job_id is None:
+                duplicates += 1
+                continue
+            while True:
+                try:
+                    job = self.queue.push(path, priority, job_id)
+                    break
+                except QueueFull:
+                    if not wait:
+                        self._store_finish(job_id, "cancelled", "Cola de trabajos llena")
+                        self._wakeup.set()
+                        return {"accepted": accepted, "duplicates": duplicates, "rejected": len(paths) - idx}
+                    self._wakeup.set()
+                    self._space.clear()
+                    await self._space.wait()
+            if job is None:
+                # Encolada por otra petición mientras se esperaba sitio: su fila no se queda en cola
+                self._store_finish(job_id, "cancelled", "Duplicado: ya en cola")
+                duplicates += 1
+            else:
+                accepted.append(job.id)
+        self._wakeup.set()
+        return {"accepted": accepted, "duplicates": duplicates, "rejected": 0}
+
+    async def resume(self):
+        """Al arrancar: restaura el historial y reencola los trabajos interrumpidos."""
+        self._publish_history()
+        rows = []
+        resumable = self.store.resumable()
+        # Directorios de trabajo huérfanos (fallos y cortes) de este nodo o del almacenamiento compartido
+        keep = {job_key(row["path"], row["id"]) for row in resumable}
+        for root in {scratch_root(row["path"], SCRATCH_DIR) for row in resumable} | ({os.path.abspath(SCRATCH_DIR)} if SCRATCH_DIR else set()):
+            sweep(root, keep)
+            remove_if_empty(root)
+        for row in resumable:
+            # Ya validado (paso 5): el original puede estar borrado, solo queda limpiar
+            if not os.path.exists(row["path"]) and row["stage"] < 5:
+                self._store_finish(row["id"], "error", "Error: el archivo original ya no existe")
+                continue
+            rows.append(row)
+        # Se respeta la prioridad con la que se encolaron (las subidas, primero)
+        for priority in PRIORITIES:
+            paths = [r["path"] for r in rows if r["priority"] == priority]
+            if paths:
+                await self.enqueue(paths, priority)
+        return len(rows)
+
+    def checkpoint(self, job_id, stage, outputs=None):
+        """Punto de control de `process_pipeline`: paso `stage` completado."""
+        self.store.checkpoint(job_id, stage, outputs)
+
+    def clear_history(self):
+        self.store.clear_history()
+        self._publish_history()
+
+    def cancel(self, job_id):
+        """Cancela un trabajo en cola o en curso (a la tarea en curso se le envía ray.cancel)."""
+        if self.queue.cancel(job_id):
+            self._store_finish(job_id, "cancelled", "Cancelado")
+            return True
+        ref = self.running.get(job_id)
+        if ref is None:
+            return False
+        ray.cancel(ref)
+        return True
+
+    def reprioritize(self, job_id, priority):
+        return self.queue.reprioritize(job_id, priority)
+
+    def jobs(self, limit=100):
+        return self.queue.jobs(limit=limit)
+
+    def drain_stage_metrics(self):
+        """Entrega (y olvida) las métricas por etapa de los trabajos terminados."""
+        summaries = list(self.stage_metrics)
+        self.stage_metrics.clear()
+        return summaries
+
+    def metrics(self):
+        return {
+            **self.queue.metrics(),
+            "window": self.window,
+            "in_flight": len(self.running),
+            "store": self.store.counts(),
+        }
+
+# El registro de trabajos es un fichero SQLite local: el actor vive siempre en el nodo del servidor
+job_queue = JobQueueActor.options(
+    scheduling_strategy=NodeAffinitySchedulingStrategy(ray.get_runtime_context().get_node_id(), soft=False)
+).remote(status_actor)
+
+@ray.remote
+def process_folder(path, status_actor, job_queue, options=None):
     print(f"process_folder({path},{status_actor})")
-    ray.get(status_actor.clear_history.remote())
+    ray.get(job_queue.clear_history.remote())
     
     # Aceptar ruta de archivo individual
     if os.path.isfile(path):
-        ext = os.path.splitext(path)[1].lower()
-        print(f"Estension: {ext}")
-        if ext in valid_extensions:
+        if is_candidate(path):
             ray.get(status_actor.set_log_line.remote(f"Encolando archivo: {os.path.basename(path)}"))            
-            process_pipeline.remote(path, status_actor)
+            ray.get(job_queue.enqueue.remote([path], "file", options=options))
         else:
-            ray.get(status_actor.set_log_line.remote(f"Extensión no válida: {path}"))
+            ray.get(status_actor.set_log_line.remote(f"Extensión no válida o archivo generado: {path}"))
         return
 
-    # Si es carpeta, recorrer
-    found_files = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            if os.path.splitext(file)[1].lower() in valid_extensions:
-                found_files.append(os.path.join(root, file))
+    # Si es carpeta, recorrer (sin las salidas ni los intermedios del pipeline)
+    found_files = scan_videos(path)
 
     if not found_files:
         msg = f"No se encontraron vídeos válidos en: {path}"
@@ -365,16 +1043,25 @@ def process_folder(path, status_actor):
         return
 
     print(f"🎯 Encontrados {len(found_files)} vídeos para procesar")
-    for idx, video_path in enumerate(found_files, start=1):
-        log_msg = f"[{idx}/{len(found_files)}] Encolando {os.path.basename(video_path)}"
+    # Por lotes: si la cola está llena, enqueue espera (contrapresión) en lugar de crear tareas
+    for start in range(0, len(found_files), ENQUEUE_BATCH):
+        batch = found_files[start:start + ENQUEUE_BATCH]
+        log_msg = f"[{start + len(batch)}/{len(found_files)}] Encolando {os.path.basename(batch[-1])}"
         print(log_msg)
         ray.get(status_actor.set_log_line.remote(log_msg))
-        process_pipeline.remote(video_path, status_actor)
+        ray.get(job_queue.enqueue.remote(batch, "folder", options=options))
+
+def enqueue_watched(paths):
+    ray.get(job_queue.enqueue.remote(paths, "folder"))
+
+# Carpetas vigiladas (en el nodo del servidor): los vídeos nuevos se encolan en
+# cuanto dejan de crecer, sin volver a recorrer la carpeta entera
+watchers = WatchManager.from_env(enqueue_watched)
 
 
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return render_template("index.html", events_port=sse_server.port if sse_server else "")
 
 
 @app.route("/process", methods=["POST"])
@@ -387,111 +1074,214 @@ def process():
     if not os.path.exists(path):
         return jsonify({"error": "La ruta especificada no existe"}), 400
 
+    options = None
+    if data.get("abr"):
+        # Escalera HLS/DASH en lugar del -optimized.mkv único
+        if data.get("watch"):
+            return jsonify({"error": "El modo ABR no se admite al vigilar carpetas"}), 400
+        try:
+            options = abr_options(data["abr"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    if data.get("watch"):
+        # Modo vigilancia: el vigilante encola lo existente y lo que vaya llegando
+        if not os.path.isdir(path):
+            return jsonify({"error": "Solo se pueden vigilar carpetas"}), 400
+        ray.get(job_queue.clear_history.remote())
+        watcher = watchers.watch(path)
+        return jsonify({"message": f"Vigilando carpeta: {path}", "watch": watcher.stats()}), 200
+
     try:
-        process_folder.remote(path, status_actor)
+        process_folder.remote(path, status_actor, job_queue, options)
         return jsonify({"message": f"Procesamiento iniciado para: {path}"}), 200
     except Exception as e:
         return jsonify({"error": f"Error al procesar: {str(e)}"}), 500
 
 
+upload_folder = os.path.join(os.getcwd(), "uploads")
+os.makedirs(upload_folder, exist_ok=True)
+# Subidas por trozos reanudables escritas directamente en uploads/ (ver /upload)
+uploads = UploadManager.from_env(upload_folder)
+
+def enqueue_upload(save_path):
+    """Encola un vídeo subido con prioridad de subida; con la cola llena se rechaza (503)."""
+    name = os.path.basename(save_path)
+    try:
+        # Las subidas van por delante de los escaneos de carpetas; con la cola llena se rechazan
+        result = ray.get(job_queue.enqueue.remote([save_path], "upload", wait=False))
+        if result["rejected"]:
+            return jsonify({"error": "Cola de trabajos llena, inténtalo más tarde"}), 503
+        ray.get(status_actor.set_log_line.remote(f"Encolado {name}..."))
+        return jsonify({"message": f"Procesamiento iniciado para: {name}", "jobs": result["accepted"]}), 200
+    except Exception as e:
+        print("❌ Error al encolar la subida:", e)
+        return jsonify({"error": f"Error al procesar: {str(e)}"}), 500
+
 @app.route("/process-file", methods=["POST"])
 def process_file():
+    """Subida de una sola petición multipart (clientes antiguos; la UI usa /upload)."""
     if "video" not in request.files:
         return jsonify({"error": "No se envió archivo"}), 400
 
     video_file = request.files["video"]
     print(f"📥 Recibido archivo: {video_file.filename}")
 
-    upload_folder = os.path.join(os.getcwd(), "uploads")
-    os.makedirs(upload_folder, exist_ok=True)
-
     save_path = os.path.join(upload_folder, video_file.filename)
     video_file.save(save_path)
     print(f"💾 Guardado en: {save_path}")
 
-    try:
-        ray.get(status_actor.set_video.remote(video_file.filename, save_path))
-        ray.get(status_actor.set_step.remote(1))
-        ray.get(status_actor.reset_progress.remote())
-        ray.get(status_actor.set_log_line.remote(f"Iniciando {video_file.filename}..."))
-
-        process_pipeline.remote(save_path, status_actor)
-        return jsonify({"message": f"Procesamiento iniciado para: {video_file.filename}"}), 200
-    except Exception as e:
-        print("❌ Error en process_file:", e)
-        return jsonify({"error": f"Error al procesar: {str(e)}"}), 500
-
-estado_actual = {}
-
-def parse_ffmpeg_progress(line: str):
-    global ultimo_resumen, estado_actual
-
-    line = line.strip()
-    print(f"{line}")
-
-    # Detecta líneas clave tipo "key=value"
-    if "=" in line:
-        clave, valor = line.split("=", 1)
-        estado_actual[clave.strip()] = valor.strip()
-
-    # Si se detecta el final del proceso
-    if line.startswith("progress=") and "end" in line:
-        estado_actual.clear()
-        ultimo_resumen = "completed"
-        return "completed"
+    return enqueue_upload(save_path)
 
-    # Genera resumen si hay todos los campos clave
-    if all(k in estado_actual for k in ["frame", "fps", "out_time", "bitrate", "speed"]):
-        resumen = (
-            f" frames= {estado_actual['frame']} | fps= {estado_actual['fps']} | "
-            f"time= {estado_actual['out_time']} | bitrate= {estado_actual['bitrate']} | "
-            f"speed= {estado_actual['speed']}"
-        )
-
-        if resumen != ultimo_resumen:
-            ultimo_resumen = resumen
-            return resumen
+def upload_error(e):
+    body = {"error": str(e)}
+    if e.offset is not None:
+        body["offset"] = e.offset
+    return jsonify(body), e.status
 
-    return None
+@app.route("/upload", methods=["POST"])
+def upload_init():
+    """Abre una subida: JSON `{filename, size, early}` → `{id, offset, chunk_size}`."""
+    data = request.get_json() or {}
+    try:
+        upload = uploads.init(data.get("filename", ""), int(data.get("size", 0)), bool(data.get("early")))
+    except UploadError as e:
+        return upload_error(e)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Tamaño de subida no válido"}), 400
+    print(f"📥 Subida {upload.id}: {upload.path} ({upload.size} bytes)")
+    return jsonify({**upload.to_dict(), "chunk_size": uploads.chunk_size}), 201
+
+@app.route("/upload/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """Desplazamiento recibido: desde dónde continuar tras un corte."""
+    try:
+        return jsonify(uploads.get(upload_id).to_dict())
+    except UploadError as e:
+        return upload_error(e)
+
+@app.route("/upload/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    """Cuerpo crudo del trozo; el desplazamiento va en `?offset=` (o la cabecera `Upload-Offset`)."""
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        offset = request.headers.get("Upload-Offset", type=int)
+    if offset is None or offset < 0:
+        return jsonify({"error": "Falta el desplazamiento del trozo"}), 400
+    try:
+        # request.stream: el cuerpo se lee por bloques, sin pasar por el parser de formularios
+        upload = uploads.write(upload_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(upload.to_dict())
+
+@app.route("/upload/<upload_id>/complete", methods=["POST"])
+def upload_complete(upload_id):
+    try:
+        upload = uploads.complete(upload_id)
+    except UploadError as e:
+        return upload_error(e)
+    print(f"💾 Subida completa: {upload.path}")
+    return enqueue_upload(upload.path)
+
+@app.route("/upload/<upload_id>", methods=["DELETE"])
+def upload_abort(upload_id):
+    try:
+        uploads.abort(upload_id)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify({"message": "Subida cancelada"}), 200
 
 def get_video_info(file_path):
     if not os.path.exists(file_path):
         return {}
 
     try:
-        cmd = [
-            "ffprobe", "-v", "quiet", "-print_format", "json",
-            "-show_format", "-show_streams", file_path
-        ]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        data = json.loads(result.stdout)
-
-        format_info = data.get("format", {})
-        streams = data.get("streams", [])
-
-        video_stream = next((s for s in streams if s.get("codec_type") == "video"), {})
-        audio_stream = next((s for s in streams if s.get("codec_type") == "audio"), {})
-
-        return {
-            "name": os.path.basename(file_path),
-            "duration": f"{float(format_info.get('duration', 0)):.0f} sec",
-            "resolution": f"{video_stream.get('width', '?')}x{video_stream.get('height', '?')}",
-            "format": format_info.get("format_name", "–"),
-            "vcodec": video_stream.get("codec_name", "–"),
-            "acodec": audio_stream.get("codec_name", "–"),
-            "size": f"{int(format_info.get('size', 0)) / (1024**2):.1f} MB"
-        }
-
+        # Cacheado por (ruta, mtime, tamaño): los sondeos de /status no lanzan ffprobe
+        return probe(file_path).summary()
     except Exception as e:
         print(f"Error al obtener info del vídeo: {e}")
         return {}
 
 @app.route("/status", methods=["GET"])
 def status():
-    estado = ray.get(status_actor.get_status.remote())
-    file_path = estado.get("current_file_path")
-    estado["video_info"] = get_video_info(file_path) if file_path else {}
-    return jsonify(estado)
+    # Lectura local del último snapshot; 304 si el cliente ya tiene esta versión
+    etag, body = status_snapshot.get()
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Métricas por etapa en formato Prometheus (requiere prometheus_client).
+
+    Las etapas se miden en los workers; cada consulta vuelca en el registro de
+    este proceso las de los trabajos terminados desde la anterior.
+    """
+    for summary in ray.get(job_queue.drain_stage_metrics.remote()):
+        record(summary)
+    try:
+        body, content_type = exposition()
+    except RuntimeError as e:
+        return f"{e}\n", 503
+    return Response(body, content_type=content_type)
+
+@app.route("/watch", methods=["GET"])
+def watch_status():
+    return jsonify({"watchers": watchers.stats()})
+
+@app.route("/watch", methods=["DELETE"])
+def watch_stop():
+    data = request.get_json() or {}
+    if not watchers.unwatch(data.get("folder", "")):
+        return jsonify({"error": "Esa carpeta no se está vigilando"}), 404
+    return jsonify({"message": f"Vigilancia detenida: {data['folder']}"}), 200
+
+@app.route("/queue", methods=["GET"])
+def queue_status():
+    """Métricas de la cola (profundidad y antigüedad por prioridad) y trabajos recientes."""
+    limit = request.args.get("limit", default=100, type=int)
+    metrics, jobs = ray.get([job_queue.metrics.remote(), job_queue.jobs.remote(limit)])
+    return jsonify({**metrics, "jobs": jobs})
+
+@app.route("/queue/<int:job_id>", methods=["DELETE"])
+def queue_cancel(job_id):
+    if not ray.get(job_queue.cancel.remote(job_id)):
+        return jsonify({"error": "Trabajo no encontrado o ya terminado"}), 404
+    return jsonify({"message": f"Trabajo {job_id} cancelado"}), 200
+
+@app.route("/queue/<int:job_id>", methods=["PATCH"])
+def queue_reprioritize(job_id):
+    data = request.get_json() or {}
+    try:
+        changed = ray.get(job_queue.reprioritize.remote(job_id, data.get("priority", "")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not changed:
+        return jsonify({"error": "Trabajo no encontrado o ya lanzado"}), 404
+    return jsonify({"message": f"Prioridad de {job_id}: {data['priority']}"}), 200
+
+@app.route("/events", methods=["GET"])
+def events():
+    """Stream SSE: `snapshot` inicial y después deltas `status`/`history` según ocurren.
+
+    Un hilo WSGI por suscriptor; la UI prefiere `sse_server` si está en marcha.
+    """
+    stream = status_events.stream(lambda: status_snapshot.get()[1], request.headers.get("Last-Event-ID"))
+    return Response(stream, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
     
+threading.Thread(target=refresh_status_snapshot, name="status-snapshot", daemon=True).start()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    debug = os.environ.get("FLASK_DEBUG") == "1"
+    # Con el recargador de debug el módulo corre en dos procesos: solo reanuda y abre EVENTS_PORT el que sirve
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        job_queue.resume.remote()
+        watchers.watch_env()
+        if EVENTS_PORT:
+            sse_server = SSEServer(status_events, lambda: status_snapshot.get()[1], port=EVENTS_PORT).start()
+    app.run(host="0.0.0.0", port=5000, debug=debug)
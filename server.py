@@ -1,103 +1,218 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 import os
 import threading
 import subprocess
 
+from optimize_video.cache import ResultCache, cache_key
+from optimize_video.compliance import OutputProfile, copy_plan
+from optimize_video.diskbudget import DiskBudget, DiskRetries, estimate_bytes, is_disk_full
+from optimize_video.encoders import best_encoder
+from optimize_video.jobstore import JobStore, discard_partial
+from optimize_video.metrics import StageMetrics, exposition, run_child
+from optimize_video.probe import probe, probe_duration
+from optimize_video.scheduler import JobScheduler
+from optimize_video.scratch import JobScratch, job_key, publish, remove_if_empty, scratch_root, sweep
+from optimize_video.watcher import WatchManager, scan_videos
+
 app = Flask(__name__)
 
-# Variables globales para el estado
-current_video = None
-current_step = 0
-history = []
+# Registro persistente de trabajos (JOB_DB): historial, pasos completados y
+# reanudación tras un reinicio; el estado en memoria de cada vídeo vive en su Job
+store = JobStore.from_env()
+
+# Pool de workers: WORKERS, ENCODER_SLOTS y CPU_SLOTS por variables de entorno
+scheduler = JobScheduler.from_env()
 
-# Extensiones válidas de vídeo
-valid_extensions = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
+# Caché de resultados por contenido (RESULT_CACHE_DIR vacío la desactiva)
+cache = ResultCache.from_env()
+# El codificador más rápido que funciona en este host (libx264 si no hay
+# hardware); se sondea una vez y queda cacheado en disco
+encoder = best_encoder()
+# Parámetros de codificación que forman parte de la clave de caché
+# Entradas que ya cumplen el perfil de salida se remuxan sin recodificar (COPY_COMPLIANT=0 lo desactiva)
+COPY_COMPLIANT = os.environ.get("COPY_COMPLIANT", "1") != "0"
+PROFILE = OutputProfile.for_bitrate("1000k")
+CACHE_PARAMS = {"encoder": encoder.name, "reduce_bitrate": "2M", "cq": 23, "opt_bitrate": "1000k", "preset": "slow"}
+# Intermedios y salida sin validar van a un directorio por trabajo (por defecto
+# <carpeta del vídeo>/.video-optimizer-tmp); el -optimized.mkv se publica con un rename
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR") or None
+# Fallos por disco lleno: se reintentan DISK_RETRIES veces cada DISK_RETRY_DELAY segundos
+disk_retries = DiskRetries.from_env()
 
-def process_video(video_path):
-    global current_video, current_step, history
 
-    # Ignorar archivos que ya tienen el sufijo "-optimized"
-    if "-optimized" in video_path:
-        return 
+def process_video(video_path, job, job_id, resume=0):
+    """Procesa un vídeo; `resume` es el último paso completado en una ejecución anterior."""
+    base = os.path.splitext(os.path.basename(video_path))[0]
+    final_path = video_path.rsplit('.', 1)[0] + "-optimized.mkv"
+    # Misma clave en cada ejecución del trabajo: al reanudar se reencuentran los intermedios
+    scratch = JobScratch(scratch_root(video_path, SCRATCH_DIR), job_key(video_path, job_id)).open()
+    repaired_path = scratch.path(base + "_repaired.mkv")
+    reduced_path = scratch.path(base + "_reduced.mkv")
+    optimized_path = scratch.path(base + "-optimized.mkv")
+    outputs = {1: repaired_path, 2: reduced_path, 3: optimized_path}
+    # Reservas de disco del volumen del directorio de trabajo (DISK_MIN_FREE_GB)
+    budget = DiskBudget.from_env(scratch.root)
 
-    # Actualiza el estado del video en procesamiento
-    current_video = os.path.basename(video_path)
+    store.start(job_id)
+    # Tiempo, CPU, bytes y fps por etapa; se exportan en /metrics
+    stages = StageMetrics(encoder=encoder.name, export=True)
+    # Salidas parciales de los pasos que no llegaron a completarse: se rehacen
+    discard_partial(outputs, resume)
 
     try:
+        # Caché: una copia renombrada o re-subida ya procesada no se recodifica
+        key = None
+        if cache is not None and resume == 0:
+            with scheduler.cpu(job, 0):
+                key = cache_key(video_path, CACHE_PARAMS)
+                hit = cache.get(key, optimized_path)
+            if hit:
+                publish(optimized_path, final_path)
+                os.remove(video_path)
+                scratch.remove()
+                store.finish(job_id, "done", "Procesado correctamente (caché)")
+                return
+
+        # Un único sondeo: si la entrada ya es conforme, pasos 1-3 = remux; da también los frames
+        status = "Procesado correctamente"
+        plan, info = None, None
+        if resume < 3:
+            with stages.stage("probe", inputs=[video_path]):
+                try:
+                    info = probe(video_path)
+                except (OSError, subprocess.CalledProcessError, ValueError):
+                    info = None
+            if COPY_COMPLIANT and info is not None:
+                plan = copy_plan(info, PROFILE)
+            # Solo arranca si cabe lo que va a escribir (copia reparada + reducida + optimizada, o el remux)
+            footprint = estimate_bytes(
+                info, "remux" if plan is not None and plan.copy_video else "three-pass",
+                size=os.path.getsize(video_path), reduce_bitrate="2M", opt_bitrate="1000k",
+            )
+            scheduler.disk(job, 1, budget, scratch.key, footprint)
+        src_frames = info.total_frames if info is not None else 0
+        out_frames = info.duration * 30 if info is not None else 0.0  # la salida va a 30 fps
+        if plan is not None and plan.copy_video:
+            with scheduler.cpu(job, 3), stages.stage("remux", inputs=[video_path], outputs=[optimized_path]):
+                run_child(["ffmpeg", "-err_detect", "ignore_err", "-i", video_path, *plan.args(), optimized_path], check=True)
+            store.checkpoint(job_id, 3, outputs)
+            status = plan.outcome
+            resume = 3
+
         # Paso 1: Reparar archivo
-        current_step = 1
-        repaired_path = video_path.rsplit('.', 1)[0] + "_repaired.mkv"
-        subprocess.run(["ffmpeg", "-i", video_path, "-c", "copy", repaired_path], check=True)
+        if resume < 1:
+            with scheduler.cpu(job, 1), stages.stage("repair", inputs=[video_path], outputs=[repaired_path]):
+                run_child(["ffmpeg", "-i", video_path, "-c", "copy", repaired_path], check=True)
+            store.checkpoint(job_id, 1, outputs)
 
         # Paso 2: Reducir tamaño
-        current_step = 2
-        reduced_path = repaired_path.rsplit('.', 1)[0] + "_reduced.mkv"
-        subprocess.run(
-            [
-                "ffmpeg", "-i", repaired_path, "-c:v", "h264", "-preset", "fast",
-                "-b:v", "2M", "-vf", "scale=1280:720", "-c:a", "aac", reduced_path
-            ],
-            check=True,
-        )
+        if resume < 2:
+            with scheduler.encoder(job, 2), stages.stage("reduce", inputs=[repaired_path], outputs=[reduced_path], frames=src_frames):
+                run_child(
+                    [
+                        "ffmpeg", "-i", repaired_path, *encoder.args(bitrate="2M", vf="scale=1280:720"),
+                        "-c:a", "aac", reduced_path
+                    ],
+                    check=True,
+                )
+            store.checkpoint(job_id, 2, outputs)
 
         # Paso 3: Optimizar para streaming
-        current_step = 3
-        optimized_path = video_path.rsplit('.', 1)[0] + "-optimized.mkv"
-        subprocess.run(
-            [
-                "ffmpeg", "-i", reduced_path, "-c:v", "h264", "-preset", "slow",
-                "-cq", "23", "-b:v", "1000k", "-r", "30", "-vf", "scale=1280:720",
-                "-c:a", "aac", "-movflags", "faststart", optimized_path
-            ],
-            check=True,
-        )
+        if resume < 3:
+            with scheduler.encoder(job, 3), stages.stage("optimize", inputs=[reduced_path], outputs=[optimized_path], frames=out_frames):
+                run_child(
+                    [
+                        "ffmpeg", "-i", reduced_path,
+                        *encoder.args(quality=23, bitrate="1000k", vf="scale=1280:720", preset="slow"),
+                        "-r", "30", "-c:a", "aac", "-movflags", "faststart", optimized_path
+                    ],
+                    check=True,
+                )
+            store.checkpoint(job_id, 3, outputs)
 
         # Paso 4: Validar duración
-        current_step = 4
-        original_duration = get_video_duration(video_path)
-        optimized_duration = get_video_duration(optimized_path)
+        with scheduler.cpu(job, 4):
+            if resume < 4:
+                with stages.stage("validate", inputs=[optimized_path]):
+                    original_duration = get_video_duration(video_path)
+                    optimized_duration = get_video_duration(optimized_path)
+
+                    if abs(original_duration - optimized_duration) > 2:
+                        raise ValueError("La duración del archivo optimizado no coincide con el original")
 
-        if abs(original_duration - optimized_duration) > 2:
-            raise ValueError("La duración del archivo optimizado no coincide con el original")
+                    if cache is not None:
+                        cache.put(key or cache_key(video_path, CACHE_PARAMS), optimized_path)
+                store.checkpoint(job_id, 4)
 
-        # Eliminar archivos intermedios y originales
-        os.remove(video_path)
-        os.remove(repaired_path)
-        os.remove(reduced_path)
+            # Publicar tras validar; si se reanuda y ya se publicó, no queda nada que mover
+            if os.path.exists(optimized_path):
+                publish(optimized_path, final_path)
+
+            # Eliminar el original y el directorio de trabajo (el original puede no existir si se reanuda)
+            with stages.stage("cleanup"):
+                if os.path.exists(video_path):
+                    os.remove(video_path)
+                scratch.remove()
 
         # Si todo fue exitoso, actualiza el historial con éxito
-        history.append({"name": current_video, "status": "Procesado correctamente"})
-    except (subprocess.CalledProcessError, ValueError) as e:
+        disk_retries.clear(video_path)
+        store.finish(job_id, "done", status)
+    except Exception as e:
+        # Disco lleno: no es un fallo del vídeo, se vuelve a intentar cuando haya sitio
+        attempt = disk_retries.next(video_path) if is_disk_full(e, scratch.root) else None
+        # Sus intermedios sobran: ni este trabajo ni su reintento los reutilizan
+        scratch.remove()
+        if attempt is not None:
+            store.retry(job_id, f"Sin espacio en disco: reintento {attempt} de {disk_retries.limit} en {disk_retries.delay:g} s")
+            timer = threading.Timer(disk_retries.delay, submit, (video_path,))
+            timer.daemon = True
+            timer.start()
+            return
         # Si ocurre un error, agrega el error al historial
-        history.append({"name": current_video, "status": f"Error: {str(e)}"})
+        store.finish(job_id, "error", f"Error: {str(e)}")
+        raise
     finally:
-        # Reinicia el video actual
-        current_video = None
-        current_step = 0
+        budget.release(scratch.key)
+        # Sin otros trabajos en curso no queda un .video-optimizer-tmp vacío junto a los vídeos
+        remove_if_empty(scratch.root)
 
 def get_video_duration(video_path):
     """Devuelve la duración del video en segundos."""
-    try:
-        result = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True,
-        )
-        return float(result.stdout.strip())
-    except subprocess.CalledProcessError:
-        return 0.0
+    return probe_duration(video_path)
 
-def process_folder(folder_path):
-    global history
-    history = []  # Reinicia el historial
+def submit(video_path):
+    """Registra el vídeo y lo encola; se omite si ya se procesó con la misma entrada."""
+    job_id, resume = store.enqueue(video_path)
+    if job_id is None:
+        return
+    scheduler.submit(video_path, lambda job: process_video(video_path, job, job_id, resume))
+
+def resume_interrupted():
+    """Al arrancar: reencola los trabajos que quedaron a medias en la ejecución anterior."""
+    rows = store.resumable()
+    # Directorios de trabajo huérfanos (fallos y cortes); los de trabajos a reanudar se conservan
+    keep = {job_key(row["path"], row["id"]) for row in rows}
+    for root in {scratch_root(row["path"], SCRATCH_DIR) for row in rows} | ({os.path.abspath(SCRATCH_DIR)} if SCRATCH_DIR else set()):
+        sweep(root, keep)
+        remove_if_empty(root)
+    for row in rows:
+        # Tras validar (paso 4) el original puede haberse borrado ya: solo queda limpiar
+        if os.path.exists(row["path"]) or row["stage"] >= 4:
+            submit(row["path"])
+        else:
+            store.finish(row["id"], "error", "Error: el archivo original ya no existe")
 
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            if os.path.splitext(file)[1].lower() in valid_extensions:
-                video_path = os.path.join(root, file)
-                process_video(video_path)
+def submit_all(video_paths):
+    for video_path in video_paths:
+        submit(video_path)
+
+# Carpetas vigiladas: los vídeos nuevos se encolan en cuanto dejan de crecer
+watchers = WatchManager.from_env(submit_all)
+
+def process_folder(folder_path):
+    store.clear_history()  # Reinicia el historial visible (las filas se conservan)
+    # Ignora salidas (-optimized) e intermedios del propio pipeline
+    submit_all(scan_videos(folder_path))
 
 @app.route("/")
 def index():
@@ -113,18 +228,59 @@ def process():
     if not os.path.exists(folder_path):
         return jsonify({"error": "La ruta especificada no existe"}), 400
 
+    if data.get("watch"):
+        # Modo vigilancia: el vigilante encola lo existente y lo que vaya llegando
+        if not os.path.isdir(folder_path):
+            return jsonify({"error": "Solo se pueden vigilar carpetas"}), 400
+        store.clear_history()
+        watcher = watchers.watch(folder_path)
+        return jsonify({"message": f"Vigilando carpeta: {folder_path}", "watch": watcher.stats()}), 200
+
     # Procesar carpeta en un hilo separado
     threading.Thread(target=process_folder, args=(folder_path,)).start()
 
     return jsonify({"message": f"Procesando carpeta: {folder_path}"}), 200
 
+@app.route("/watch", methods=["GET"])
+def watch_status():
+    return jsonify({"watchers": watchers.stats()})
+
+@app.route("/watch", methods=["DELETE"])
+def watch_stop():
+    data = request.get_json() or {}
+    if not watchers.unwatch(data.get("folder", "")):
+        return jsonify({"error": "Esa carpeta no se está vigilando"}), 404
+    return jsonify({"message": f"Vigilancia detenida: {data['folder']}"}), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Métricas por etapa en formato Prometheus (requiere prometheus_client)."""
+    try:
+        body, content_type = exposition()
+    except RuntimeError as e:
+        return f"{e}\n", 503
+    return Response(body, content_type=content_type)
+
 @app.route("/status", methods=["GET"])
 def status():
+    estado = scheduler.status()
+    # Compatibilidad con la UI: el primer trabajo activo como "actual"
+    running = [j for j in estado["jobs"] if j["state"] == "running"] or estado["jobs"]
+    current = running[0] if running else None
     return jsonify({
-        "current_video": current_video,
-        "current_step": current_step,
-        "history": history
+        "current_video": current["name"] if current else None,
+        "current_step": current["step"] if current else 0,
+        "history": store.history(),
+        "totals": store.counts(),
+        "cache": cache.stats() if cache is not None else None,
+        "encoder": encoder.name,
+        **estado,
     })
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    debug = True
+    # Con el recargador de debug el módulo corre en dos procesos: solo reanuda el que sirve
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        threading.Thread(target=resume_interrupted, daemon=True).start()
+        watchers.watch_env()
+    app.run(host="0.0.0.0", port=5000, debug=debug)
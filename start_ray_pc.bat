@@ -2,8 +2,9 @@
 echo 🔄 Deteniendo cualquier instancia previa de Ray...
 ray stop
 
-echo 🚀 Iniciando Ray como nodo worker con recurso gpu10bit...
-ray start --num-gpus=1 --address=192.168.0.107:6379 --disable-usage-stats
+rem Recursos para la colocación por codificador (ver start_ray_pc.sh)
+echo 🚀 Iniciando Ray como nodo worker con recursos enc_nvenc/enc_software/scratch_gb...
+ray start --num-gpus=1 --resources="{\"enc_nvenc\": 3, \"enc_software\": 2, \"scratch_gb\": 100}" --address=192.168.0.107:6379 --disable-usage-stats
 
 echo ✅ Ray iniciado correctamente en el PC.
 pause
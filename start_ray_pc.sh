@@ -8,8 +8,15 @@ else
   echo "Aviso: 'ray' no encontrado en PATH. Asegúrate de activar el entorno o instalar Ray."
 fi
 
-echo "🚀 Iniciando Ray como nodo worker con recurso gpu10bit..."
-ray start --num-gpus=1 --address=192.168.0.105:6379 --disable-usage-stats
+# Recursos para la colocación por codificador (enc_<familia>, scratch_gb):
+# se calculan con los codificadores que funcionan en este nodo, salvo que se
+# indiquen en RAY_RESOURCES. ENCODER_SESSIONS y SCRATCH_GB ajustan las plazas
+# (sin SCRATCH_GB se declara el disco libre del volumen de trabajo).
+cd "$(dirname "$0")"
+RESOURCES="${RAY_RESOURCES:-$(python3 -m optimize_video.placement)}"
+
+echo "🚀 Iniciando Ray como nodo worker con recursos ${RESOURCES}..."
+ray start --num-gpus=1 --resources="${RESOURCES}" --address=192.168.0.105:6379 --disable-usage-stats
 
 echo "✅ Ray iniciado correctamente en el PC."
 read -n1 -s -r -p $'Presione cualquier tecla para continuar...\n'
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from optimize_video import abr
+from optimize_video.abr import Rung
+from optimize_video.encoders import BY_NAME
+
+
+def test_parse_ladder_sorts_and_normalizes():
+    rungs = abr.parse_ladder("480:1400K, 1080p:5m,720:2800k,480:1200k")
+    assert rungs == (Rung(1080, "5M"), Rung(720, "2800k"), Rung(480, "1200k"))
+    assert abr.format_ladder(rungs) == "1080:5M,720:2800k,480:1200k"
+    assert abr.parse_ladder(abr.DEFAULT_LADDER)[0].name == "1080p"
+
+
+@pytest.mark.parametrize("value", ["", "720", "721:800k", "720:fast", " , "])
+def test_parse_ladder_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        abr.parse_ladder(value)
+
+
+def test_parse_formats():
+    assert abr.parse_formats("DASH, hls,dash") == ("dash", "hls")
+    with pytest.raises(ValueError):
+        abr.parse_formats("smooth")
+    with pytest.raises(ValueError):
+        abr.parse_formats("")
+
+
+def test_fit_ladder_never_upscales():
+    rungs = abr.parse_ladder("1080:5000k,720:2800k,480:1400k")
+    assert [r.height for r in abr.fit_ladder(rungs, 720)] == [720, 480]
+    assert [r.height for r in abr.fit_ladder(rungs, 0)] == [1080, 720, 480]
+    assert abr.fit_ladder(rungs, 240) == (Rung(480, "1400k"),)
+
+
+def test_encode_command_single_decode(tmp_path):
+    rungs = abr.parse_ladder("720:2800k,360:800k")
+    files = abr.rung_files(str(tmp_path), rungs, has_audio=True)
+    assert [os.path.basename(p) for p in files.paths] == [".720p.mp4", ".360p.mp4", ".audio.mp4"]
+    cmd = abr.encode_command("in.mkv", files, rungs, BY_NAME["libx264"], source_fps=60)
+    assert cmd.count("-i") == 1
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert graph.startswith("[0:v]fps=30,split=2[s0][s1]")
+    assert "[s1]scale=-2:360,format=yuv420p[v1]" in graph
+    # GOP fijo y keyframes forzados en los mismos instantes en cada peldaño
+    assert cmd.count("-force_key_frames") == 2
+    assert cmd[cmd.index("-g") + 1] == "120"
+    assert cmd[-1] == files.audio
+
+
+def test_encode_command_keeps_lower_source_fps(tmp_path):
+    rungs = abr.parse_ladder("360:800k")
+    files = abr.rung_files(str(tmp_path), rungs, has_audio=False)
+    cmd = abr.encode_command("in.mkv", files, rungs, BY_NAME["libx264"], source_fps=25, segment_seconds=2)
+    assert "fps=" not in cmd[cmd.index("-filter_complex") + 1]
+    assert cmd[cmd.index("-g") + 1] == "50"
+    assert "-vn" not in cmd
+
+
+def test_hls_command(tmp_path):
+    rungs = abr.parse_ladder("720:2800k,360:800k")
+    files = abr.rung_files(str(tmp_path / "work"), rungs, has_audio=True)
+    out = str(tmp_path / "hls")
+    cmd = abr.hls_command(files, rungs, out)
+    assert cmd[cmd.index("-var_stream_map") + 1] == (
+        "v:0,agroup:audio,name:720p v:1,agroup:audio,name:360p a:0,agroup:audio,name:audio"
+    )
+    assert cmd[cmd.index("-master_pl_name") + 1] == "master.m3u8"
+    assert cmd[-1] == os.path.join(out, "%v", "index.m3u8")
+    assert sorted(os.listdir(out)) == ["360p", "720p", "audio"]
+
+
+def test_dash_command_without_audio(tmp_path):
+    rungs = abr.parse_ladder("720:2800k,360:800k")
+    files = abr.rung_files(str(tmp_path), rungs, has_audio=False)
+    cmd = abr.dash_command(files, str(tmp_path / "dash"), segment_seconds=6)
+    assert cmd[cmd.index("-adaptation_sets") + 1] == "id=0,streams=v"
+    assert cmd[cmd.index("-seg_duration") + 1] == "6"
+    assert cmd.count("-map") == 2
+
+
+def test_package_runs_each_format(tmp_path):
+    rungs = abr.parse_ladder("360:800k")
+    files = abr.rung_files(str(tmp_path / "work"), rungs, has_audio=True)
+    commands = []
+    result = abr.package(files, rungs, str(tmp_path / "out"), ("hls", "dash"), run=commands.append)
+    assert result == abr.manifests(str(tmp_path / "out"), ("hls", "dash"))
+    assert result["hls"].endswith(os.path.join("hls", "master.m3u8"))
+    assert [c[c.index("-f", 2) + 1] for c in commands] == ["hls", "dash"]
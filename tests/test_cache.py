@@ -0,0 +1,81 @@
+import os
+
+from optimize_video.cache import ResultCache, cache_key, fingerprint
+
+
+def _write(path, data):
+    with open(path, "wb") as fh:
+        fh.write(data)
+    return str(path)
+
+
+def test_fingerprint_and_key(tmp_path):
+    a = _write(tmp_path / "a.mp4", b"video" * 1000)
+    b = _write(tmp_path / "renamed.mp4", b"video" * 1000)
+    c = _write(tmp_path / "c.mp4", b"other" * 1000)
+    assert fingerprint(a) == fingerprint(b) != fingerprint(c)
+    assert cache_key(a, {"cq": 27}) == cache_key(b, {"cq": 27}) != cache_key(a, {"cq": 28})
+
+
+def test_put_get_roundtrip(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10**6)
+    out = _write(tmp_path / "out.mkv", b"encoded")
+    assert not cache.get("k", str(tmp_path / "miss.mkv"))
+    cache.put("k", out)
+    dest = str(tmp_path / "again.mkv")
+    assert cache.get("k", dest)
+    with open(dest, "rb") as fh:
+        assert fh.read() == b"encoded"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_get_does_not_touch_published_outputs(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10**6)
+    out = _write(tmp_path / "out.mkv", b"encoded")
+    cache.put("k", out)
+    os.utime(out, (1_000_000, 1_000_000))
+    assert cache.get("k", str(tmp_path / "again.mkv"))
+    # La salida publicada comparte inodo con la entrada: su fecha no debe cambiar
+    assert os.stat(out).st_mtime == 1_000_000
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=25)
+    for name in ("a", "b"):
+        cache.put(name, _write(tmp_path / f"{name}.mkv", b"x" * 10))
+    os.utime(cache._marker(cache._entry("a", "a.mkv")), (1, 1))
+    os.utime(cache._marker(cache._entry("b", "b.mkv")), (2, 2))
+    assert cache.get("a", str(tmp_path / "a2.mkv"))  # "a" pasa a ser la más reciente
+    cache.put("c", _write(tmp_path / "c.mkv", b"x" * 10))
+    remaining = sorted(os.listdir(cache.root))
+    assert remaining == [".lru-a.mkv", ".lru-c.mkv", "a.mkv", "c.mkv"]
+
+
+def test_evict_tolerates_entries_removed_by_another_process(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=5)
+    cache.put("a", _write(tmp_path / "a.mkv", b"x" * 10))
+    listed = cache._entries()
+    gone = os.path.join(cache.root, "gone.mkv")
+    monkeypatch.setattr(cache, "_entries", lambda: [(gone, 100, 0.0)] + listed)
+    cache.evict()
+    assert not os.path.exists(cache._entry("a", "a.mkv"))
+
+
+def test_stats_keeps_running_totals_without_rescanning(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=25)
+    cache.put("a", _write(tmp_path / "a.mkv", b"x" * 10))
+    assert cache.stats()["bytes"] == 10
+    scans = []
+    real_entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or real_entries())
+    cache.stats()
+    assert scans == []
+    cache.put("a", _write(tmp_path / "a2.mkv", b"x" * 12))  # sustituye la entrada, no la suma
+    cache.put("b", _write(tmp_path / "b.mkv", b"x" * 10))
+    os.utime(cache._marker(cache._entry("a", "a.mkv")), (1, 1))
+    cache.put("c", _write(tmp_path / "c.mkv", b"x" * 10))  # expulsa "a"
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (2, 20)
+    assert len(scans) == 3  # solo las expulsiones recorren el directorio
@@ -0,0 +1,194 @@
+import collections
+import errno
+import json
+import os
+import subprocess
+import threading
+
+import pytest
+
+from optimize_video import diskbudget
+from optimize_video.diskbudget import (
+    DiskBudget, DiskFullError, DiskRetries, bitrate_bps, estimate_bytes, is_disk_full,
+)
+from optimize_video.probe import MediaInfo
+from optimize_video.scratch import JobScratch
+
+GB = 1024**3
+Usage = collections.namedtuple("Usage", "total used free")
+
+
+def _info(bit_rate=4_000_000, duration=100.0):
+    return MediaInfo(path="in.mp4", format_name="mp4", duration=duration, size=bit_rate * int(duration) // 8, bit_rate=bit_rate)
+
+
+@pytest.fixture
+def free(monkeypatch):
+    """Espacio libre simulado del volumen (bytes); se cambia con free["bytes"] = ..."""
+    state = {"bytes": 10 * GB}
+    monkeypatch.setattr(diskbudget.shutil, "disk_usage", lambda path: Usage(100 * GB, 0, state["bytes"]))
+    return state
+
+
+def test_bitrate_bps():
+    assert bitrate_bps("800k") == 800_000
+    assert bitrate_bps("2M") == 2_000_000
+    assert bitrate_bps("1500") == 1500
+    with pytest.raises(ValueError):
+        bitrate_bps("fast")
+
+
+def test_estimate_bytes_per_pipeline():
+    info = _info()
+    source = 4_000_000 * 100 / 8
+    final = (800_000 + diskbudget.AUDIO_BPS) * 100 / 8
+    reduced = (2_000_000 + diskbudget.AUDIO_BPS) * 100 / 8
+    m = diskbudget.MARGIN
+    assert estimate_bytes(info, "three-pass") == int((source + reduced + final) * m)
+    assert estimate_bytes(info, "single-pass") == estimate_bytes(info, "streamed") == int(final * m)
+    assert estimate_bytes(info, "single-pass", outputs=2) == int(2 * final * m)
+    assert estimate_bytes(info, "remux", outputs=2) == int(2 * source * m)
+    assert estimate_bytes(info, "chunked") == int((source + 2 * final) * m)
+    assert estimate_bytes(info, "abr", ladder=["800k"]) == int(2 * final * m)
+
+
+def test_estimate_bytes_without_probe_uses_source_size():
+    assert estimate_bytes(None, "single-pass", size=1000) == int(1000 * diskbudget.MARGIN)
+    assert estimate_bytes(None, "three-pass", size=1000) == int(3000 * diskbudget.MARGIN)
+
+
+def _job(root, key):
+    return JobScratch(root, key).open()
+
+
+def _budget(tmp_path, root, **kwargs):
+    return DiskBudget(root, ledger_dir=str(tmp_path / "ledgers"), **kwargs)
+
+
+def test_acquire_and_release(tmp_path, free):
+    root = str(tmp_path / "scratch")
+    budget = _budget(tmp_path, root, min_free=GB)
+    job = _job(root, "a")
+    budget.acquire("a", 2 * GB)
+    with open(budget.ledger) as fh:
+        assert json.load(fh) == {job.dir: 2 * GB}
+    budget.release("a")
+    with open(budget.ledger) as fh:
+        assert json.load(fh) == {}
+    job.remove()
+    assert os.listdir(root) == []  # el registro no vive en la raíz de trabajo
+
+
+def test_roots_on_the_same_volume_share_the_ledger(tmp_path, free):
+    # Dos carpetas de vídeos, cada una con su .video-optimizer-tmp, en el mismo disco
+    first = str(tmp_path / "a" / ".video-optimizer-tmp")
+    second = str(tmp_path / "b" / ".video-optimizer-tmp")
+    _job(first, "big")
+    _job(second, "big")
+    _budget(tmp_path, first, min_free=GB).acquire("big", 6 * GB)
+    other = _budget(tmp_path, second, min_free=GB, poll=0.01)
+    assert other.ledger == _budget(tmp_path, first).ledger
+    waited = []
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (other.acquire("big", 6 * GB, on_wait=waited.append), done.set()))
+    thread.start()
+    assert not done.wait(0.2)
+    assert waited
+    _budget(tmp_path, first).release("big")
+    assert done.wait(2)
+    thread.join()
+
+
+def test_acquire_fails_fast_when_job_can_never_fit(tmp_path, free):
+    root = str(tmp_path / "scratch")
+    budget = _budget(tmp_path, root, min_free=GB, poll=0.01)
+    _job(root, "a")
+    with pytest.raises(DiskFullError) as exc:
+        budget.acquire("a", 20 * GB)
+    assert exc.value.errno == errno.ENOSPC
+    assert is_disk_full(exc.value)
+
+
+def test_acquire_waits_for_other_reservations(tmp_path, free):
+    root = str(tmp_path / "scratch")
+    budget = _budget(tmp_path, root, min_free=GB, poll=0.01)
+    _job(root, "a")
+    other = _job(root, "b")
+    budget.acquire("b", 6 * GB)
+
+    waited = []
+    done = threading.Event()
+
+    def second():
+        budget.acquire("a", 6 * GB, on_wait=waited.append)
+        done.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not done.wait(0.2)
+    # Cabe cuando "b" termine: se espera (con el libre menos el mínimo) en lugar de fallar
+    assert waited == [9 * GB]
+    budget.release("b")
+    other.remove()
+    assert done.wait(2)
+    thread.join()
+
+
+def test_written_bytes_reduce_pending(tmp_path, free):
+    root = str(tmp_path / "scratch")
+    budget = _budget(tmp_path, root, min_free=0, poll=0.01)
+    other = _job(root, "b")
+    budget.acquire("b", 8 * GB)
+    with open(other.path("out.mkv"), "wb") as fh:
+        fh.truncate(1000)
+    pending, written = budget._usage({other.dir: 8 * GB}, exclude=os.path.join(root, "a"))
+    assert written == 1000 + os.path.getsize(other.path(".lock"))
+    assert pending == 8 * GB - written
+
+
+def test_reservations_of_dead_jobs_are_pruned(tmp_path, free):
+    root = str(tmp_path / "scratch")
+    budget = _budget(tmp_path, root, min_free=GB, poll=0.01)
+    dead = _job(root, "dead")
+    budget.acquire("dead", 8 * GB)
+    dead.close()  # el proceso murió: ya nadie tiene su directorio bloqueado
+    _job(root, "a")
+    budget.acquire("a", 8 * GB)
+
+
+def test_release_without_root_is_noop(tmp_path):
+    _budget(tmp_path, str(tmp_path / "missing")).release("a")
+
+
+def test_disk_retries():
+    retries = DiskRetries(limit=2, delay=0)
+    assert retries.next("a") == 1
+    assert retries.next("a") == 2
+    assert retries.next("a") is None
+    assert retries.next("a") == 1  # agotados: la cuenta se olvida
+    retries.clear("a")
+    assert retries.next("a") == 1
+
+
+def test_is_disk_full(tmp_path, free):
+    assert is_disk_full(OSError(errno.ENOSPC, "full"))
+    assert is_disk_full(OSError(errno.EDQUOT, "quota"))
+    assert not is_disk_full(OSError(errno.ENOENT, "missing"))
+    assert not is_disk_full(ValueError("La duración no coincide"))
+
+    err = subprocess.CalledProcessError(1, ["ffmpeg"], stderr=b"av_interleaved_write_frame(): No space left on device")
+    assert is_disk_full(err)
+    try:
+        try:
+            raise OSError(errno.ENOSPC, "full")
+        except OSError as cause:
+            raise RuntimeError("wrapped") from cause
+    except RuntimeError as wrapped:
+        assert is_disk_full(wrapped)
+
+    # ffmpeg sin stderr capturado: se decide por el espacio libre del volumen
+    bare = subprocess.CalledProcessError(1, ["ffmpeg"])
+    assert not is_disk_full(bare, str(tmp_path))
+    free["bytes"] = 1024
+    assert is_disk_full(bare, str(tmp_path))
+    assert not is_disk_full(bare)
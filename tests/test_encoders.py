@@ -0,0 +1,55 @@
+import pytest
+
+from optimize_video.encoders import BY_NAME, RANKING, deferred_args, resolve
+
+
+def _opt(args, name):
+    return args[args.index(name) + 1] if name in args else None
+
+
+@pytest.mark.parametrize("encoder", [e for e in RANKING if e.family != "nvmpi"], ids=lambda e: e.name)
+def test_quality_with_bitrate_is_capped_quality(encoder):
+    args = encoder.args(quality=27, bitrate="800k")
+    assert any(q in args for q in ("-cq", "-crf", "-global_quality"))
+    expected = "1600k" if encoder.family == "qsv" else "800k"
+    assert _opt(args, "-maxrate") == expected
+    assert _opt(args, "-bufsize") is not None
+
+
+def test_nvmpi_only_has_bitrate_control():
+    args = BY_NAME["h264_nvmpi"].args(quality=27, bitrate="800k")
+    assert _opt(args, "-b:v") == "800k"
+    assert "-maxrate" not in args
+
+
+def test_vaapi_modes():
+    vaapi = BY_NAME["h264_vaapi"]
+    assert _opt(vaapi.args(quality=27), "-rc_mode") == "CQP"
+    assert _opt(vaapi.args(quality=27, bitrate="2M"), "-rc_mode") == "QVBR"
+    assert _opt(vaapi.args(bitrate="2M"), "-b:v") == "2M"
+    assert _opt(vaapi.args(vf="scale=1280:720"), "-vf") == "scale=1280:720,format=nv12,hwupload"
+
+
+def test_nvenc_pure_cq_and_gpu():
+    args = BY_NAME["h264_nvenc"].args(quality=23, gpu="1")
+    assert _opt(args, "-b:v") == "0"
+    assert _opt(args, "-gpu") == "1"
+    assert "-maxrate" not in args
+
+
+def test_bitrate_only_is_plain_target():
+    for encoder in RANKING:
+        args = encoder.args(bitrate="2M")
+        assert _opt(args, "-b:v") == "2M"
+        assert "-maxrate" not in args
+
+
+def test_svtav1_crf_scale():
+    assert _opt(BY_NAME["libsvtav1"].args(quality=51), "-crf") == "63"
+
+
+def test_resolve_expands_deferred_args(monkeypatch):
+    monkeypatch.setenv("VIDEO_ENCODER", "libx264")
+    cmd = ["ffmpeg", "-i", "in.mkv", *deferred_args(quality=23, bitrate="1M"), "out.mkv"]
+    assert resolve(cmd) == ["ffmpeg", "-i", "in.mkv", *BY_NAME["libx264"].args(quality=23, bitrate="1M"), "out.mkv"]
+    assert resolve(["ffmpeg", "-version"]) == ["ffmpeg", "-version"]
@@ -0,0 +1,75 @@
+import json
+import socket
+
+import pytest
+
+from optimize_video.events import EventBroker, SSEServer, status_delta
+
+
+def test_status_delta_appends_or_resets_history():
+    prev = {"status": "a", "history": [1, 2]}
+    assert status_delta(prev, {"status": "b", "history": [1, 2, 3]}) == ({"status": "b"}, {"reset": False, "items": [3]})
+    assert status_delta(prev, {"status": "a", "history": [3]}) == ({}, {"reset": True, "items": [3]})
+    assert status_delta(prev, dict(prev)) == ({}, None)
+
+
+def test_attach_resumes_from_last_event_id_or_sends_snapshot():
+    broker = EventBroker(backlog=2)
+    broker.publish([("status", {"n": 1}), ("status", {"n": 2})])
+    assert broker.attach(lambda: "{}", "1") == (2, None, [(2, "status", '{"n": 2}')])
+    broker.publish([("status", {"n": 3})])
+    assert broker.attach(lambda: "{}", "0") == (3, "{}", [])  # el 1 ya salió del búfer
+    assert broker.attach(lambda: "{}", "9") == (3, "{}", [])
+
+
+def _read_until(sock, marker):
+    data = b""
+    while marker not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode()
+
+
+@pytest.fixture
+def server():
+    broker = EventBroker()
+    srv = SSEServer(broker, lambda: json.dumps({"n": 0}), host="127.0.0.1", port=0, heartbeat=0.1).start()
+    yield broker, srv
+    srv.stop()
+
+
+def _subscribe(srv, last_event_id=None):
+    sock = socket.create_connection(("127.0.0.1", srv.port), timeout=5)
+    extra = f"Last-Event-ID: {last_event_id}\r\n" if last_event_id else ""
+    sock.sendall(f"GET /events HTTP/1.1\r\nHost: x\r\n{extra}\r\n".encode())
+    return sock
+
+
+def test_server_fans_out_to_every_client(server):
+    broker, srv = server
+    clients = [_subscribe(srv) for _ in range(5)]
+    for sock in clients:
+        assert "event: snapshot" in _read_until(sock, b"event: snapshot")
+    broker.publish([("status", {"n": 1})])
+    for sock in clients:
+        assert 'data: {"n": 1}' in _read_until(sock, b'{"n": 1}')
+        sock.close()
+
+
+def test_server_resumes_with_last_event_id(server):
+    broker, srv = server
+    broker.publish([("status", {"n": 1}), ("status", {"n": 2})])
+    sock = _subscribe(srv, "1")
+    data = _read_until(sock, b'{"n": 2}')
+    sock.close()
+    assert "snapshot" not in data and '{"n": 1}' not in data
+
+
+def test_server_rejects_other_paths(server):
+    _, srv = server
+    sock = socket.create_connection(("127.0.0.1", srv.port), timeout=5)
+    sock.sendall(b"GET /status HTTP/1.1\r\n\r\n")
+    assert _read_until(sock, b"\r\n\r\n").startswith("HTTP/1.1 404")
+    sock.close()
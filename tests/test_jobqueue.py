@@ -0,0 +1,88 @@
+import pytest
+
+from optimize_video.jobqueue import JobQueue, QueueFull
+
+
+def _paths(queue):
+    out = []
+    while True:
+        job = queue.pop()
+        if job is None:
+            return out
+        out.append(job.path)
+
+
+def test_priority_then_fifo():
+    queue = JobQueue()
+    queue.push("f1", "folder")
+    queue.push("f2", "folder")
+    queue.push("u1", "upload")
+    queue.push("p1", "file")
+    queue.push("u2", "upload")
+    assert _paths(queue) == ["u1", "u2", "p1", "f1", "f2"]
+    assert len(queue) == 0
+
+
+def test_duplicates_and_backpressure():
+    queue = JobQueue(maxsize=2)
+    assert queue.push("a") is not None
+    assert queue.push("a") is None
+    queue.push("b")
+    with pytest.raises(QueueFull):
+        queue.push("c")
+    with pytest.raises(ValueError):
+        queue.push("d", "urgent")
+    job = queue.pop()
+    queue.finish(job, "done")
+    assert queue.push("a") is not None  # terminado: se puede volver a encolar
+
+
+def test_cancel_and_reprioritize_are_lazy():
+    queue = JobQueue()
+    a = queue.push("a")
+    b = queue.push("b")
+    c = queue.push("c")
+    assert queue.cancel(a.id)
+    assert not queue.cancel(a.id)
+    assert queue.reprioritize(c.id, "upload")
+    assert len(queue) == 2
+    assert _paths(queue) == ["c", "b"]
+    assert not queue.reprioritize(b.id, "upload")  # ya en curso
+    assert queue.get(a.id).state == "cancelled"
+
+
+def test_store_ids_and_finished_retention():
+    queue = JobQueue(keep_finished=1)
+    first = queue.push("a", job_id=41)
+    assert first.id == 41
+    queue.push("b", job_id=42)
+    for job in (queue.pop(), queue.pop()):
+        queue.finish(job, "error", "boom")
+    assert queue.get(41) is None
+    assert queue.get(42).error == "boom"
+
+
+def test_jobs_listing_and_metrics():
+    queue = JobQueue()
+    queue.push("a", "folder")
+    queue.push("b", "upload")
+    queue.push("c", "folder")
+    running = queue.pop()
+    assert running.path == "b"
+    assert [j["path"] for j in queue.jobs()] == ["b", "a", "c"]
+    assert [j["path"] for j in queue.jobs(("queued",))] == ["a", "c"]
+    metrics = queue.metrics()
+    assert metrics["depth"] == 2
+    assert metrics["depth_by_priority"] == {"upload": 0, "file": 0, "folder": 2}
+    assert metrics["running"] == 1
+    assert metrics["counters"] == {"enqueued": 3, "started": 1}
+
+
+def test_contains_tracks_active_paths():
+    queue = JobQueue()
+    queue.push("a")
+    assert "a" in queue
+    job = queue.pop()
+    assert "a" in queue  # en curso
+    queue.finish(job, "done")
+    assert "a" not in queue
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from optimize_video.jobstore import RETRY, JobStore, discard_partial
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "in.mp4"
+    path.write_bytes(b"video")
+    return str(path)
+
+
+def test_wal_mode(tmp_path):
+    store = JobStore(str(tmp_path / "db" / "jobs.db"))
+    assert store._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_enqueue_skips_finished_and_live_jobs(tmp_path, video):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id, stage = store.enqueue(video)
+    assert (job_id, stage) == (1, 0)
+    assert store.enqueue(video) == (None, 0)  # ya en cola en este proceso
+    store.start(job_id)
+    store.finish(job_id, "done", "ok")
+    assert store.enqueue(video) == (None, 0)  # terminado y sin cambios
+
+    with open(video, "ab") as fh:
+        fh.write(b"changed")
+    os.utime(video, ns=(1, 1))
+    assert store.enqueue(video)[0] == 2  # la entrada cambió: trabajo nuevo
+
+
+def test_interrupted_job_resumes_from_last_stage(tmp_path, video):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    job_id, _ = store.enqueue(video, options={"abr": "720:2800k"})
+    store.start(job_id)
+    store.checkpoint(job_id, 1, {1: "a.mkv"})
+    store.checkpoint(job_id, 2, {2: ["b.mp4", "b.mkv"]})
+    store.checkpoint(job_id, 1)  # el paso nunca retrocede
+
+    # Otro proceso (reinicio del servidor) sobre el mismo fichero
+    restarted = JobStore(path)
+    rows = restarted.resumable()
+    assert [r["id"] for r in rows] == [job_id]
+    assert rows[0]["outputs"] == {1: "a.mkv", 2: ["b.mp4", "b.mkv"]}
+    assert restarted.enqueue(video) == (job_id, 2)
+    assert restarted.get(job_id)["options"] == {"abr": "720:2800k"}
+    assert restarted.get(job_id)["state"] == "queued"
+
+
+def test_retry_restarts_from_scratch(tmp_path, video):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id, _ = store.enqueue(video)
+    store.checkpoint(job_id, 2, {1: "a.mkv"})
+    store.retry(job_id, "Sin espacio en disco")
+    row = store.get(job_id)
+    assert (row["state"], row["stage"], row["outputs"]) == (RETRY, 0, {})
+    assert [r["id"] for r in store.resumable()] == [job_id]
+    assert store.active() == []
+    assert store.enqueue(video) == (job_id, 0)
+    assert store.get(job_id)["finished"] is None
+
+
+def test_history_and_counts(tmp_path, video):
+    store = JobStore(":memory:")
+    job_id, _ = store.enqueue(video)
+    store.finish(job_id, "error", "Error: roto")
+    assert store.history() == [{"name": "in.mp4", "status": "Error: roto"}]
+    assert store.counts() == {"error": 1}
+    store.clear_history()
+    assert store.history() == []
+    assert store.latest(video)["id"] == job_id
+
+
+def test_discard_partial(tmp_path):
+    paths = {}
+    for stage in (1, 2, 3):
+        paths[stage] = str(tmp_path / f"{stage}.mkv")
+        open(paths[stage], "w").close()
+    extra = [str(tmp_path / "4.mp4"), str(tmp_path / "4.ts")]
+    for p in extra:
+        open(p, "w").close()
+    discard_partial({**paths, 4: extra, 5: None}, completed=2)
+    assert sorted(os.listdir(tmp_path)) == ["1.mkv", "2.mkv"]
@@ -0,0 +1,35 @@
+import pytest
+
+from optimize_video.packaging import delivery_paths, output_args, parse_formats, remux_args
+
+
+def test_parse_formats():
+    assert parse_formats(" MKV,.mp4, mkv ") == ("mkv", "mp4")
+    assert parse_formats("") == ()
+    with pytest.raises(ValueError):
+        parse_formats("avi")
+
+
+def test_single_output_is_written_directly():
+    assert output_args({"mp4": "out.mp4"}) == ["-movflags", "+faststart", "-f", "mp4", "out.mp4"]
+    assert output_args({"mkv": "out.mkv"}) == ["-f", "matroska", "out.mkv"]
+    with pytest.raises(ValueError):
+        output_args({})
+
+
+def test_multiple_outputs_use_tee():
+    args = output_args({"mkv": "a.mkv", "mp4": "a|b's.mp4"}, encoding=True)
+    assert args[:4] == ["-map", "0:v:0", "-map", "0:a:0?"]
+    assert "+global_header" in args
+    assert args[-2:] == ["tee", "[f=matroska]a.mkv|[f=mp4:movflags=+faststart]a\\|b\\'s.mp4"]
+    assert "-map" not in output_args({"mkv": "a.mkv", "ts": "a.ts"}, maps=False)
+
+
+def test_remux_args_copy_streams():
+    args = remux_args({"mkv": "a.mkv", "ts": "a.ts"})
+    assert args[:6] == ["-map", "0:v:0", "-map", "0:a:0?", "-c", "copy"]
+    assert args.count("-map") == 2
+
+
+def test_delivery_paths():
+    assert delivery_paths("/v/in", ["mp4", "ts"]) == {"mp4": "/v/in-final.mp4", "ts": "/v/in-final.ts"}
@@ -0,0 +1,43 @@
+from optimize_video.placement import FastestEncoderFirst, JobRequest, LeastLoaded, NodeView
+
+
+def _node(node_id, total, available=None):
+    return NodeView(node_id, node_id, dict(total), dict(available if available is not None else total))
+
+
+def test_candidates_filter_by_scratch_and_family():
+    nodes = [
+        _node("gpu", {"enc_nvenc": 3, "enc_software": 2, "scratch_gb": 50}),
+        _node("small", {"enc_software": 2, "scratch_gb": 5}),
+    ]
+    request = JobRequest(scratch_gb=10)
+    assert [(n.node_id, f) for n, f in LeastLoaded.candidates(nodes, request)] == [("gpu", "nvenc"), ("gpu", "software")]
+    only_cpu = JobRequest(families=["software"])
+    assert [(n.node_id, f) for n, f in LeastLoaded.candidates(nodes, only_cpu)] == [("gpu", "software"), ("small", "software")]
+    no_encoder = JobRequest(encoder=False)
+    assert [f for _n, f in LeastLoaded.candidates(nodes, no_encoder)] == [None, None]
+
+
+def test_least_loaded_prefers_idle_node():
+    busy = _node("busy", {"enc_nvenc": 2}, {"enc_nvenc": 0})
+    idle = _node("idle", {"enc_software": 2})
+    node, family = LeastLoaded().choose([busy, idle], JobRequest())
+    assert (node.node_id, family) == ("idle", "software")
+
+
+def test_fastest_encoder_first_needs_free_sessions():
+    gpu = _node("gpu", {"enc_nvenc": 3}, {"enc_nvenc": 1})
+    cpu = _node("cpu", {"enc_software": 4})
+    policy = FastestEncoderFirst()
+    assert policy.choose([gpu, cpu], JobRequest())[0].node_id == "gpu"
+    # Dos codificaciones a la vez (tuberías) ya no caben en la única plaza NVENC libre
+    assert policy.choose([gpu, cpu], JobRequest(sessions=2))[0].node_id == "cpu"
+    # Más sesiones que plazas en cualquier nodo: basta con tener el nodo entero libre
+    assert policy.choose([cpu], JobRequest(sessions=8))[1] == "software"
+
+
+def test_pending_reservations_count_as_used():
+    node = _node("gpu", {"enc_nvenc": 3})
+    node.pending = {"enc_nvenc": 2}
+    assert node.free("nvenc") == 1
+    assert node.load("nvenc") == 2 / 3
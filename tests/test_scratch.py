@@ -0,0 +1,127 @@
+import errno
+import os
+
+import pytest
+
+from optimize_video import scratch
+from optimize_video.scratch import (
+    SCRATCH_DIRNAME, JobScratch, in_use, job_key, publish, remove_if_empty, scratch_root, sweep,
+)
+
+
+def _write(path, data=b"x"):
+    with open(path, "wb") as fh:
+        fh.write(data)
+
+
+def test_scratch_root_and_job_key(tmp_path):
+    video = str(tmp_path / "in.mp4")
+    assert scratch_root(video) == str(tmp_path / SCRATCH_DIRNAME)
+    assert scratch_root(video, "rel") == os.path.abspath("rel")
+    assert job_key(video, 7) == "job-7"
+    assert job_key(video) == job_key(video)
+    assert job_key(video).startswith("in-")
+    assert job_key(video) != job_key(str(tmp_path / "other" / "in.mp4"))
+
+
+def test_job_scratch_is_exclusive(tmp_path):
+    root = str(tmp_path / "scratch")
+    job = JobScratch(root, "a").open()
+    assert in_use(job.dir)
+    with pytest.raises(RuntimeError):
+        JobScratch(root, "a").open()
+    job.close()
+    assert not in_use(job.dir)
+    with JobScratch(root, "a") as again:
+        assert in_use(again.dir)
+    again.remove()
+    assert not os.path.exists(again.dir)
+
+
+def test_sweep_keeps_locked_and_resumable_dirs(tmp_path):
+    root = str(tmp_path / "scratch")
+    live = JobScratch(root, "live").open()
+    JobScratch(root, "resume").open().close()
+    JobScratch(root, "orphan").open().close()
+    os.makedirs(os.path.join(root, "no-lock"))
+    assert sweep(root, keep={"resume"}) == 2
+    assert sorted(os.listdir(root)) == ["live", "resume"]
+    live.remove()
+    assert sweep(str(tmp_path / "missing")) == 0
+
+
+def test_remove_if_empty(tmp_path):
+    root = str(tmp_path / "scratch")
+    job = JobScratch(root, "a").open()
+    remove_if_empty(root)
+    assert os.path.isdir(root)
+    job.remove()
+    remove_if_empty(root)
+    assert not os.path.exists(root)
+    remove_if_empty(root)  # ya no existe: no falla
+
+
+def test_publish_file_replaces_destination(tmp_path):
+    src = str(tmp_path / "work" / "out.mkv")
+    dest = str(tmp_path / "final" / "out-optimized.mkv")
+    os.makedirs(os.path.dirname(src))
+    _write(src, b"new")
+    os.makedirs(os.path.dirname(dest))
+    _write(dest, b"old")
+    publish(src, dest)
+    with open(dest, "rb") as fh:
+        assert fh.read() == b"new"
+    assert not os.path.exists(src)
+
+
+def test_publish_directory_replaces_destination(tmp_path):
+    src = tmp_path / "work" / "abr"
+    (src / "hls").mkdir(parents=True)
+    _write(str(src / "hls" / "master.m3u8"), b"new")
+    dest = tmp_path / "video-abr"
+    (dest / "dash").mkdir(parents=True)
+    _write(str(dest / "dash" / "manifest.mpd"), b"old")
+    publish(str(src), str(dest))
+    assert sorted(os.listdir(dest)) == ["hls"]
+    assert sorted(os.listdir(tmp_path)) == ["video-abr", "work"]
+
+
+def _cross_device(monkeypatch):
+    """Simula un directorio de trabajo en otro volumen: el primer rename falla con EXDEV."""
+    calls = {"n": 0}
+    real_replace = scratch._replace
+
+    def replace(src, dest):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        real_replace(src, dest)
+
+    monkeypatch.setattr(scratch, "_replace", replace)
+
+
+def test_publish_across_volumes_copies_then_renames(tmp_path, monkeypatch):
+    _cross_device(monkeypatch)
+    src = str(tmp_path / "src.mkv")
+    dest = str(tmp_path / "out" / "dest.mkv")
+    _write(src, b"data")
+    publish(src, dest)
+    with open(dest, "rb") as fh:
+        assert fh.read() == b"data"
+    assert not os.path.exists(src)
+    assert os.listdir(tmp_path / "out") == ["dest.mkv"]  # sin temporales a la vista
+
+
+def test_publish_directory_across_volumes(tmp_path, monkeypatch):
+    _cross_device(monkeypatch)
+    src = tmp_path / "abr"
+    (src / "dash").mkdir(parents=True)
+    _write(str(src / "dash" / "manifest.mpd"))
+    publish(str(src), str(tmp_path / "out" / "video-abr"))
+    assert os.path.exists(tmp_path / "out" / "video-abr" / "dash" / "manifest.mpd")
+    assert not src.exists()
+
+
+def test_publish_propagates_other_errors(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        publish(str(tmp_path / "missing.mkv"), str(tmp_path / "dest.mkv"))
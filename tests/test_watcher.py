@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from optimize_video.watcher import FolderWatcher, is_candidate, is_work_dir, scan_videos
+
+
+@pytest.mark.parametrize("name", [
+    "video.mp4",
+    "clip.MKV",
+    "semi-finals.mkv",
+    "my-optimized-guide.mp4",
+    "x_reduced_cost.mp4",
+    "the_repaired_car.mov",
+])
+def test_is_candidate_accepts_sources(name):
+    assert is_candidate(name)
+
+
+@pytest.mark.parametrize("name", [
+    "video-optimized.mkv",
+    "video-final.mp4",
+    "video-final.webm",
+    "video_repaired.mkv",
+    "video_reduced.mkv",
+    ".hidden.mp4",
+    "notes.txt",
+    "video",
+])
+def test_is_candidate_skips_outputs_and_non_videos(name):
+    assert not is_candidate(name)
+
+
+def test_is_work_dir():
+    assert is_work_dir("/data/.video-optimizer-tmp")
+    assert is_work_dir("/data/.segments-abc/")
+    assert not is_work_dir("/data/videos")
+
+
+def _write(path, data=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(data)
+
+
+def test_scan_videos_skips_outputs_and_work_dirs(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, "a.mp4"))
+    _write(os.path.join(root, "a-optimized.mkv"))
+    _write(os.path.join(root, "sub", "semi-finals.mkv"))
+    _write(os.path.join(root, ".video-optimizer-tmp", "job", "b.mp4"))
+    _write(os.path.join(root, ".segments-x", "c.mp4"))
+    found = sorted(os.path.relpath(p, root) for p in scan_videos(root))
+    assert found == ["a.mp4", os.path.join("sub", "semi-finals.mkv")]
+    assert scan_videos(os.path.join(root, "a.mp4")) == [os.path.join(root, "a.mp4")]
+    assert scan_videos(os.path.join(root, "a-optimized.mkv")) == []
+
+
+def test_folder_watcher_delivers_settled_files_once(tmp_path):
+    delivered = []
+    _write(str(tmp_path / "old.mp4"))
+    watcher = FolderWatcher(str(tmp_path), delivered.extend, settle=0.0, use_inotify=False)
+    assert watcher.mode == "scan"
+    assert watcher.poll() == [str(tmp_path / "old.mp4")]
+
+    _write(str(tmp_path / "sub" / "new.mkv"))
+    _write(str(tmp_path / "new-optimized.mkv"))
+    assert watcher.poll() == [str(tmp_path / "sub" / "new.mkv")]
+    assert watcher.poll() == []
+    assert delivered == [str(tmp_path / "old.mp4"), str(tmp_path / "sub" / "new.mkv")]
+
+
+def test_folder_watcher_waits_until_file_stops_growing(tmp_path):
+    watcher = FolderWatcher(str(tmp_path), lambda paths: None, settle=3600.0, use_inotify=False)
+    _write(str(tmp_path / "upload.mp4"))
+    assert watcher.poll() == []
+    assert str(tmp_path / "upload.mp4") in watcher.pending
+
+    # Un cambio de tamaño reinicia la espera; con settle=0 se entrega en la siguiente pasada
+    _write(str(tmp_path / "upload.mp4"), b"more data")
+    watcher.settle = 0.0
+    assert watcher.poll() == []
+    assert watcher.poll() == [str(tmp_path / "upload.mp4")]
+
+
+def test_folder_watcher_redelivers_replaced_file(tmp_path):
+    path = str(tmp_path / "a.mp4")
+    _write(path)
+    watcher = FolderWatcher(str(tmp_path), lambda paths: None, settle=0.0, use_inotify=False)
+    assert watcher.poll() == [path]
+    os.remove(path)
+    _write(path, b"replacement")
+    os.utime(str(tmp_path), ns=(1, 1))  # fuerza el relistado del directorio
+    assert watcher.poll() == [path]